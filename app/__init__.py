@@ -18,6 +18,12 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
 )
 # app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///demo.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Bounded pool used to fetch quotes while consolidating (1 = sequential).
+app.config['WALLET_QUOTE_WORKERS'] = int(os.environ.get('WALLET_QUOTE_WORKERS', '8'))
+# Run upload imports on a background worker thread (0 = inside the request).
+app.config['WALLET_IMPORT_ASYNC'] = os.environ.get('WALLET_IMPORT_ASYNC', '1') != '0'
+# Processes parsing a multi-file upload (0 = parse on the import worker thread).
+app.config['WALLET_IMPORT_PROCESSES'] = int(os.environ.get('WALLET_IMPORT_PROCESSES', os.cpu_count() or 1))
 db = SQLAlchemy(app)
 
 UPLOADS_FOLDER = 'uploads'
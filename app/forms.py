@@ -66,6 +66,10 @@ class ApiConfigForm(FlaskForm):
         'TTL Gemini (s)', validators=[Optional(), NumberRange(min=0)])
     cache_asset_ttl = IntegerField(
         'TTL processamento por ativo (s)', validators=[Optional(), NumberRange(min=0)])
+    cache_asset_detail_ttl = IntegerField(
+        'TTL detalhes por ativo (s)', validators=[Optional(), NumberRange(min=0)])
     cache_consolidate_ttl = IntegerField(
         'TTL consolidado global (s)', validators=[Optional(), NumberRange(min=0)])
+    cache_history_ttl = IntegerField(
+        'TTL histórico por ativo (s)', validators=[Optional(), NumberRange(min=0)])
     submit = SubmitField('Salvar Configuracoes')
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""Background execution of uploaded-file imports.
+
+`enqueue_import` stores an `ImportJob` and hands its id to a single worker
+thread, so the upload request returns at once and imports never write to
+the database concurrently. The worker runs `import_file` inside its own app
+context and copies the progress counters onto the job after each chunk.
+`enqueue_batch_import` does the same for several files at once through
+`import_files`, one job per file.
+
+`enqueue_portfolio_refresh` queues `update_portfolio_snapshots` on the same
+worker, behind any pending import, so the portfolio history page never
+values positions inside the request.
+
+With `WALLET_IMPORT_ASYNC` off the job runs inline, inside the enqueuing
+call.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock
+
+from app import app, db
+from app.importing import import_file, import_files
+from app.models import ImportJob
+from app.models.imports import DONE, FAILED, QUEUED, RUNNING
+from app.processing import portfolio_snapshots_current, update_portfolio_snapshots
+
+_executor = None
+_executor_lock = Lock()
+# Set while a portfolio refresh waits on the worker, so views queue one at most.
+_portfolio_refresh_queued = False
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='import')
+        return _executor
+
+
+def run_import_job(job_id):
+    """Run the import of job `job_id` and record its outcome."""
+    job = db.session.get(ImportJob, job_id)
+    if job is None or job.status != QUEUED:
+        return job
+    job.status = RUNNING
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    def progress(rows, added, duplicates):
+        job.rows, job.added, job.duplicates = rows, added, duplicates
+        db.session.commit()
+
+    try:
+        result = import_file(job.filepath, job.filetype, progress=progress)
+    except Exception as exc:
+        app.logger.exception('Import job %s failed', job_id)
+        db.session.rollback()
+        result = dict(error=str(exc))
+    _finish_job(job, result)
+    db.session.commit()
+    return job
+
+
+def _finish_job(job, result):
+    for field in ('rows', 'added', 'duplicates'):
+        if field in result:
+            setattr(job, field, result[field])
+    job.error = result.get('error')
+    job.status = FAILED if job.error else DONE
+    job.finished_at = datetime.utcnow()
+
+
+def run_import_batch(job_ids):
+    """Run the jobs `job_ids` as one `import_files` batch."""
+    jobs = [db.session.get(ImportJob, job_id) for job_id in job_ids]
+    jobs = [job for job in jobs if job is not None and job.status == QUEUED]
+    if not jobs:
+        return jobs
+    for job in jobs:
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    def progress(position, rows, added, duplicates):
+        job = jobs[position]
+        job.rows, job.added, job.duplicates = rows, added, duplicates
+        db.session.commit()
+
+    try:
+        results = import_files([(job.filepath, job.filetype) for job in jobs],
+                               processes=app.config.get('WALLET_IMPORT_PROCESSES'),
+                               progress=progress)
+    except Exception as exc:
+        app.logger.exception('Import batch %s failed', job_ids)
+        db.session.rollback()
+        results = [dict(error=str(exc))] * len(jobs)
+    for job, result in zip(jobs, results):
+        _finish_job(job, result)
+    db.session.commit()
+    return jobs
+
+
+def _run_in_app_context(run, *args):
+    with app.app_context():
+        run(*args)
+
+
+def refresh_portfolio():
+    """Bring the portfolio snapshots up to date unless they already are."""
+    global _portfolio_refresh_queued
+    with _executor_lock:
+        _portfolio_refresh_queued = False
+    if portfolio_snapshots_current():
+        return 0
+    try:
+        return update_portfolio_snapshots()
+    except Exception:
+        app.logger.exception('Portfolio snapshot refresh failed')
+        db.session.rollback()
+        return 0
+
+
+def _submit_portfolio_refresh():
+    global _portfolio_refresh_queued
+    with _executor_lock:
+        _portfolio_refresh_queued = True
+    _get_executor().submit(_run_in_app_context, refresh_portfolio)
+
+
+def enqueue_portfolio_refresh():
+    """Queue `refresh_portfolio` unless one is already queued; returns True
+    when one was queued (or run). The check for current snapshots happens on
+    the worker, so it sees every import queued before it."""
+    if not app.config.get('WALLET_IMPORT_ASYNC', True):
+        refresh_portfolio()
+        return True
+    with _executor_lock:
+        if _portfolio_refresh_queued:
+            return False
+    _submit_portfolio_refresh()
+    return True
+
+
+def enqueue_import(filepath, filename, filetype):
+    """Queue the import of an uploaded file; returns the `ImportJob`."""
+    job = ImportJob(filepath=filepath, filename=filename, filetype=filetype, status=QUEUED)
+    db.session.add(job)
+    db.session.commit()
+
+    if app.config.get('WALLET_IMPORT_ASYNC', True):
+        _get_executor().submit(_run_in_app_context, run_import_job, job.id)
+        # Behind the import, which may discard snapshots.
+        _submit_portfolio_refresh()
+    else:
+        run_import_job(job.id)
+    return job
+
+
+def enqueue_batch_import(files):
+    """Queue `(filepath, filename, filetype)` uploads as one batch; returns
+    their `ImportJob`s."""
+    jobs = [ImportJob(filepath=filepath, filename=filename, filetype=filetype, status=QUEUED)
+            for filepath, filename, filetype in files]
+    db.session.add_all(jobs)
+    db.session.commit()
+
+    job_ids = [job.id for job in jobs]
+    if app.config.get('WALLET_IMPORT_ASYNC', True):
+        _get_executor().submit(_run_in_app_context, run_import_batch, job_ids)
+        # Behind the import, which may discard snapshots.
+        _submit_portfolio_refresh()
+    else:
+        run_import_batch(job_ids)
+    return jobs
+
+
+def fail_interrupted_import_jobs():
+    """Mark jobs left queued or running by a previous process as failed."""
+    count = ImportJob.query.filter(ImportJob.status.in_([QUEUED, RUNNING])).update(
+        {'status': FAILED, 'error': 'Interrupted by a restart', 'finished_at': datetime.utcnow()},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return count
@@ -1,13 +1,19 @@
 """CSV row → Transaction kwargs translators (one per source).
 
-Each function returns a dict suitable for `Transaction(**kwargs)`. The
-caller is responsible for stamping `origin_id`.
+Each `*_row` function returns a dict suitable for `Transaction(**kwargs)`.
+The `*_frame` variants translate a whole DataFrame column-wise into the
+same dicts, in row order, for bulk `insert(Transaction)` executemany. The
+caller is responsible for stamping `origin_id` and `fingerprint`.
 """
+import hashlib
+import json
+
+import numpy as np
 import pandas as pd
 
 from app.models import category_mapping
-from app.models.category_mapping import classify
-from app.utils.parsing import parse_b3_ticker
+from app.models.category_mapping import classify, classify_batch
+from app.utils.parsing import b3_ticker, parse_b3_ticker
 
 
 def _scalar(v):
@@ -16,12 +22,6 @@ def _scalar(v):
     return v
 
 
-def _b3_ticker_from_product(product):
-    """Run the same regex parse used by the legacy converter on a single str."""
-    s = pd.Series([product or ''])
-    return parse_b3_ticker(s).iloc[0]
-
-
 def b3_movimentation_row(row):
     direction = _scalar(row.get('Entrada/Saída'))
     raw_label = _scalar(row.get('Movimentação')) or ''
@@ -31,7 +31,7 @@ def b3_movimentation_row(row):
         source='b3',
         record_type='movimentation',
         date=_scalar(row.get('Data')),
-        asset=_b3_ticker_from_product(product),
+        asset=b3_ticker(product),
         product=product,
         institution=_scalar(row.get('Instituição')),
         raw_label=raw_label,
@@ -53,7 +53,7 @@ def b3_negotiation_row(row):
         source='b3',
         record_type='negotiation',
         date=_scalar(row.get('Data do Negócio')),
-        asset=_b3_ticker_from_product(code),
+        asset=b3_ticker(code),
         product=code,
         institution=_scalar(row.get('Instituição')),
         raw_label=raw_label,
@@ -121,3 +121,175 @@ def generic_extract_row(row):
         total=total,
         currency='BRL',
     )
+
+
+def _column(df, name):
+    """`df[name]`, or an all-None column when the CSV lacks it."""
+    if name in df.columns:
+        return df[name]
+    return pd.Series(None, index=df.index, dtype=object)
+
+
+def _text(df, name):
+    """String column with missing values as '' (the row `or ''` idiom)."""
+    column = _column(df, name).astype(object).fillna('')
+    return column.where(column.astype(bool), '')
+
+
+def _number(df, name):
+    """Numeric column with missing values as 0.0 (the row `or 0.0` idiom)."""
+    return pd.to_numeric(_column(df, name), errors='coerce').fillna(0.0)
+
+
+def _records(columns):
+    """List of dicts from a {name: Series or scalar} mapping, NaN as None.
+
+    Built from per-column `tolist()` (native Python values) rather than
+    `DataFrame.to_dict`, which boxes every cell."""
+    length = next(len(v) for v in columns.values() if isinstance(v, pd.Series))
+    values = []
+    for value in columns.values():
+        if isinstance(value, pd.Series):
+            values.append(value.astype(object).where(value.notna(), None).tolist())
+        else:
+            values.append([value] * length)
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def b3_movimentation_frame(df):
+    direction = _column(df, 'Entrada/Saída')
+    raw_label = _text(df, 'Movimentação')
+    product = _text(df, 'Produto')
+    return _records({
+        'source': 'b3',
+        'record_type': 'movimentation',
+        'date': _column(df, 'Data'),
+        'asset': parse_b3_ticker(product.astype(str)),
+        'product': product,
+        'institution': _column(df, 'Instituição'),
+        'raw_label': raw_label,
+        'category': classify_batch('b3', 'movimentation', raw_label, direction),
+        'direction': direction,
+        'quantity': _number(df, 'Quantidade'),
+        'price': _number(df, 'Preço unitário'),
+        'total': _number(df, 'Valor da Operação'),
+        'currency': 'BRL',
+    })
+
+
+def b3_negotiation_frame(df):
+    raw_label = _text(df, 'Tipo de Movimentação')
+    code = _text(df, 'Código de Negociação')
+    category = classify_batch('b3', 'negotiation', raw_label)
+    records = _records({
+        'source': 'b3',
+        'record_type': 'negotiation',
+        'date': _column(df, 'Data do Negócio'),
+        'asset': parse_b3_ticker(code.astype(str)),
+        'product': code,
+        'institution': _column(df, 'Instituição'),
+        'raw_label': raw_label,
+        'category': category,
+        'direction': pd.Series(np.where(category == category_mapping.BUY, 'Credito', 'Debito'),
+                               index=category.index),
+        'quantity': _number(df, 'Quantidade'),
+        'price': _number(df, 'Preço'),
+        'total': _number(df, 'Valor'),
+        'currency': 'BRL',
+    })
+    mercado = _column(df, 'Mercado').tolist()
+    prazo = _column(df, 'Prazo/Vencimento').tolist()
+    for record, m, p in zip(records, mercado, prazo):
+        record['meta'] = {'mercado': _scalar(m), 'prazo': _scalar(p)}
+    return records
+
+
+def avenue_extract_frame(df):
+    direction = _column(df, 'Entrada/Saída')
+    raw_label = _text(df, 'Movimentação')
+    produto = _text(df, 'Produto')
+    return _records({
+        'source': 'avenue',
+        'record_type': 'extract',
+        'date': _column(df, 'Data'),
+        'settlement_date': _column(df, 'Liquidação'),
+        'time': _column(df, 'Hora'),
+        'asset': produto,
+        'product': produto,
+        'raw_label': raw_label,
+        'category': classify_batch('avenue', 'extract', raw_label, direction),
+        'direction': direction,
+        'quantity': pd.to_numeric(_column(df, 'Quantidade'), errors='coerce'),
+        'price': pd.to_numeric(_column(df, 'Preço unitário'), errors='coerce'),
+        'total': _number(df, 'Valor (U$)'),
+        'balance': _number(df, 'Saldo da conta (U$)'),
+        'currency': 'USD',
+        'description': _column(df, 'Descrição'),
+    })
+
+
+def generic_extract_frame(df):
+    raw_label = _text(df, 'Movimentation')
+    total = _number(df, 'Total')
+    category = classify_batch('generic', 'extract', raw_label, totals=total)
+    asset = _text(df, 'Asset')
+    # Backfill raw_label from category when CSV left it blank — keeps UI sane.
+    backfill = category.map({category_mapping.BUY: 'Buy', category_mapping.SELL: 'Sell'}).fillna('')
+    return _records({
+        'source': 'generic',
+        'record_type': 'extract',
+        'date': _column(df, 'Date'),
+        'asset': asset,
+        'product': asset,
+        'raw_label': raw_label.where(raw_label != '', backfill),
+        'category': category,
+        'direction': pd.Series(np.where(total >= 0, 'Credito', 'Debito'), index=total.index),
+        'quantity': _number(df, 'Quantity'),
+        'price': _number(df, 'Price'),
+        'total': total,
+        'currency': 'BRL',
+    })
+
+
+# Fields hashed into `Transaction.fingerprint`; `category` is derived from
+# them and `origin_id` is tied to the upload, so neither is included.
+FINGERPRINT_FIELDS = (
+    'source', 'record_type', 'date', 'settlement_date', 'time', 'asset',
+    'product', 'institution', 'raw_label', 'direction', 'quantity', 'price',
+    'total', 'balance', 'currency', 'description', 'meta',
+)
+_FINGERPRINT_FLOATS = {'quantity', 'price', 'total', 'balance'}
+
+
+def _fingerprint_value(field, value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    if field in _FINGERPRINT_FLOATS:
+        return repr(float(value) + 0.0)  # -0.0 -> 0.0
+    if field == 'meta':
+        return json.dumps(value, sort_keys=True, default=str)
+    return str(value)
+
+
+def content_key(record):
+    """The content of a Transaction kwargs dict (or row) as one string."""
+    get = record.get if isinstance(record, dict) else lambda field: getattr(record, field)
+    return '\x1f'.join(_fingerprint_value(f, get(f)) for f in FINGERPRINT_FIELDS)
+
+
+def fingerprint_records(records, occurrences):
+    """Stamp `fingerprint` on each of `records`.
+
+    The fingerprint hashes the row content plus its occurrence ordinal, so
+    identical rows of one file (two equal trades on a day) stay distinct
+    while the same rows in an overlapping export map to the same keys.
+    `occurrences` ({content key: count}) carries the ordinals across the
+    chunks of a file.
+    """
+    for record in records:
+        key = content_key(record)
+        ordinal = occurrences.get(key, 0)
+        occurrences[key] = ordinal + 1
+        record['fingerprint'] = hashlib.sha256(f'{key}\x1f#{ordinal}'.encode()).hexdigest()
+    return records
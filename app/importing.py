@@ -1,15 +1,23 @@
+import os
 import re
 import hashlib
-from flask import flash
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from flask import flash, has_request_context
+import numpy as np
 import pandas as pd
+from sqlalchemy import insert
 from app import app, db
-from app.models import Transaction
+from app.models import ImportedFile, Transaction, register_asset_aliases
 from app.import_translators import (
-    b3_movimentation_row,
-    b3_negotiation_row,
-    avenue_extract_row,
-    generic_extract_row,
+    b3_movimentation_frame,
+    b3_negotiation_frame,
+    avenue_extract_frame,
+    generic_extract_frame,
+    fingerprint_records,
 )
+from app.processing.portfolio import discard_portfolio_snapshots
+from app.processing.positions import update_position_snapshots
 from app.utils.memocache import invalidate_processing_cache
 
 
@@ -30,122 +38,248 @@ def _coerce_date(df, column, fmt):
     df[column] = pd.to_datetime(df[column], format=fmt).dt.strftime('%Y-%m-%d')
 
 
-def _bulk_insert_transactions(df, filepath, row_to_kwargs, suffix=''):
-    """Generic dedup-aware bulk insert into the unified Transaction table.
+# Rows per chunk for `import_file`; each chunk is one transaction.
+IMPORT_CHUNK_SIZE = 5000
+_IN_CHUNK = 500
 
-    `suffix` lets two record_types from the same CSV (e.g. B3 mov vs neg)
-    coexist without origin_id collisions.
+
+def _existing_fingerprints(fingerprints):
+    existing = set()
+    for start in range(0, len(fingerprints), _IN_CHUNK):
+        chunk = fingerprints[start:start + _IN_CHUNK]
+        existing.update(fp for (fp,) in db.session.query(Transaction.fingerprint).filter(
+            Transaction.fingerprint.in_(chunk)
+        ).all())
+    return existing
+
+
+def _insert_records(records, index, prefix, suffix, occurrences):
+    """Insert the new rows among translated `records` in their own transaction.
+
+    Rows are deduplicated on their content `fingerprint` (unique index), so
+    overlapping exports under any file name only add the rows not stored
+    yet; `index` holds the file row numbers used for `origin_id`. Returns
+    `(inserted records, duplicated rows)`. On failure the chunk is rolled
+    back and the error re-raised; earlier chunks stay committed.
     """
-    app.logger.info('Inserting %d rows into Transaction (suffix=%r)', len(df), suffix)
-    file_hash = gen_hash(filepath)
-    added = 0
-    duplicates = 0
+    records = fingerprint_records(records, occurrences)
+    existing = _existing_fingerprints([record['fingerprint'] for record in records])
+
+    inserted = []
+    for record, row in zip(records, index):
+        if record['fingerprint'] not in existing:
+            record['origin_id'] = f'{prefix}{row}{suffix}'
+            inserted.append(record)
+
+    try:
+        if inserted:
+            db.session.execute(insert(Transaction.__table__), inserted)
+        register_asset_aliases(inserted)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return inserted, len(records) - len(inserted)
+
+
+def _translate_chunks(chunks, frame_to_records, prepare=None):
+    """`(row index, records)` per DataFrame chunk; no database access."""
+    for chunk in chunks:
+        if prepare is not None:
+            chunk = prepare(chunk)
+        yield list(chunk.index), frame_to_records(chunk)
+
+
+def _already_imported(file_hash, filepath):
+    """Counts to report for a file whose content is in `ImportedFile`
+    (every row a duplicate), or None."""
+    imported = ImportedFile.query.filter_by(content_hash=file_hash).first()
+    if imported is None:
+        return None
+    app.logger.info('%s already imported as %s', filepath, imported.filename)
+    if has_request_context():
+        flash(f'File already imported: {imported.filename}')
+    return dict(rows=imported.rows, added=0, duplicates=imported.rows)
 
-    prefix = f'{filepath}:{file_hash}:'
-    existing = {
-        oid for (oid,) in db.session.query(Transaction.origin_id).filter(
-            Transaction.origin_id.like(f'{prefix}%')
-        ).all()
-    }
-
-    for index, row in df.iterrows():
-        origin_id = f'{prefix}{index}{suffix}'
-        if origin_id in existing:
-            duplicates += 1
-            continue
-        kwargs = row_to_kwargs(row)
-        kwargs['origin_id'] = origin_id
-        db.session.add(Transaction(**kwargs))
-        added += 1
 
+def _write_file(translated, filepath, file_hash, suffix, earliest, counts, progress=None):
+    """Insert the translated chunks of one file and record it in `ImportedFile`.
+
+    `counts` (rows/added/duplicates) and `earliest` ({(source, asset): date}
+    of the inserted rows) are updated in place, so the caller still has
+    them when a chunk fails.
+    """
+    prefix = f'{filepath}:{file_hash}:'
+    occurrences = {}
+    for index, records in translated:
+        app.logger.info('Inserting %d rows into Transaction (suffix=%r)', len(records), suffix)
+        inserted, skipped = _insert_records(records, index, prefix, suffix, occurrences)
+        for record in inserted:
+            key = (record.get('source'), record.get('asset'))
+            date = record.get('date')
+            if date and (key not in earliest or date < earliest[key]):
+                earliest[key] = date
+        counts['rows'] += len(records)
+        counts['added'] += len(inserted)
+        counts['duplicates'] += skipped
+        if progress is not None:
+            progress(counts['rows'], counts['added'], counts['duplicates'])
+    db.session.add(ImportedFile(content_hash=file_hash, filename=os.path.basename(filepath),
+                                rows=counts['rows'], added=counts['added']))
     db.session.commit()
-    if added > 0:
+
+
+def _finish_import(earliest, added, duplicates):
+    """Snapshot and cache hooks for everything inserted, run once per import."""
+    if earliest:
+        records = [dict(source=source, asset=asset, date=date)
+                   for (source, asset), date in earliest.items()]
+        update_position_snapshots(records)
+        discard_portfolio_snapshots(records)
         invalidate_processing_cache()
-    flash(f'Rows Added: {added}')
-    flash(f'Duplicated rows discarded: {duplicates}')
+    app.logger.info('Rows added: %d, duplicated rows discarded: %d', added, duplicates)
+    # Background jobs report through ImportJob instead.
+    if has_request_context():
+        flash(f'Rows Added: {added}')
+        flash(f'Duplicated rows discarded: {duplicates}')
 
 
-def import_b3_movimentation(df, filepath):
-    app.logger.info('Processing B3 Movimentation...')
+def _import_chunks(chunks, filepath, frame_to_records, suffix='', prepare=None, progress=None):
+    """Dedup-aware insert of `chunks` (DataFrames) into the Transaction table.
+
+    Each chunk is translated column-wise by `frame_to_records` (the `*_frame`
+    translators) and written with one Core `insert(Transaction)` executemany
+    in its own transaction. `suffix` lets two record_types from the same CSV
+    (e.g. B3 mov vs neg) coexist without origin_id collisions.
+
+    A file whose content hash is in `ImportedFile` is not read at all: all
+    its rows are reported as duplicates. The hash is recorded once every
+    chunk is in.
+
+    Only the earliest date per (source, asset) is kept across chunks; the
+    snapshot and cache hooks run once, after the last chunk (or after the
+    chunk that failed, for what was already committed).
+    """
+    file_hash = gen_hash(filepath)
+    skipped = _already_imported(file_hash, filepath)
+    if skipped is not None:
+        if progress is not None:
+            progress(skipped['rows'], skipped['added'], skipped['duplicates'])
+        return skipped
+
+    earliest = {}
+    counts = dict(rows=0, added=0, duplicates=0)
+    try:
+        _write_file(_translate_chunks(chunks, frame_to_records, prepare), filepath, file_hash,
+                    suffix, earliest, counts, progress)
+    finally:
+        _finish_import(earliest, counts['added'], counts['duplicates'])
+    return counts
+
+
+def _bulk_insert_transactions(df, filepath, frame_to_records, suffix=''):
+    """`_import_chunks` over an already loaded DataFrame, as a single chunk."""
+    return _import_chunks([df], filepath, frame_to_records, suffix)
+
+
+def _prepare_b3_movimentation(df):
     _coerce_date(df, 'Data', '%d/%m/%Y')
     _coerce_numeric(df, ['Preço unitário', 'Valor da Operação', 'Quantidade'])
     df['Produto'] = df['Produto'].str.strip()
+    return df
+
 
-    _bulk_insert_transactions(df, filepath, b3_movimentation_row, suffix=':mov')
+def import_b3_movimentation(df, filepath):
+    app.logger.info('Processing B3 Movimentation...')
+    df = _prepare_b3_movimentation(df)
+    _bulk_insert_transactions(df, filepath, b3_movimentation_frame, suffix=':mov')
     return df
 
 
-def import_b3_negotiation(df, filepath):
-    app.logger.info('Processing B3 Negotiation...')
+def _prepare_b3_negotiation(df):
     _coerce_date(df, 'Data do Negócio', '%d/%m/%Y')
     _coerce_numeric(df, ['Quantidade', 'Preço', 'Valor'])
+    return df
 
-    _bulk_insert_transactions(df, filepath, b3_negotiation_row, suffix=':neg')
+
+def import_b3_negotiation(df, filepath):
+    app.logger.info('Processing B3 Negotiation...')
+    df = _prepare_b3_negotiation(df)
+    _bulk_insert_transactions(df, filepath, b3_negotiation_frame, suffix=':neg')
     return df
 
 
-def _safe_str(x):
-    if x is None or (isinstance(x, float) and pd.isna(x)):
-        return ''
-    return str(x)
+def _safe_str(column):
+    """Column as strings, with missing values as ''."""
+    return column.astype(object).where(column.notna(), '').astype(str)
 
 
-def extract_fill(df):
-    df['Descrição'] = df['Descrição'].apply(_safe_str)
-
-    def parse_entrada_saida(x):
-        if re.match(r'Câmbio|Compra|Dividendos|Estorno', x):
-            return 'Credito'
-        return 'Debito'
-    df['Entrada/Saída'] = df['Descrição'].apply(parse_entrada_saida)
-
-    def parse_produto(x):
-        # Try patterns with quantity first: "Venda de 0,77 ASML", "Compra de 5 NVDA"
-        match = re.search(r'(Compra|Venda) de [0-9.,]+ ([A-Z]{1,5})', x)
-        if match:
-            return match.group(2)
-        # Then try without quantity: "Dividendos de MSFT", "Imposto sobre dividendo de MSFT"
-        match = re.search(r'(sobre dividendo de|de) ([A-Z]{1,5})', x)
-        if match:
-            return match.group(2)
-        # Old format: "Dividendos MSFT. ***..."
-        match = re.search(r'(Dividendos|Corretagem) ([A-Z]{1,4})', x)
-        if match:
-            return match.group(2)
-        return ''
-    df['Produto'] = df['Descrição'].apply(parse_produto)
-
-    def parse_movimentacao(x):
-        if re.search(r'Imposto sobre dividendo', x):
-            return 'Impostos'
-        if re.search(r'corretagem', x, re.IGNORECASE):
-            return 'Corretagem'
-        match = re.search(r'Câmbio|Compra|Venda|Impostos|Dividendos|Corretagem|Desdobramento', x)
-        if match:
-            return match.group(0)
-        return '???'
-    df['Movimentação'] = df['Descrição'].apply(parse_movimentacao)
-
-    def parse_quantidade(x):
-        match = re.search(r'(Compra de|Venda de) ([0-9.,]+)', x)
-        if match:
-            return float(match.group(2).replace(',', '.'))
-        return None
-    df['Quantidade'] = df['Descrição'].apply(parse_quantidade)
+# Avenue `Descrição` patterns (see `parse_avenue_descriptions`).
+_AVENUE_CREDIT = re.compile(r'Câmbio|Compra|Dividendos|Estorno')
+# Product, by priority: "Venda de 0,77 ASML" / "Compra de 5 NVDA", then
+# "Dividendos de MSFT" / "Imposto sobre dividendo de MSFT", then the old
+# "Dividendos MSFT. ***..." format.
+_AVENUE_PRODUCT = (
+    re.compile(r'(?:Compra|Venda) de [0-9.,]+ (?P<produto>[A-Z]{1,5})'),
+    re.compile(r'(?:sobre dividendo de|de) (?P<produto>[A-Z]{1,5})'),
+    re.compile(r'(?:Dividendos|Corretagem) (?P<produto>[A-Z]{1,4})'),
+)
+_AVENUE_DIVIDEND_TAX = re.compile(r'Imposto sobre dividendo')
+_AVENUE_BROKERAGE = re.compile(r'corretagem', re.IGNORECASE)
+_AVENUE_MOVEMENT = re.compile(
+    r'(?P<movimentacao>Câmbio|Compra|Venda|Impostos|Dividendos|Corretagem|Desdobramento)')
+_AVENUE_QUANTITY = re.compile(r'(?:Compra de|Venda de) (?P<quantidade>[0-9.,]+)')
+_AVENUE_PRICE = re.compile(r'\$[\s\xa0]?(?P<preco>[0-9.,]+)')
 
-    def parse_preco_unitario(x):
-        match = re.search(r'\$[\s\xa0]?([0-9.,]+)', x)
-        if match:
-            return float(match.group(1).replace(',', '.'))
-        return None
-    df['Preço unitário'] = df['Descrição'].apply(parse_preco_unitario)
 
-    return df
+def _decimal(values):
+    """'0,77' / '209.00' strings to floats, NaN where missing."""
+    return values.str.replace(',', '.', regex=False).astype(float)
 
 
-def import_avenue_extract(df, filepath):
-    app.logger.info('Processing Avenue Extract file...')
+def parse_avenue_descriptions(descriptions):
+    """Parse Avenue `Descrição` strings column-wise.
 
+    Returns a frame with `Entrada/Saída`, `Produto`, `Movimentação`,
+    `Quantidade` and `Preço unitário`, from precompiled patterns applied
+    with `.str` methods over the whole column.
+    """
+    descriptions = _safe_str(descriptions)
+
+    product = pd.Series('', index=descriptions.index, dtype=object)
+    missing = pd.Series(True, index=descriptions.index)
+    for pattern in _AVENUE_PRODUCT:
+        found = descriptions[missing].str.extract(pattern)['produto'].dropna()
+        product[found.index] = found
+        missing[found.index] = False
+
+    movement = descriptions.str.extract(_AVENUE_MOVEMENT)['movimentacao']
+    movement = pd.Series(np.select(
+        [descriptions.str.contains(_AVENUE_DIVIDEND_TAX),
+         descriptions.str.contains(_AVENUE_BROKERAGE),
+         movement.notna()],
+        ['Impostos', 'Corretagem', movement],
+        default='???',
+    ), index=descriptions.index)
+
+    return pd.DataFrame({
+        'Entrada/Saída': np.where(descriptions.str.match(_AVENUE_CREDIT), 'Credito', 'Debito'),
+        'Produto': product,
+        'Movimentação': movement,
+        'Quantidade': _decimal(descriptions.str.extract(_AVENUE_QUANTITY)['quantidade']),
+        'Preço unitário': _decimal(descriptions.str.extract(_AVENUE_PRICE)['preco']),
+    }, index=descriptions.index)
+
+
+def extract_fill(df):
+    df['Descrição'] = _safe_str(df['Descrição'])
+    parsed = parse_avenue_descriptions(df['Descrição'])
+    for column in parsed.columns:
+        df[column] = parsed[column]
+    return df
+
+
+def _prepare_avenue_extract(df):
     if 'Data transação' in df.columns:
         app.logger.info('Detected new Avenue format')
         df = df.rename(columns={
@@ -162,17 +296,161 @@ def import_avenue_extract(df, filepath):
     _coerce_date(df, 'Liquidação', '%d/%m/%Y')
     _coerce_numeric(df, ['Valor (U$)', 'Saldo da conta (U$)'])
 
-    df = extract_fill(df)
+    return extract_fill(df)
+
 
-    _bulk_insert_transactions(df, filepath, avenue_extract_row, suffix=':av')
+def import_avenue_extract(df, filepath):
+    app.logger.info('Processing Avenue Extract file...')
+    df = _prepare_avenue_extract(df)
+    _bulk_insert_transactions(df, filepath, avenue_extract_frame, suffix=':av')
     return df
 
 
-def import_generic_extract(df, filepath):
-    app.logger.info('Processing Generic Extract file...')
+def _prepare_generic_extract(df):
     _coerce_date(df, 'Date', '%Y-%m-%d')
     _coerce_numeric(df, ['Quantity', 'Price', 'Total'])
     df['Movimentation'] = df['Movimentation'].fillna('')
+    return df
 
-    _bulk_insert_transactions(df, filepath, generic_extract_row, suffix=':gen')
+
+def import_generic_extract(df, filepath):
+    app.logger.info('Processing Generic Extract file...')
+    df = _prepare_generic_extract(df)
+    _bulk_insert_transactions(df, filepath, generic_extract_frame, suffix=':gen')
     return df
+
+
+# Upload `filetype` -> (prepare, frame translator, origin_id suffix).
+IMPORTERS = {
+    'B3 Movimentation': (_prepare_b3_movimentation, b3_movimentation_frame, ':mov'),
+    'B3 Negotiation': (_prepare_b3_negotiation, b3_negotiation_frame, ':neg'),
+    'Avenue Extract': (_prepare_avenue_extract, avenue_extract_frame, ':av'),
+    'Generic Extract': (_prepare_generic_extract, generic_extract_frame, ':gen'),
+}
+
+
+def read_chunks(filepath, chunksize=IMPORT_CHUNK_SIZE):
+    """Yield `filepath` as DataFrames of at most `chunksize` rows.
+
+    CSVs are streamed with `read_csv(chunksize=...)`; xlsx has no streaming
+    reader, so it is loaded once and sliced. Chunks keep the file's row
+    index, so origin_ids match a whole-file import.
+    """
+    if filepath.endswith('.csv'):
+        yield from pd.read_csv(filepath, chunksize=chunksize)
+    elif filepath.endswith('.xlsx'):
+        df = pd.read_excel(filepath)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize].copy()
+    else:
+        raise ValueError(f'Unsupported file extension: {filepath}')
+
+
+def _log_progress(rows, added, duplicates):
+    app.logger.info('Imported %d rows (%d added, %d duplicated)', rows, added, duplicates)
+
+
+def import_file(filepath, filetype, chunksize=IMPORT_CHUNK_SIZE, progress=_log_progress):
+    """Stream `filepath` into the Transaction table, one chunk per transaction.
+
+    `progress(rows, added, duplicates)` is called after each committed chunk.
+    Returns a dict with those counts plus `error`: None, or the message of
+    the chunk that failed (and was rolled back; earlier chunks are kept and
+    a re-upload skips them as duplicates).
+    """
+    app.logger.info('Processing %s file %s...', filetype, filepath)
+    prepare, frame_to_records, suffix = IMPORTERS[filetype]
+    counts = dict(rows=0, added=0, duplicates=0)
+
+    def track(rows, added, duplicates):
+        counts.update(rows=rows, added=added, duplicates=duplicates)
+        if progress is not None:
+            progress(rows, added, duplicates)
+
+    try:
+        _import_chunks(read_chunks(filepath, chunksize), filepath, frame_to_records,
+                       suffix, prepare=prepare, progress=track)
+    except Exception as exc:
+        app.logger.exception('Import of %s failed after %d rows', filepath, counts['rows'])
+        return dict(counts, error=f'Failed after row {counts["rows"]}: {exc}')
+    return dict(counts, error=None)
+
+
+def translate_file(filepath, filetype, chunksize=IMPORT_CHUNK_SIZE):
+    """Parse and translate `filepath` into `(row index, records)` chunks.
+
+    Pure pandas, no database access, so it can run in a worker process.
+    """
+    prepare, frame_to_records, _ = IMPORTERS[filetype]
+    return list(_translate_chunks(read_chunks(filepath, chunksize), frame_to_records, prepare))
+
+
+def import_files(files, chunksize=IMPORT_CHUNK_SIZE, processes=None, progress=None):
+    """Import several `(filepath, filetype)` uploads as one batch.
+
+    Files not already in `ImportedFile` are parsed and translated by
+    `translate_file` on a `ProcessPoolExecutor` (CSV parsing and the regex
+    extraction are CPU-bound); this thread is the only writer and inserts
+    each file's chunks as soon as that file is translated. The snapshot and
+    cache hooks run once for the whole batch. `processes=0` translates in
+    this thread instead.
+
+    `progress(position, rows, added, duplicates)` reports per file. Returns
+    one `import_file`-style result dict per file, in input order; a failed
+    file keeps what it committed and does not stop the others.
+    """
+    results = [None] * len(files)
+    pending = []
+    for position, (filepath, filetype) in enumerate(files):
+        file_hash = gen_hash(filepath)
+        skipped = _already_imported(file_hash, filepath)
+        if skipped is not None:
+            results[position] = dict(skipped, error=None)
+            if progress is not None:
+                progress(position, skipped['rows'], skipped['added'], skipped['duplicates'])
+        else:
+            pending.append((position, filepath, filetype, file_hash))
+
+    def write(position, filepath, filetype, file_hash, translate):
+        counts = dict(rows=0, added=0, duplicates=0)
+        track = None if progress is None else (lambda *c: progress(position, *c))
+        try:
+            # The same content may appear twice in one batch.
+            skipped = _already_imported(file_hash, filepath)
+            if skipped is not None:
+                counts = skipped
+                if track is not None:
+                    track(counts['rows'], counts['added'], counts['duplicates'])
+            else:
+                _write_file(translate(), filepath, file_hash, IMPORTERS[filetype][2],
+                            earliest, counts, track)
+        except Exception as exc:
+            db.session.rollback()
+            app.logger.exception('Import of %s failed after %d rows', filepath, counts['rows'])
+            results[position] = dict(counts, error=f'Failed after row {counts["rows"]}: {exc}')
+            return
+        results[position] = dict(counts, error=None)
+
+    earliest = {}
+    try:
+        if processes == 0 or not pending:
+            for position, filepath, filetype, file_hash in pending:
+                write(position, filepath, filetype, file_hash,
+                      lambda: translate_file(filepath, filetype, chunksize))
+        else:
+            workers = min(processes or os.cpu_count() or 1, len(pending))
+            # spawn: the writer runs on a thread, and forking a threaded
+            # process can deadlock the child.
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context('spawn')) as pool:
+                futures = {
+                    pool.submit(translate_file, filepath, filetype, chunksize):
+                        (position, filepath, filetype, file_hash)
+                    for position, filepath, filetype, file_hash in pending
+                }
+                for future in as_completed(futures):
+                    write(*futures[future], future.result)
+    finally:
+        done = [result for result in results if result is not None]
+        _finish_import(earliest, sum(r['added'] for r in done), sum(r['duplicates'] for r in done))
+    return results
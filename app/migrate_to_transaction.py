@@ -7,16 +7,22 @@ copying, the legacy tables are dropped.
 Legacy → Transaction translation reuses the same `import_translators`
 helpers used by the importer, so the canonical category mapping stays in
 one place.
+
+`add_transaction_fingerprint_column()` / `backfill_transaction_fingerprints()`
+bring databases created before `Transaction.fingerprint` up to date; both
+are no-ops once done.
 """
 import logging
 
-from sqlalchemy import inspect
+from sqlalchemy import bindparam, inspect
 
 from app import db
 from app.import_translators import (
+    FINGERPRINT_FIELDS,
     avenue_extract_row,
     b3_movimentation_row,
     b3_negotiation_row,
+    fingerprint_records,
     generic_extract_row,
 )
 from app.models import (
@@ -25,6 +31,7 @@ from app.models import (
     B3Negotiation,
     GenericExtract,
     Transaction,
+    register_asset_aliases,
 )
 
 logger = logging.getLogger(__name__)
@@ -111,6 +118,7 @@ def _migrate_table(model, suffix, dict_fn, translator, existing):
     rows = model.query.all()
     added = 0
     skipped = 0
+    migrated = []
     for r in rows:
         # Avenue/Generic legacy origin_id was 'filepath:hash:idx' or 'FORM'.
         # We append the suffix so re-runs don't collide and so it lines up
@@ -127,8 +135,10 @@ def _migrate_table(model, suffix, dict_fn, translator, existing):
             continue
         kwargs['origin_id'] = new_oid
         db.session.add(Transaction(**kwargs))
+        migrated.append(kwargs)
         existing.add(new_oid)
         added += 1
+    register_asset_aliases(migrated)
     return added, skipped
 
 
@@ -171,3 +181,52 @@ def migrate_legacy_to_transaction(drop_legacy=True):
         logger.info('Dropped legacy tables: %s', present)
 
     return summary
+
+
+def add_transaction_fingerprint_column():
+    """`ALTER TABLE transaction ADD COLUMN fingerprint` (+ its unique index)
+    on databases created before the column existed. Returns True if added."""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('transaction')}
+    if 'fingerprint' in columns:
+        return False
+    logger.info('Adding transaction.fingerprint column')
+    db.session.execute(db.text('ALTER TABLE "transaction" ADD COLUMN fingerprint VARCHAR'))
+    db.session.execute(db.text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_transaction_fingerprint ON "transaction" (fingerprint)'))
+    db.session.commit()
+    return True
+
+
+def backfill_transaction_fingerprints():
+    """Fingerprint imported rows stored without one (manual `FORM` entries
+    are left alone). Ordinals follow `id` order and skip fingerprints that
+    are already taken. Returns the number of rows updated."""
+    columns = [getattr(Transaction, field) for field in FINGERPRINT_FIELDS]
+    rows = db.session.query(Transaction.id, *columns).filter(
+        Transaction.fingerprint.is_(None),
+        Transaction.origin_id.isnot(None),
+        ~Transaction.origin_id.like('FORM%'),
+    ).order_by(Transaction.id).all()
+    if not rows:
+        return 0
+
+    taken = {fp for (fp,) in db.session.query(Transaction.fingerprint).filter(
+        Transaction.fingerprint.isnot(None)).all()}
+    occurrences = {}
+    updates = []
+    for row in rows:
+        record = dict(zip(FINGERPRINT_FIELDS, row[1:]))
+        fingerprint_records([record], occurrences)
+        while record['fingerprint'] in taken:
+            fingerprint_records([record], occurrences)
+        taken.add(record['fingerprint'])
+        updates.append({'row_id': row.id, 'fp': record['fingerprint']})
+
+    table = Transaction.__table__
+    db.session.execute(
+        table.update().where(table.c.id == bindparam('row_id')).values(fingerprint=bindparam('fp')),
+        updates,
+    )
+    db.session.commit()
+    logger.info('Fingerprinted %d transactions', len(updates))
+    return len(updates)
@@ -17,6 +17,16 @@ from .transactions import (
     AvenueExtract,
     GenericExtract,
 )
+from .assets import (
+    AssetAlias,
+    register_asset_aliases,
+    resolve_asset,
+    backfill_asset_aliases,
+)
+from .positions import PositionSnapshot
+from .prices import PriceBar
+from .portfolio import PortfolioSnapshot
+from .imports import ImportJob, ImportedFile
 from . import category_mapping
 from .converters import (
     b3_movimentation_sql_to_df,
@@ -33,6 +43,11 @@ __all__ = [
     'get_cache_ttls', 'get_processing_ttl',
     'Transaction',
     'B3Movimentation', 'B3Negotiation', 'AvenueExtract', 'GenericExtract',
+    'AssetAlias', 'register_asset_aliases', 'resolve_asset', 'backfill_asset_aliases',
+    'PositionSnapshot',
+    'PriceBar',
+    'PortfolioSnapshot',
+    'ImportJob', 'ImportedFile',
     'category_mapping',
     'b3_movimentation_sql_to_df', 'b3_negotiation_sql_to_df',
     'avenue_extract_sql_to_df', 'generic_extract_sql_to_df',
@@ -0,0 +1,101 @@
+"""Asset identity: alias table mapping raw product strings to canonical assets.
+
+Every import registers the product strings (B3 product descriptions,
+negotiation codes, fractional-market codes) it saw for an asset, so asset
+lookups can resolve any of them to the canonical `Transaction.asset` and
+then run an exact, indexed `(source, asset)` query.
+"""
+from app import db
+from app.utils.parsing import is_valid_b3_ticker
+
+# Keep IN (...) lists below SQLite's bound-parameter limit.
+_IN_CHUNK = 500
+
+
+class AssetAlias(db.Model):
+    __tablename__ = 'asset_alias'
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String, nullable=False)
+    alias = db.Column(db.String, nullable=False)
+    asset = db.Column(db.String, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('source', 'alias', name='uq_asset_alias_source_alias'),
+    )
+
+    def __repr__(self):
+        return f'<AssetAlias {self.source}/{self.alias} -> {self.asset}>'
+
+
+def _aliases_for(source, asset, product):
+    aliases = {asset}
+    if product:
+        aliases.add(product.strip())
+    if source == 'b3' and is_valid_b3_ticker(asset):
+        # Fractional market code (e.g. ITSA4F) trades the same asset.
+        aliases.add(asset + 'F')
+    return aliases
+
+
+def register_asset_aliases(records):
+    """Add missing aliases for `records` (Transaction kwargs dicts or rows
+    exposing `source`, `asset` and `product`). Does not commit."""
+    wanted = {}
+    for record in records:
+        if isinstance(record, dict):
+            source, asset, product = record.get('source'), record.get('asset'), record.get('product')
+        else:
+            source, asset, product = record.source, record.asset, record.product
+        if not source or not asset:
+            continue
+        for alias in _aliases_for(source, asset, product):
+            if alias:
+                wanted.setdefault((source, alias), asset)
+
+    if not wanted:
+        return 0
+
+    existing = set()
+    for source in {source for source, _ in wanted}:
+        aliases = [alias for src, alias in wanted if src == source]
+        for start in range(0, len(aliases), _IN_CHUNK):
+            chunk = aliases[start:start + _IN_CHUNK]
+            existing.update(
+                (source, alias) for (alias,) in db.session.query(AssetAlias.alias).filter(
+                    AssetAlias.source == source, AssetAlias.alias.in_(chunk)
+                ).all()
+            )
+
+    added = 0
+    for (source, alias), asset in wanted.items():
+        if (source, alias) in existing:
+            continue
+        db.session.add(AssetAlias(source=source, alias=alias, asset=asset))
+        added += 1
+    return added
+
+
+def resolve_asset(source, name):
+    """Return the canonical asset for `name` (an asset, product or alias)."""
+    row = AssetAlias.query.filter_by(source=source, alias=name).first()
+    if row is None:
+        return name
+    return row.asset
+
+
+def backfill_asset_aliases():
+    """Register aliases for every (source, asset, product) already stored in
+    `transaction`. Safe to call repeatedly."""
+    from .transactions import Transaction
+
+    rows = db.session.query(
+        Transaction.source, Transaction.asset, Transaction.product,
+    ).filter(Transaction.asset.isnot(None), Transaction.asset != '').distinct().all()
+    added = register_asset_aliases(
+        {'source': source, 'asset': asset, 'product': product}
+        for source, asset, product in rows
+    )
+    if added:
+        db.session.commit()
+    return added
@@ -6,6 +6,8 @@ category enum used by the processing layer. The original label stays in
 """
 import logging
 
+import pandas as pd
+
 # Canonical categories
 BUY = 'BUY'
 SELL = 'SELL'
@@ -123,3 +125,64 @@ def classify(source, record_type, raw_label, direction=None, total=None):
         )
         return OTHER
     return cat
+
+
+def _lookup_rows(source, record_type, credit, debit=None):
+    """(source, record_type, direction, label, category) rows for one table.
+
+    Direction '' is the no-direction lookup, where credit wins over debit.
+    Tables without a debit side ignore direction altogether.
+    """
+    if debit is None:
+        return [(source, record_type, '', label, cat) for label, cat in credit.items()]
+    rows = [(source, record_type, 'Credito', label, cat) for label, cat in credit.items()]
+    rows += [(source, record_type, 'Debito', label, cat) for label, cat in debit.items()]
+    rows += [(source, record_type, '', label, cat) for label, cat in {**debit, **credit}.items()]
+    return rows
+
+
+# Same tables as `classify`, as one frame for `classify_batch`. A None
+# record_type matches any record_type of that source (as Avenue does).
+_LOOKUP = pd.DataFrame(
+    _lookup_rows('b3', 'movimentation', _B3_MOV_CREDIT, _B3_MOV_DEBIT)
+    + _lookup_rows('b3', 'negotiation', _B3_NEG)
+    + _lookup_rows('avenue', None, _AVENUE_CREDIT, _AVENUE_DEBIT)
+    + _lookup_rows('generic', 'extract', _GENERIC),
+    columns=['source', 'record_type', 'direction', 'label', 'category'],
+)
+
+
+def classify_batch(source, record_type, labels, directions=None, totals=None):
+    """Column-wise `classify`: one category per element of `labels`.
+
+    Looks every (direction, label) pair up in `_LOOKUP` with a single
+    merge, applies the generic sign-of-total fallback, and logs each
+    unknown (label, direction) once with its row count.
+    """
+    table = _LOOKUP[(_LOOKUP['source'] == source)
+                    & (_LOOKUP['record_type'].isna() | (_LOOKUP['record_type'] == record_type))]
+    index = labels.index
+    labels = labels.astype(object).where(labels.notna(), '').astype(str).str.strip()
+    if directions is None or not (table['direction'] != '').any():
+        directions = pd.Series('', index=index, dtype=object)
+    else:
+        directions = directions.where(directions.isin(['Credito', 'Debito']), '')
+
+    keys = pd.DataFrame({'direction': directions.to_numpy(), 'label': labels.to_numpy()})
+    merged = keys.merge(table[['direction', 'label', 'category']], on=['direction', 'label'], how='left')
+    categories = pd.Series(merged['category'].to_numpy(), index=index, dtype=object)
+
+    if source == 'generic' and totals is not None:
+        signs = pd.Series(pd.to_numeric(totals, errors='coerce').to_numpy(), index=index)
+        fallback = categories.isna() & signs.notna()
+        categories[fallback] = (signs[fallback] >= 0).map({True: BUY, False: SELL})
+
+    unknown = categories.isna()
+    if unknown.any():
+        counts = keys[unknown.to_numpy()].value_counts(sort=False)
+        for (direction, label), count in counts.items():
+            logging.getLogger(__name__).warning(
+                'Unknown raw_label: source=%s record_type=%s label=%r direction=%s (%d rows)',
+                source, record_type, label, direction or None, count,
+            )
+    return categories.fillna(OTHER)
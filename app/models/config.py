@@ -44,11 +44,14 @@ DEFAULT_CACHE_CONFIG = [
     {'category': 'serper',        'ttl_seconds': 900,  'url_pattern': '*google.serper.dev*'},
     {'category': 'gemini',        'ttl_seconds': 900,  'url_pattern': '*generativelanguage.googleapis.com*'},
     {'category': 'asset',         'ttl_seconds': 600,  'url_pattern': None},
+    {'category': 'asset_detail',  'ttl_seconds': 600,  'url_pattern': None},
     {'category': 'consolidate',   'ttl_seconds': 600,  'url_pattern': None},
+    # Keyed on the ledger version and last price bar, so it can live longer.
+    {'category': 'history',       'ttl_seconds': 86400, 'url_pattern': None},
 ]
 
 # Categories that belong to the processing-cache layer (not HTTP).
-PROCESSING_CACHE_CATEGORIES = {'asset', 'consolidate'}
+PROCESSING_CACHE_CATEGORIES = {'asset', 'asset_detail', 'consolidate', 'history'}
 
 
 def seed_default_cache_config():
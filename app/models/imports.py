@@ -0,0 +1,72 @@
+"""Uploaded files: queued imports and the files already imported.
+
+One `ImportJob` row per upload. The upload request only saves the file and
+enqueues the row; `app.import_jobs` runs the import on a worker thread and
+updates the counters after every committed chunk, which `/api/import/<id>`
+reports back to the browser.
+"""
+from datetime import datetime
+
+from app import db
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ImportJob(db.Model):
+    __tablename__ = 'import_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String, nullable=False)
+    filepath = db.Column(db.String, nullable=False)
+    filetype = db.Column(db.String, nullable=False)
+
+    status = db.Column(db.String, nullable=False, default=QUEUED)  # queued | running | done | failed
+    rows = db.Column(db.Integer, nullable=False, default=0)        # Rows read so far
+    added = db.Column(db.Integer, nullable=False, default=0)
+    duplicates = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'filetype': self.filetype,
+            'status': self.status,
+            'finished': self.finished,
+            'rows': self.rows,
+            'added': self.added,
+            'duplicates': self.duplicates,
+            'error': self.error,
+        }
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.filename} {self.status}>'
+
+
+class ImportedFile(db.Model):
+    """A file whose import completed, keyed by the SHA-256 of its content.
+
+    A re-upload of the same bytes (under any name) is skipped without being
+    parsed."""
+    __tablename__ = 'imported_file'
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String, nullable=False, unique=True, index=True)
+    filename = db.Column(db.String)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    added = db.Column(db.Integer, nullable=False, default=0)
+    imported_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImportedFile {self.filename} {self.content_hash[:12]}>'
@@ -0,0 +1,45 @@
+"""Materialized daily portfolio valuation.
+
+One `PortfolioSnapshot` row per (date, source, asset) holds the asset's
+position and its value and cost in BRL on that business day, so portfolio
+history, comparisons and period returns are indexed range reads. Rows are
+appended by `app.processing.portfolio.update_portfolio_snapshots()` on the
+import worker (`app.import_jobs.enqueue_portfolio_refresh`); rows
+from the earliest date touched by newly imported transactions onwards are
+discarded and recomputed.
+"""
+from datetime import datetime
+
+from app import db
+
+
+class PortfolioSnapshot(db.Model):
+    __tablename__ = 'portfolio_snapshot'
+
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.String, nullable=False)           # 'YYYY-MM-DD' (business day)
+    source = db.Column(db.String, nullable=False)
+    asset = db.Column(db.String, nullable=False)
+
+    position = db.Column(db.Float, nullable=False, default=0.0)   # Shares held
+    price = db.Column(db.Float, nullable=False, default=0.0)      # BRL per share (0 when not held)
+    value = db.Column(db.Float, nullable=False, default=0.0)      # position * price
+
+    # Running totals in BRL (see app.processing.portfolio.PORTFOLIO_COLUMNS)
+    cost = db.Column(db.Float, nullable=False, default=0.0)
+    invested = db.Column(db.Float, nullable=False, default=0.0)   # Liquid cost
+    wages = db.Column(db.Float, nullable=False, default=0.0)
+    taxes = db.Column(db.Float, nullable=False, default=0.0)
+    realized_gain = db.Column(db.Float, nullable=False, default=0.0)
+    not_realized_gain = db.Column(db.Float, nullable=False, default=0.0)
+    capital_gain = db.Column(db.Float, nullable=False, default=0.0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('date', 'source', 'asset', name='uq_portfolio_snapshot_date_source_asset'),
+        db.Index('ix_portfolio_snapshot_source_asset_date', 'source', 'asset', 'date'),
+    )
+
+    def __repr__(self):
+        return f'<PortfolioSnapshot {self.date} {self.source}/{self.asset} {self.value}>'
@@ -0,0 +1,73 @@
+"""Materialized per-asset position ledger.
+
+One `PositionSnapshot` row per (source, asset) holds the running totals of
+every transaction up to `as_of`, so portfolio consolidation only needs the
+row plus the current price. Rows are maintained by
+`app.processing.positions` on import and rebuilt when the asset's ledger
+version (`txn_count`, `last_txn_id`) no longer matches `transaction`.
+"""
+from datetime import datetime
+
+import pandas as pd
+
+from app import db
+
+
+class PositionSnapshot(db.Model):
+    __tablename__ = 'position_snapshot'
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String, nullable=False)
+    asset = db.Column(db.String, nullable=False)
+
+    as_of = db.Column(db.String)                          # Last replayed event 'YYYY-MM-DD'
+    first_buy = db.Column(db.String)
+    last_sell = db.Column(db.String)
+
+    # Running totals (see app.processing.assets.POSITION_STATE_FIELDS)
+    buy_quantity = db.Column(db.Float, nullable=False, default=0.0)
+    buy_cost = db.Column(db.Float, nullable=False, default=0.0)
+    buys_total = db.Column(db.Float, nullable=False, default=0.0)
+    sell_quantity = db.Column(db.Float, nullable=False, default=0.0)
+    sells_total = db.Column(db.Float, nullable=False, default=0.0)
+    wages_sum = db.Column(db.Float, nullable=False, default=0.0)
+    rent_wages_sum = db.Column(db.Float, nullable=False, default=0.0)
+    taxes_sum = db.Column(db.Float, nullable=False, default=0.0)
+    realized_gain = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Derived, stored for direct SQL reads
+    position = db.Column(db.Float, nullable=False, default=0.0)
+    avg_price = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Ledger version the row was computed from
+    txn_count = db.Column(db.Integer, nullable=False, default=0)
+    last_txn_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('source', 'asset', name='uq_position_snapshot_source_asset'),
+    )
+
+    _STATE_FIELDS = (
+        'buy_quantity', 'buy_cost', 'buys_total', 'sell_quantity', 'sells_total',
+        'wages_sum', 'rent_wages_sum', 'taxes_sum', 'realized_gain',
+    )
+
+    def to_state(self):
+        """Return the position state dict consumed by `apply_position_state`."""
+        state = {field: float(getattr(self, field) or 0.0) for field in self._STATE_FIELDS}
+        state['first_buy'] = pd.Timestamp(self.first_buy) if self.first_buy else None
+        state['last_sell'] = pd.Timestamp(self.last_sell) if self.last_sell else None
+        return state
+
+    def set_state(self, state, as_of):
+        for field in self._STATE_FIELDS:
+            setattr(self, field, float(state[field]))
+        self.first_buy = state['first_buy'].strftime('%Y-%m-%d') if state['first_buy'] is not None else None
+        self.last_sell = state['last_sell'].strftime('%Y-%m-%d') if state['last_sell'] is not None else None
+        self.as_of = as_of
+        self.position = round(self.buy_quantity - abs(self.sell_quantity), 8)
+        self.avg_price = self.buy_cost / self.buy_quantity if self.buy_quantity > 0 else 0.0
+
+    def __repr__(self):
+        return f'<PositionSnapshot {self.source}/{self.asset} {self.position}@{self.as_of}>'
@@ -0,0 +1,35 @@
+"""Local daily price history.
+
+One `PriceBar` row per (yfinance ticker, trading date), filled incrementally
+by `app.utils.price_store` so history pages read prices locally instead of
+downloading the full series on every view.
+"""
+from datetime import datetime
+
+from app import db
+
+
+class PriceBar(db.Model):
+    __tablename__ = 'price_bar'
+
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String, nullable=False)         # yfinance symbol, e.g. 'PETR4.SA'
+    date = db.Column(db.String, nullable=False)           # 'YYYY-MM-DD' (exchange date)
+
+    open = db.Column(db.Float)
+    high = db.Column(db.Float)
+    low = db.Column(db.Float)
+    close = db.Column(db.Float)                           # Close (split-adjusted as of the last full fetch)
+    adj_close = db.Column(db.Float)                       # Split/dividend adjusted close
+    volume = db.Column(db.Float)
+    dividends = db.Column(db.Float, nullable=False, default=0.0)
+    stock_splits = db.Column(db.Float, nullable=False, default=0.0)
+
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('ticker', 'date', name='uq_price_bar_ticker_date'),
+    )
+
+    def __repr__(self):
+        return f'<PriceBar {self.ticker} {self.date} {self.close}>'
@@ -16,6 +16,9 @@ class Transaction(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     origin_id = db.Column(db.String, unique=True, index=True)
+    # Row content hash + occurrence ordinal (see import_translators.fingerprint_records);
+    # NULL for manual entries.
+    fingerprint = db.Column(db.String, unique=True, index=True)
 
     # Discriminators
     source = db.Column(db.String, nullable=False)         # 'b3' | 'avenue' | 'generic' | 'manual'
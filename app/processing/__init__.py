@@ -9,6 +9,9 @@ from .prices import (
     _extract_json_object,
     guess_yfinance_ticker_with_gemini,
     get_online_info,
+    yfinance_symbol,
+    prefetch_quotes,
+    load_fundamentals,
 )
 from .extracts import (
     process_b3_movimentation_request,
@@ -18,41 +21,98 @@ from .extracts import (
     process_all_transactions_request,
     merge_movimentation_negotiation,
     calc_avg_price,
+    calc_realized_gains,
 )
 from .assets import (
     consolidate_asset_info,
     process_b3_asset_request,
     process_avenue_asset_request,
     process_generic_asset_request,
+    load_asset_transactions,
+    load_source_transactions,
+    position_state,
+    apply_position_state,
+    build_b3_asset_info,
+    build_avenue_asset_info,
+    build_generic_asset_info,
+    asset_summary,
+    build_asset_dataframes,
+    process_asset_dataframes,
+    load_asset_detail,
+)
+from .asof import AsOfIndex
+from .positions import (
+    ledger_versions,
+    rebuild_position_snapshot,
+    update_position_snapshots,
+    refresh_position_snapshots,
+    load_position_snapshots,
+    position_asset_info,
+    snapshot_asset_info,
 )
 from .consolidate import (
     load_products,
+    load_source_consolidate,
     load_consolidate,
     consolidate_total,
     consolidate_group,
     process_consolidate_request,
 )
 from .history import (
-    plot_price_history,
+    price_history_figure,
     adjust_for_splits,
-    plot_history,
+    history_figure,
     process_history,
+    position_history,
+    HISTORY_COLUMNS,
+    HISTORY_CHART_POINTS,
+)
+from .portfolio import (
+    load_portfolio_positions,
+    value_positions,
+    portfolio_history,
+    discard_portfolio_snapshots,
+    portfolio_snapshots_current,
+    update_portfolio_snapshots,
+    load_portfolio_snapshots,
+    load_portfolio_history,
+    process_portfolio_history,
+    PORTFOLIO_COLUMNS,
 )
 
 __all__ = [
     # prices
     'scrape_dict', '_extract_json_object', 'guess_yfinance_ticker_with_gemini',
-    'get_online_info',
+    'get_online_info', 'yfinance_symbol', 'prefetch_quotes', 'load_fundamentals',
     # extracts
     'process_b3_movimentation_request', 'process_b3_negotiation_request',
     'process_avenue_extract_request', 'process_generic_extract_request',
     'merge_movimentation_negotiation', 'calc_avg_price',
+    'calc_realized_gains',
     # assets
     'consolidate_asset_info', 'process_b3_asset_request',
     'process_avenue_asset_request', 'process_generic_asset_request',
+    'load_asset_transactions', 'load_source_transactions',
+    'position_state', 'apply_position_state',
+    'build_b3_asset_info', 'build_avenue_asset_info', 'build_generic_asset_info',
+    'asset_summary', 'build_asset_dataframes', 'process_asset_dataframes',
+    'load_asset_detail',
+    # asof
+    'AsOfIndex',
+    # positions
+    'ledger_versions', 'rebuild_position_snapshot', 'update_position_snapshots',
+    'refresh_position_snapshots', 'load_position_snapshots', 'position_asset_info',
+    'snapshot_asset_info',
     # consolidate
-    'load_products', 'load_consolidate', 'consolidate_total',
+    'load_products', 'load_source_consolidate',
+    'load_consolidate', 'consolidate_total',
     'consolidate_group', 'process_consolidate_request',
     # history
-    'plot_price_history', 'adjust_for_splits', 'plot_history', 'process_history',
+    'price_history_figure', 'adjust_for_splits', 'history_figure', 'process_history',
+    'position_history', 'HISTORY_COLUMNS', 'HISTORY_CHART_POINTS',
+    # portfolio
+    'load_portfolio_positions', 'value_positions', 'portfolio_history',
+    'discard_portfolio_snapshots', 'portfolio_snapshots_current', 'update_portfolio_snapshots',
+    'load_portfolio_snapshots', 'load_portfolio_history', 'process_portfolio_history',
+    'PORTFOLIO_COLUMNS',
 ]
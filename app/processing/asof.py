@@ -0,0 +1,107 @@
+"""As-of position queries over an asset's classified frames.
+
+`AsOfIndex` sorts each event stream (buys, sells, wages, taxes, rent wages)
+once and keeps prefix sums of every additive field of a position state, so
+the state at any date is one `searchsorted` per stream plus array reads,
+instead of re-masking the frames for every date.
+"""
+import numpy as np
+import pandas as pd
+
+from .extracts import _as_float_array, calc_realized_gains
+
+
+class _EventStream:
+    """Sorted dates of one event frame plus prefix sums of its columns."""
+
+    def __init__(self, df, columns):
+        if df is None or len(df) == 0:
+            self.dates = np.array([], dtype='datetime64[ns]')
+            self.sums = {name: np.zeros(1) for name in columns}
+            return
+
+        dates = pd.to_datetime(df['Date']).to_numpy()
+        keep = ~np.isnat(dates)
+        order = np.argsort(dates[keep], kind='mergesort')
+        self.dates = dates[keep][order]
+        self.sums = {
+            name: np.concatenate(([0.0], np.cumsum(values[keep][order])))
+            for name, values in columns.items()
+        }
+
+    def count(self, dates):
+        """Number of events dated on or before each of `dates`."""
+        return np.searchsorted(self.dates, dates, side='right')
+
+
+class AsOfIndex:
+    """Position state of one asset at arbitrary dates.
+
+    Built once from the classifier frames (`ASSET_CLASSIFIERS`); `state_at()`
+    returns the same state dict as `position_state(dataframes, until_date)`
+    and `states_at()` evaluates many dates at once.
+    """
+
+    def __init__(self, dataframes):
+        buys = dataframes['buys']
+        sells = dataframes['sells']
+
+        buy_quantity = _as_float_array(buys['Quantity'])
+        self.buys = _EventStream(buys, {
+            'buy_quantity': buy_quantity,
+            'buy_cost': buy_quantity * _as_float_array(buys['Price']),
+            'buys_total': _as_float_array(buys['Total']),
+        })
+        # Each sell's gain only depends on the buys dated up to it, so the
+        # gains are computed once and accumulated like any other column.
+        self.sells = _EventStream(sells, {
+            'sell_quantity': _as_float_array(sells['Quantity']),
+            'sells_total': _as_float_array(sells['Total']),
+            'realized_gain': np.asarray(calc_realized_gains(buys, sells), dtype=float),
+        })
+        self.wages = _EventStream(dataframes['wages'], {
+            'wages_sum': _as_float_array(dataframes['wages']['Total']),
+        })
+        self.taxes = _EventStream(dataframes['taxes'], {
+            'taxes_sum': _as_float_array(dataframes['taxes']['Total']),
+        })
+        rent_wages = dataframes.get('rent_wages')
+        self.rent_wages = _EventStream(rent_wages, {
+            'rent_wages_sum': (_as_float_array(rent_wages['Total'])
+                               if rent_wages is not None and len(rent_wages) > 0
+                               else np.zeros(0)),
+        })
+
+    def states_at(self, dates):
+        """Return the position state fields at each of `dates` as arrays.
+
+        `first_buy`/`last_sell` are datetime64 arrays (NaT when none)."""
+        dates = pd.to_datetime(pd.Series(dates)).to_numpy()
+        states = {}
+
+        for stream in (self.buys, self.sells, self.wages, self.taxes, self.rent_wages):
+            count = stream.count(dates)
+            for name, sums in stream.sums.items():
+                states[name] = sums[count]
+
+        buy_count = self.buys.count(dates)
+        first_buy = self.buys.dates[0] if len(self.buys.dates) else np.datetime64('NaT')
+        states['first_buy'] = np.where(buy_count > 0, first_buy, np.datetime64('NaT'))
+
+        sell_count = self.sells.count(dates)
+        last_sell = np.full(len(dates), np.datetime64('NaT'), dtype='datetime64[ns]')
+        has_sell = sell_count > 0
+        last_sell[has_sell] = self.sells.dates[sell_count[has_sell] - 1]
+        states['last_sell'] = last_sell
+
+        return states
+
+    def state_at(self, until_date):
+        """Return the position state dict at `until_date`."""
+        states = self.states_at([until_date])
+        state = {name: float(values[0]) for name, values in states.items()
+                 if name not in ('first_buy', 'last_sell')}
+        for name in ('first_buy', 'last_sell'):
+            value = states[name][0]
+            state[name] = None if np.isnat(value) else pd.Timestamp(value)
+        return state
@@ -4,82 +4,119 @@ from datetime import datetime
 import pandas as pd
 
 from app import app
-from app.models import Transaction, transactions_sql_to_df, category_mapping as cat
+from app.models import Transaction, transactions_sql_to_df, resolve_asset, category_mapping as cat
 from app.utils.memocache import ttl_memoize
 
-from .extracts import calc_avg_price, merge_movimentation_negotiation
+from .extracts import calc_realized_gains, merge_movimentation_negotiation
 
 
-def consolidate_asset_info(dataframes, asset_info, until_date=None, date_close_price=None):
-    # Late import so tests patching `app.processing.get_online_info` take effect.
-    from app import processing
+# Additive fields of a position state; `first_buy` and `last_sell` complete it.
+POSITION_STATE_FIELDS = (
+    'buy_quantity', 'buy_cost', 'buys_total', 'sell_quantity', 'sells_total',
+    'wages_sum', 'rent_wages_sum', 'taxes_sum', 'realized_gain',
+)
 
-    ticker = asset_info['ticker']
 
+def empty_position_state():
+    state = dict.fromkeys(POSITION_STATE_FIELDS, 0.0)
+    state['first_buy'] = None
+    state['last_sell'] = None
+    return state
+
+
+def position_state(dataframes, until_date=None, initial=None):
+    """Aggregate the classified frames into the raw position state at `until_date`.
+
+    `initial` is a state the frames are folded onto (e.g. a stored
+    `PositionSnapshot` when replaying only newer rows). Returns
+    `(state, sells)` where `sells` carries the per-sell `Realized Gain`.
+    """
     if until_date is None:
         until_date = datetime.now()
+    until = pd.to_datetime(until_date)
 
     buys = dataframes['buys']
-    buys = buys.loc[buys['Date'] <= pd.to_datetime(until_date)]
+    buys = buys.loc[buys['Date'] <= until]
 
     sells = dataframes['sells'].copy()
-    sells = sells.loc[sells['Date'] <= pd.to_datetime(until_date)]
+    sells = sells.loc[sells['Date'] <= until]
 
     taxes = dataframes['taxes']
-    taxes = taxes.loc[taxes['Date'] <= pd.to_datetime(until_date)]
+    taxes = taxes.loc[taxes['Date'] <= until]
 
     wages = dataframes['wages']
-    wages = wages.loc[wages['Date'] <= pd.to_datetime(until_date)]
+    wages = wages.loc[wages['Date'] <= until]
+
+    rent_wages = dataframes.get('rent_wages')
+    if rent_wages is not None:
+        rent_wages = rent_wages.loc[rent_wages['Date'] <= until]
+
+    state = dict(initial) if initial is not None else empty_position_state()
+
+    sells['Realized Gain'] = calc_realized_gains(
+        buys, sells, state['buy_quantity'], state['buy_cost'])
+
+    state['buy_quantity'] += buys['Quantity'].sum()
+    state['buy_cost'] += (buys['Quantity'] * buys['Price']).sum()
+    state['buys_total'] += buys['Total'].sum()
+    state['sell_quantity'] += sells['Quantity'].sum()
+    state['sells_total'] += sells['Total'].sum()
+    state['wages_sum'] += wages['Total'].sum()
+    if rent_wages is not None:
+        state['rent_wages_sum'] += rent_wages['Total'].sum()
+    state['taxes_sum'] += taxes['Total'].sum()
+    state['realized_gain'] += sells['Realized Gain'].sum()
+
+    if len(buys) > 0 and state['first_buy'] is None:
+        state['first_buy'] = buys.iloc[0]['Date']
+    if len(sells) > 0:
+        state['last_sell'] = sells.iloc[-1]['Date']
+
+    return state, sells
+
+
+def apply_position_state(asset_info, state, until_date=None, date_close_price=None):
+    """Fill `asset_info` with the KPIs derived from a position state.
+
+    Only the current price is looked up (`get_online_info`, unless
+    `date_close_price` is given, and only while shares are held).
+    """
+    # Late import so tests patching `app.processing.get_online_info` take effect.
+    from app import processing
 
-    rent_wages = None
-    if 'rent_wages' in dataframes:
-        rent_wages = dataframes['rent_wages']
+    ticker = asset_info['ticker']
+
+    if until_date is None:
+        until_date = datetime.now()
 
     last_close_price = 0
 
-    buy_quantity = buys['Quantity'].sum()
-    sell_quantity = abs(sells['Quantity'].sum())
+    buy_quantity = state['buy_quantity']
+    sell_quantity = abs(state['sell_quantity'])
     shares = round(buy_quantity - sell_quantity, 8)  # avoid machine precision errors on zero
 
     last_sell = until_date
-    if shares <= 0 and len(sells) > 0:
-        last_sell = sells.iloc[-1]['Date']
+    if shares <= 0 and state['last_sell'] is not None:
+        last_sell = state['last_sell']
 
-    first_buy = None
+    first_buy = state['first_buy']
     age_years = 0
-    if len(buys) > 0:
-        first_buy = buys.iloc[0]['Date']
+    if first_buy is not None:
         age_years = last_sell - first_buy
         age_years = age_years.days / 365
 
-    cost = (buys['Quantity'] * buys['Price']).sum()
-    avg_price = calc_avg_price(buys)
-
-    wages_sum = wages['Total'].sum()
-    rent_wages_sum = 0
-    if rent_wages is not None:
-        rent_wages_sum = rent_wages['Total'].sum()
+    cost = state['buy_cost']
+    avg_price = cost / buy_quantity if buy_quantity > 0 else 0
 
-    taxes_sum = taxes['Total'].sum()
+    wages_sum = state['wages_sum']
+    rent_wages_sum = state['rent_wages_sum']
+    taxes_sum = state['taxes_sum']
 
     liquid_cost = cost - wages_sum - rent_wages_sum + taxes_sum
 
-    sells_sum = abs(sells['Total'].sum())
+    sells_sum = abs(state['sells_total'])
 
-    realized_gain = 0
-    sells['Realized Gain'] = 0.0
-    for index, row in sells.iterrows():
-        date = row['Date']
-        quantity = abs(row['Quantity'])
-        price = row['Price']
-
-        buys_before_sell = buys.loc[buys['Date'] <= date]
-        last_avg_price = calc_avg_price(buys_before_sell)
-        realized = (price - last_avg_price) * quantity
-
-        sells.loc[index, 'Realized Gain'] = realized
-
-    realized_gain = sells['Realized Gain'].sum()
+    realized_gain = state['realized_gain']
 
     asset_info['last_close_price'] = 0
     asset_info.setdefault('last_close_variation', 0)
@@ -110,7 +147,7 @@ def consolidate_asset_info(dataframes, asset_info, until_date=None, date_close_p
 
     rented = 0  # TODO calc rented shares from b3 movimentation data
 
-    buys_value_sum = buys['Total'].sum()
+    buys_value_sum = state['buys_total']
 
     position_total = 0
     price_gain = -100
@@ -155,27 +192,33 @@ def consolidate_asset_info(dataframes, asset_info, until_date=None, date_close_p
 
     asset_info['valid'] = True
 
+    return asset_info
+
+
+def consolidate_asset_info(dataframes, asset_info, until_date=None, date_close_price=None):
+    if until_date is None:
+        until_date = datetime.now()
+
+    state, sells = position_state(dataframes, until_date)
+    apply_position_state(asset_info, state, until_date, date_close_price)
+
     dataframes['sells'] = sells
 
     return asset_info
 
 
-@ttl_memoize('asset')
-def process_b3_asset_request(asset):
-    app.logger.info('Processing view asset request for %s.', asset)
-
+def classify_b3_asset(asset, transactions_df):
+    """Split one B3 asset's movimentation + negotiation rows into the
+    buys/sells/taxes/wages/rent_wages frames. Returns `(ticker, dataframes)`.
+    """
     columns = ['Date', 'Movimentation', 'Quantity', 'Price', 'Total', "Produto", 'Asset']
 
-    asset_info = {'valid': False, 'name': asset, 'source': 'b3'}
     dataframes = {}
     ticker = asset
 
-    base = Transaction.query.filter_by(source='b3').filter(
-        (Transaction.asset.like(f'%{asset}%')) | (Transaction.product.like(f'%{asset}%'))
-    ).order_by(Transaction.date.asc())
-
-    mov_rows = base.filter_by(record_type='movimentation').all()
-    movimentation_df = transactions_sql_to_df(mov_rows)
+    record_type = transactions_df['RecordType']
+    movimentation_df = transactions_df.loc[record_type == 'movimentation'].reset_index(drop=True)
+    negotiation_df = transactions_df.loc[record_type == 'negotiation'].reset_index(drop=True)
 
     empty_cols = pd.DataFrame(columns=columns)
     if len(movimentation_df) > 0:
@@ -193,8 +236,6 @@ def process_b3_asset_request(asset):
 
     dataframes['movimentation'] = movimentation_df
 
-    neg_rows = base.filter_by(record_type='negotiation').all()
-    negotiation_df = transactions_sql_to_df(neg_rows)
     if len(negotiation_df) > 0:
         non_empty = negotiation_df[negotiation_df['Asset'] != '']
         if len(non_empty) > 0:
@@ -208,13 +249,9 @@ def process_b3_asset_request(asset):
         negotiation_sells = empty_cols
 
     dataframes['negotiation'] = negotiation_df
-    asset_info['ticker'] = ticker
 
-    buys = merge_movimentation_negotiation(buys, negotiation_buys, 'Compra')
-    sells = merge_movimentation_negotiation(sells, negotiation_sells, 'Venda')
-
-    dataframes['buys'] = buys
-    dataframes['sells'] = sells
+    dataframes['buys'] = merge_movimentation_negotiation(buys, negotiation_buys, 'Compra')
+    dataframes['sells'] = merge_movimentation_negotiation(sells, negotiation_sells, 'Venda')
 
     if len(movimentation_df) > 0:
         taxes = movimentation_df.loc[movimentation_df['Category'] == cat.TAX]
@@ -233,71 +270,199 @@ def process_b3_asset_request(asset):
     dataframes['wages'] = wages
     dataframes['rent_wages'] = rents_wage
 
-    consolidate_asset_info(dataframes, asset_info)
-    asset_info['dataframes'] = dataframes
-    return asset_info
+    return ticker, dataframes
 
 
-@ttl_memoize('asset')
-def process_avenue_asset_request(asset):
-    app.logger.info('Processing view_extract_asset_request for "%s".', asset)
-
-    asset_info = {'valid': False, 'name': asset, 'source': 'avenue'}
+def classify_avenue_asset(asset, transactions_df):
+    """Split one Avenue asset's extract rows. Returns `(ticker, dataframes)`."""
     dataframes = {}
 
-    rows = Transaction.query.filter_by(source='avenue').filter(
-        (Transaction.asset.like(f'%{asset}%')) | (Transaction.product.like(f'%{asset}%'))
-    ).order_by(Transaction.date.asc()).all()
-    extract_df = transactions_sql_to_df(rows)
-    if len(extract_df) == 0:
-        app.logger.warning('Extract data not found for %s', asset)
-        return asset_info
-
+    extract_df = transactions_df.reset_index(drop=True)
     extract_df['Total'] = extract_df['Total'].abs()
     dataframes['movimentation'] = extract_df
 
     non_empty = extract_df[extract_df['Asset'] != '']
     ticker = non_empty['Asset'].value_counts().index[0] if len(non_empty) > 0 else asset
-    asset_info['ticker'] = ticker
 
     dataframes['buys'] = extract_df.loc[extract_df['Category'].isin([cat.BUY, cat.SPLIT])]
     dataframes['sells'] = extract_df.loc[extract_df['Category'] == cat.SELL]
     dataframes['taxes'] = extract_df.loc[extract_df['Category'].isin([cat.TAX, cat.FEE])]
     dataframes['wages'] = extract_df.loc[extract_df['Category'] == cat.DIVIDEND]
 
-    consolidate_asset_info(dataframes, asset_info)
-    asset_info['currency'] = 'USD'
-
-    asset_info['dataframes'] = dataframes
-    return asset_info
-
+    return ticker, dataframes
 
-@ttl_memoize('asset')
-def process_generic_asset_request(asset):
-    app.logger.info('Processing view_generic_asset_request for %s.', asset)
 
-    asset_info = {'valid': False, 'name': asset, 'source': 'generic'}
+def classify_generic_asset(asset, transactions_df):
+    """Split one generic asset's extract rows. Returns `(ticker, dataframes)`."""
     dataframes = {}
 
-    rows = Transaction.query.filter_by(source='generic').filter(
-        Transaction.asset.like(f'%{asset}%')
-    ).order_by(Transaction.date.asc()).all()
-    extract_df = transactions_sql_to_df(rows)
-    if len(extract_df) == 0:
-        app.logger.warning('Extract data not found for %s', asset)
-        return asset_info
-
+    extract_df = transactions_df.reset_index(drop=True)
     dataframes['movimentation'] = extract_df
 
     non_empty = extract_df[extract_df['Asset'] != '']
     ticker = non_empty['Asset'].value_counts().index[0] if len(non_empty) > 0 else asset
-    asset_info['ticker'] = ticker
 
     dataframes['buys'] = extract_df.loc[extract_df['Category'] == cat.BUY]
     dataframes['sells'] = extract_df.loc[extract_df['Category'] == cat.SELL]
     dataframes['taxes'] = extract_df.loc[extract_df['Category'] == cat.TAX]
     dataframes['wages'] = extract_df.loc[extract_df['Category'] == cat.DIVIDEND]
 
+    return ticker, dataframes
+
+
+# source -> classifier, shared by the asset builders and the position
+# snapshot replay (app.processing.positions).
+ASSET_CLASSIFIERS = {
+    'b3': classify_b3_asset,
+    'avenue': classify_avenue_asset,
+    'generic': classify_generic_asset,
+}
+
+
+def build_b3_asset_info(asset, transactions_df):
+    """Classify one B3 asset's movimentation + negotiation rows and consolidate.
+
+    `transactions_df` is the `transactions_sql_to_df` frame holding every
+    row of the asset (both record types); it may come from a per-asset
+    query or from a group of the single-scan portfolio loader.
+    """
+    asset_info = {'valid': False, 'name': asset, 'source': 'b3'}
+
+    ticker, dataframes = classify_b3_asset(asset, transactions_df)
+    asset_info['ticker'] = ticker
+
+    consolidate_asset_info(dataframes, asset_info)
+    asset_info['dataframes'] = dataframes
+    return asset_info
+
+
+def build_avenue_asset_info(asset, transactions_df):
+    """Classify one Avenue asset's extract rows and consolidate."""
+    asset_info = {'valid': False, 'name': asset, 'source': 'avenue'}
+
+    if len(transactions_df) == 0:
+        app.logger.warning('Extract data not found for %s', asset)
+        return asset_info
+
+    ticker, dataframes = classify_avenue_asset(asset, transactions_df)
+    asset_info['ticker'] = ticker
+
+    consolidate_asset_info(dataframes, asset_info)
+    asset_info['currency'] = 'USD'
+
+    asset_info['dataframes'] = dataframes
+    return asset_info
+
+
+def build_generic_asset_info(asset, transactions_df):
+    """Classify one generic asset's extract rows and consolidate."""
+    asset_info = {'valid': False, 'name': asset, 'source': 'generic'}
+
+    if len(transactions_df) == 0:
+        app.logger.warning('Extract data not found for %s', asset)
+        return asset_info
+
+    ticker, dataframes = classify_generic_asset(asset, transactions_df)
+    asset_info['ticker'] = ticker
+
     consolidate_asset_info(dataframes, asset_info)
     asset_info['dataframes'] = dataframes
     return asset_info
+
+
+# source -> per-asset builder, shared by the per-asset views and the
+# single-scan portfolio loader.
+ASSET_BUILDERS = {
+    'b3': build_b3_asset_info,
+    'avenue': build_avenue_asset_info,
+    'generic': build_generic_asset_info,
+}
+
+
+def load_asset_transactions(source, asset):
+    """Return the canonical asset name for `asset` and its rows as a DataFrame.
+
+    `asset` may be the canonical ticker or any registered alias (product
+    string, fractional code). Rows are fetched with an exact `(source, asset)`
+    match, served by `ix_transaction_source_asset_date`.
+    """
+    canonical = resolve_asset(source, asset)
+    rows = Transaction.query.filter_by(source=source, asset=canonical).order_by(
+        Transaction.date.asc()).all()
+    return canonical, transactions_sql_to_df(rows)
+
+
+def load_source_transactions(source, assets=None):
+    """Read a source's `Transaction` rows in one scan, grouped by asset.
+
+    Returns a dict {asset: DataFrame} built from a single
+    `transactions_sql_to_df` call; rows without an asset are dropped.
+    Groups are keyed on the exact `Transaction.asset`, so variant names must
+    be mapped through `asset_alias` (see `resolve_asset`), not matched
+    fuzzily. `assets` restricts the scan to those canonical assets.
+    """
+    query = Transaction.query.filter_by(source=source)
+    if assets is not None:
+        query = query.filter(Transaction.asset.in_(list(assets)))
+    rows = query.order_by(Transaction.date.asc()).all()
+    df = transactions_sql_to_df(rows)
+    df = df[df['Asset'] != '']
+    return {asset: group for asset, group in df.groupby('Asset', sort=False)}
+
+
+# Heavy keys kept out of the memoized summaries: the detail frames are
+# cached on their own (`process_asset_dataframes`) and the yfinance
+# fundamentals are loaded on demand (`load_fundamentals`).
+_DETAIL_KEYS = ('dataframes', 'info')
+
+
+def asset_summary(asset_info):
+    """Return the compact summary of `asset_info`, without detail frames."""
+    return {key: value for key, value in asset_info.items() if key not in _DETAIL_KEYS}
+
+
+def build_asset_dataframes(source, asset, transactions_df):
+    """Classify one asset's rows into the detail frames of the asset page.
+
+    Same frames as the `build_*_asset_info` builders, with the per-sell
+    `Realized Gain`, but no quote lookup.
+    """
+    _, dataframes = ASSET_CLASSIFIERS[source](asset, transactions_df)
+    _, dataframes['sells'] = position_state(dataframes)
+    return dataframes
+
+
+@ttl_memoize('asset_detail')
+def process_asset_dataframes(source, asset):
+    app.logger.info('Processing asset detail request for %s/%s.', source, asset)
+    asset, transactions_df = load_asset_transactions(source, asset)
+    return build_asset_dataframes(source, asset, transactions_df)
+
+
+def load_asset_detail(asset_info):
+    """Attach the detail frames to an asset summary, on demand."""
+    if 'dataframes' not in asset_info:
+        asset_info['dataframes'] = process_asset_dataframes(
+            asset_info['source'], asset_info['name'])
+    return asset_info
+
+
+@ttl_memoize('asset')
+def process_b3_asset_request(asset):
+    app.logger.info('Processing view asset request for %s.', asset)
+    asset, transactions_df = load_asset_transactions('b3', asset)
+    return asset_summary(build_b3_asset_info(asset, transactions_df))
+
+
+@ttl_memoize('asset')
+def process_avenue_asset_request(asset):
+    app.logger.info('Processing view_extract_asset_request for "%s".', asset)
+    asset, transactions_df = load_asset_transactions('avenue', asset)
+    return asset_summary(build_avenue_asset_info(asset, transactions_df))
+
+
+@ttl_memoize('asset')
+def process_generic_asset_request(asset):
+    app.logger.info('Processing view_generic_asset_request for %s.', asset)
+    asset, transactions_df = load_asset_transactions('generic', asset)
+    return asset_summary(build_generic_asset_info(asset, transactions_df))
@@ -1,4 +1,13 @@
-"""Portfolio-wide consolidation across all sources."""
+"""Portfolio-wide consolidation across all sources.
+
+Rows are grouped by their exact canonical `Transaction.asset`; the old
+per-ticker `LIKE '%asset%'` match on asset and product is gone. Product
+strings, negotiation codes and fractional codes (ITSA4F) reach their
+ticker through the `asset_alias` table instead (`register_asset_aliases`
+at import time, `resolve_asset` on lookup, see `app/models/assets.py`).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 
 from app import app
@@ -6,11 +15,9 @@ from app.models import Transaction
 from app.utils.memocache import ttl_memoize
 from app.utils.scraping import usd_exchange_rate
 
-from .assets import (
-    process_b3_asset_request,
-    process_avenue_asset_request,
-    process_generic_asset_request,
-)
+from .assets import asset_summary
+from .positions import load_position_snapshots, position_asset_info
+from .prices import prefetch_quotes
 
 
 def load_products(source):
@@ -20,19 +27,84 @@ def load_products(source):
     return [r[0] for r in rows if r[0]]
 
 
-def load_consolidate(asset_list, process_asset_func, source):
-    consolidate = pd.DataFrame()
-    if len(asset_list) <= 0:
-        return consolidate
+def _held_tickers(states):
+    return [asset for asset, state in states.items()
+            if round(state['buy_quantity'] - abs(state['sell_quantity']), 8) > 0]
 
-    for asset in asset_list:
-        if asset == '':
-            continue
+
+def load_source_states(source):
+    """Return {asset: position state} of a source, detached from the session."""
+    return {s.asset: s.to_state() for s in load_position_snapshots(source)}
+
+
+def load_source_consolidate(source, errors=None, states=None):
+    """Consolidate every asset of a source from its position snapshots.
+
+    Each asset costs one stored `PositionSnapshot` row plus its current
+    price; stale snapshots are rebuilt from a single grouped scan first.
+    Prices of the held assets are prefetched in one batched download (skipped
+    when the caller passes `states` it already prefetched), then read on the
+    `WALLET_QUOTE_WORKERS` pool.
+    """
+    if states is None:
+        # Detach the states from the session before handing them to workers.
+        states = load_source_states(source)
+        prefetch_quotes(_held_tickers(states))
+    return load_consolidate(
+        list(states),
+        lambda asset: position_asset_info(source, asset, states[asset]),
+        source,
+        workers=app.config.get('WALLET_QUOTE_WORKERS', 1),
+        errors=errors,
+    )
+
+
+def _process_asset(process_asset_func, asset):
+    """Run one asset, returning `(asset_info, error_message)`."""
+    try:
         asset_info = process_asset_func(asset)
-        if not asset_info.get('valid'):
+    except Exception as e:
+        app.logger.exception('Failed to consolidate %s', asset)
+        return None, f'Failed to consolidate {asset}: {e}'
+    return asset_info, asset_info.pop('quote_error', None)
+
+
+def _process_asset_in_app_context(process_asset_func, asset):
+    with app.app_context():
+        return _process_asset(process_asset_func, asset)
+
+
+def load_consolidate(asset_list, process_asset_func, source, workers=1, errors=None):
+    """Build the consolidate frame of `asset_list`, in input order.
+
+    With `workers > 1` assets run on a bounded thread pool, each inside its
+    own app context, so their quote fetches overlap. Per-asset failures are
+    logged, appended to `errors` (rendered by the consolidate views) and the
+    asset is skipped.
+    """
+    assets = [asset for asset in asset_list if asset != '']
+
+    if workers and workers > 1 and len(assets) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(assets)),
+                                thread_name_prefix='consolidate') as executor:
+            results = list(executor.map(
+                lambda asset: _process_asset_in_app_context(process_asset_func, asset),
+                assets,
+            ))
+    else:
+        results = [_process_asset(process_asset_func, asset) for asset in assets]
+
+    rows = []
+    for asset_info, error in results:
+        if error is not None and errors is not None:
+            errors.append(error)
+        if asset_info is None or not asset_info.get('valid'):
             continue
-        new_row = pd.DataFrame([asset_info])
-        consolidate = pd.concat([consolidate, new_row], ignore_index=True)
+        rows.append(asset_summary(asset_info))
+
+    consolidate = pd.DataFrame(rows)
+    if consolidate.empty:
+        return consolidate
 
     consolidate['url'] = consolidate['name'].apply(
         lambda x: f"<a href='/view/{source}/{x}' target='_blank'>Details</a> <a href='/history/{source}/{x}' target='_blank'>History</a>")
@@ -96,17 +168,15 @@ def process_consolidate_request():
     ret = {}
     ret['valid'] = False
 
-    products_neg = load_products('b3')
-    b3_products = list(set(products_neg))
-    b3_consolidate = load_consolidate(b3_products, process_b3_asset_request, 'b3')
-
-    avenue_products = load_products('avenue')
-    avenue_consolidate = load_consolidate(avenue_products,
-                                          process_avenue_asset_request, 'avenue')
-
-    generic_products = load_products('generic')
-    generic_consolidate = load_consolidate(generic_products,
-                                           process_generic_asset_request, 'generic')
+    errors = []
+    states = {source: load_source_states(source) for source in ('b3', 'avenue', 'generic')}
+    # One batched quote download for every held asset of every source.
+    prefetch_quotes([ticker for source_states in states.values()
+                     for ticker in _held_tickers(source_states)])
+    b3_consolidate = load_source_consolidate('b3', errors, states['b3'])
+    avenue_consolidate = load_source_consolidate('avenue', errors, states['avenue'])
+    generic_consolidate = load_source_consolidate('generic', errors, states['generic'])
+    ret['errors'] = errors
 
     consolidate = pd.concat([b3_consolidate, avenue_consolidate, generic_consolidate])
     if len(consolidate) == 0:
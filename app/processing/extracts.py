@@ -1,4 +1,5 @@
 """DB → DataFrame request handlers and shared transforms."""
+import numpy as np
 import pandas as pd
 
 from app import app, db
@@ -133,3 +134,45 @@ def calc_avg_price(df):
     cost = (df['Quantity'] * df['Price']).sum()
     avg_price = cost / quantity if quantity > 0 else 0
     return avg_price
+
+
+def _as_float_array(column):
+    return pd.to_numeric(column, errors='coerce').fillna(0.0).to_numpy(dtype=float)
+
+
+def calc_realized_gains(buys, sells, initial_quantity=0.0, initial_cost=0.0):
+    """Realized gain of every sell against the average buy price up to its date.
+
+    Equivalent to running `calc_avg_price` on the buys dated on or before each
+    sell, but done in a single pass: buys are sorted once, cumulative quantity
+    and cost arrays are built, and each sell finds its cut-off with
+    `searchsorted`. `initial_quantity`/`initial_cost` seed the cumulative
+    arrays with buys already folded into a stored position. Returns an array
+    aligned with `sells`' rows.
+    """
+    if len(sells) == 0:
+        return np.zeros(0)
+
+    sell_dates = pd.to_datetime(sells['Date']).to_numpy()
+    sell_quantity = np.abs(_as_float_array(sells['Quantity']))
+    sell_price = _as_float_array(sells['Price'])
+
+    if len(buys) == 0:
+        avg_price = initial_cost / initial_quantity if initial_quantity > 0 else 0
+        return (sell_price - avg_price) * sell_quantity
+
+    ordered = buys.sort_values(by='Date', kind='mergesort')
+    buy_dates = pd.to_datetime(ordered['Date']).to_numpy()
+    buy_quantity = _as_float_array(ordered['Quantity'])
+    buy_price = _as_float_array(ordered['Price'])
+
+    cum_quantity = initial_quantity + np.concatenate(([0.0], np.cumsum(buy_quantity)))
+    cum_cost = initial_cost + np.concatenate(([0.0], np.cumsum(buy_quantity * buy_price)))
+
+    # Buys dated on or before the sell count towards its average price.
+    idx = np.searchsorted(buy_dates, sell_dates, side='right')
+    quantity = cum_quantity[idx]
+    cost = cum_cost[idx]
+    avg_price = np.divide(cost, quantity, out=np.zeros_like(cost), where=quantity > 0)
+
+    return (sell_price - avg_price) * sell_quantity
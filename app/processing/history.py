@@ -4,21 +4,25 @@ from datetime import datetime
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.offline as pyo
-import yfinance as yf
 
 from app import app
-from app.utils.scraping import usd_exchange_rate
+from app.utils.downsample import lttb, window
+from app.utils.fx import FX_SYMBOLS, fx_at
+from app.utils.memocache import ttl_memoize
+from app.utils.price_store import last_bar, load_price_history, sync_price_history
 
+from .asof import AsOfIndex
+from .positions import ledger_versions
 from .assets import (
-    consolidate_asset_info,
+    load_asset_detail,
     process_b3_asset_request,
     process_avenue_asset_request,
     process_generic_asset_request,
 )
 
 
-def plot_price_history(asset_info):
+def price_history_figure(asset_info):
+    """Candlestick + moving averages of the asset's held period, or None."""
     if 'info' not in asset_info:
         return None
 
@@ -26,8 +30,7 @@ def plot_price_history(asset_info):
     if 'symbol' not in info:
         return None
 
-    stock = yf.Ticker(asset_info['info']['symbol'])
-    df = stock.history(start=asset_info['first_buy'], end=asset_info['last_sell'], auto_adjust=False)
+    df = load_price_history(info['symbol'], asset_info['first_buy'], asset_info.get('last_sell'))
     if df is None or df.empty:
         return None
 
@@ -55,104 +58,75 @@ def plot_price_history(asset_info):
     fig.update_layout()
     fig.update_yaxes(autorange=True, fixedrange=False)
 
-    graph_html = pyo.plot(fig, output_type='div')
+    return fig
 
-    return graph_html
 
+def adjust_for_splits(df, adjust_ohlc=False):
+    """Back-adjust historical Close prices for stock splits.
 
-def adjust_for_splits(df):
-    """Back-adjust historical Close prices for stock splits."""
-    adjustment_factor = 1.0
+    Every row is divided by the product of the split factors of the rows
+    after it (a reverse cumulative product shifted by one row), so the split
+    day itself is left as is. Missing or zero factors count as no split.
+    With `adjust_ohlc`, Open/High/Low are adjusted the same way.
+    """
+    splits = pd.to_numeric(df['Stock Splits'], errors='coerce').to_numpy(dtype=float)
+    splits = np.where(np.isnan(splits) | (splits == 0), 1.0, splits)
 
-    for index in reversed(df.index):
-        if adjustment_factor != 1.0:
-            df.at[index, 'Close'] = df.at[index, 'Close'] / adjustment_factor
+    factor = np.ones(len(splits))
+    factor[:-1] = np.cumprod(splits[::-1])[::-1][1:]
 
-        split = df.at[index, 'Stock Splits']
-        if split and split != 0:
-            adjustment_factor *= split
+    columns = ['Close']
+    if adjust_ohlc:
+        columns += [c for c in ('Open', 'High', 'Low') if c in df.columns]
+    for column in columns:
+        df[column] = df[column] / factor
 
     return df
 
 
-def plot_history(asset_info, history_df):
+# (column, name, color, yaxis, extra) of each history chart trace.
+HISTORY_TRACES = [
+    ('rentability', 'Rentability', 'darkblue', 'y1', {}),
+    ('anualized_rentability', 'Rentability/yr.', 'blue', 'y1', {}),
+    ('slope', 'Rent. Slope', 'lightblue', 'y1', {'fill': 'tozeroy'}),
+    ('position_total', 'Position', 'darkgreen', 'y2', {}),
+    ('liquid_cost', 'Liquid Cost', 'green', 'y2', {}),
+    ('wages_sum', 'Wages', 'lightgreen', 'y2', {}),
+    ('capital_gain', 'Capital Gain', 'lime', 'y2', {}),
+    ('position', 'Quantity', 'cyan', 'y2', {}),
+    ('last_close_price', 'Close Price', 'red', 'y2', {}),
+    ('avg_price', 'Average Price', 'magenta', 'y2', {}),
+]
+
+# Default point budget per history trace.
+HISTORY_CHART_POINTS = 1000
+
+
+def history_figure(asset_info, history_df, max_points=HISTORY_CHART_POINTS, start=None, end=None,
+                   traces=HISTORY_TRACES):
+    """Rentability/position chart of a `position_history` frame, or None.
+
+    Only the rows within [start, end] are drawn, and each trace is reduced
+    to at most `max_points` points with LTTB (None draws every point).
+    `traces` lists the plotted columns, as in `HISTORY_TRACES`."""
     if history_df is None or history_df.empty:
-        return [""]
+        return None
+    history_df = window(history_df, 'date', start, end).sort_values('date')
+    if history_df.empty:
+        return None
     currency = asset_info.get('currency', 'BRL')
+    dates = history_df['date'].to_numpy()
     fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        name='Rentability',
-        x=history_df['date'],
-        y=history_df['rentability'],
-        line={'color': 'darkblue', 'width': 1},
-        yaxis='y1',
-    ))
-    fig.add_trace(go.Scatter(
-        name='Rentability/yr.',
-        x=history_df['date'],
-        y=history_df['anualized_rentability'],
-        line={'color': 'blue', 'width': 1},
-        yaxis='y1',
-    ))
-    fig.add_trace(go.Scatter(
-        name='Rent. Slope',
-        x=history_df['date'],
-        y=history_df['slope'],
-        line={'color': 'lightblue', 'width': 1},
-        yaxis='y1',
-        fill='tozeroy',
-    ))
-
-    fig.add_trace(go.Scatter(
-        name='Position',
-        x=history_df['date'],
-        y=history_df['position_total'],
-        line={'color': 'darkgreen', 'width': 1},
-        yaxis='y2',
-    ))
-    fig.add_trace(go.Scatter(
-        x=history_df['date'],
-        y=history_df['liquid_cost'],
-        line={'color': 'green', 'width': 1},
-        name='Liquid Cost',
-        yaxis='y2',
-    ))
-    fig.add_trace(go.Scatter(
-        name='Wages',
-        x=history_df['date'],
-        y=history_df['wages_sum'],
-        line={'color': 'lightgreen', 'width': 1},
-        yaxis='y2',
-    ))
-    fig.add_trace(go.Scatter(
-        name='Capital Gain',
-        x=history_df['date'],
-        y=history_df['capital_gain'],
-        line={'color': 'lime', 'width': 1},
-        yaxis='y2',
-    ))
-    fig.add_trace(go.Scatter(
-        name='Quantity',
-        x=history_df['date'],
-        y=history_df['position'],
-        line={'color': 'cyan', 'width': 1},
-        yaxis='y2',
-    ))
-
-    fig.add_trace(go.Scatter(
-        x=history_df['date'],
-        y=history_df['last_close_price'],
-        line={'color': 'red', 'width': 1},
-        name='Close Price',
-        yaxis='y2',
-    ))
-    fig.add_trace(go.Scatter(
-        x=history_df['date'],
-        y=history_df['avg_price'],
-        line={'color': 'magenta', 'width': 1},
-        name='Average Price',
-        yaxis='y2',
-    ))
+    for column, name, color, yaxis, extra in traces:
+        x, y = lttb(dates, history_df[column].to_numpy(dtype=float), max_points)
+        fig.add_trace(go.Scatter(
+            name=name,
+            x=x,
+            y=y,
+            line={'color': color, 'width': 1},
+            yaxis=yaxis,
+            **extra,
+        ))
 
     rangeselector = dict(
         buttons=list([
@@ -183,97 +157,186 @@ def plot_history(asset_info, history_df):
                       height=800)
     fig.update_yaxes(autorange=True, fixedrange=False)
 
-    fig1 = pyo.plot(fig, output_type='div')
+    return fig
+
+
+# Columns of the history table, in display order.
+HISTORY_COLUMNS = ['date', 'last_close_price', 'avg_price', 'position', 'position_total', 'cost',
+                   'wages_sum', 'liquid_cost', 'capital_gain', 'rentability', 'slope',
+                   'anualized_rentability', 'age', 'position_slope']
+
+
+def position_history(dataframes, close, step=1):
+    """Evaluate an asset's KPIs on its daily close series, as columns.
+
+    Samples every `step`-th close counting back from the latest one (the
+    oldest close is skipped) and returns them newest first. The position
+    state at every sampled date comes from one `AsOfIndex.states_at()`
+    call; the KPIs follow `apply_position_state` with the close as price.
+    """
+    if close is None or len(close) < 2:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    positions = np.arange(len(close) - 1, 0, -step)
+    dates = pd.DatetimeIndex(close.index[positions])
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    dates = dates.normalize()
+    price = np.round(close.to_numpy(dtype=float)[positions], 2)
+
+    state = AsOfIndex(dataframes).states_at(dates)
+    buy_quantity = state['buy_quantity']
+    shares = np.round(buy_quantity - np.abs(state['sell_quantity']), 8)
+    held = shares > 0
+
+    # Sold-out points age up to the last sell instead of the sample date.
+    date_values = dates.to_numpy()
+    last_sell = np.where(~held & ~np.isnat(state['last_sell']), state['last_sell'], date_values)
+    age_days = np.floor((last_sell - state['first_buy']) / np.timedelta64(1, 'D'))
+    age_days = np.nan_to_num(age_days, nan=0.0)
+    age_years = age_days / 365
+
+    cost = state['buy_cost']
+    avg_price = np.divide(cost, buy_quantity, out=np.zeros_like(cost), where=buy_quantity > 0)
+    wages_sum = state['wages_sum']
+    rent_wages_sum = state['rent_wages_sum']
+    liquid_cost = cost - wages_sum - rent_wages_sum + state['taxes_sum']
+
+    last_close_price = np.where(held, price, 0.0)
+    not_realized_gain = (last_close_price - avg_price) * shares
+    capital_gain = state['realized_gain'] + not_realized_gain + wages_sum + rent_wages_sum
+    rentability = np.divide(capital_gain, liquid_cost, out=np.zeros_like(capital_gain),
+                            where=liquid_cost > 0)
+
+    anualized_rentability = np.zeros_like(rentability)
+    mature = age_years >= 1.0
+    with np.errstate(invalid='ignore'):
+        anualized_rentability[mature] = (
+            (1 + rentability[mature]) ** (1 / age_years[mature]) - 1)
+
+    history = pd.DataFrame({
+        'date': dates,
+        'last_close_price': last_close_price,
+        'avg_price': np.round(avg_price, 2),
+        'position': shares,
+        'position_total': np.round(np.where(held, shares * last_close_price, 0.0), 2),
+        'cost': np.round(cost, 2),
+        'wages_sum': np.round(wages_sum, 2),
+        'rent_wages_sum': np.round(rent_wages_sum, 2),
+        'taxes_sum': np.round(state['taxes_sum'], 2),
+        'liquid_cost': np.round(liquid_cost, 2),
+        'realized_gain': np.round(state['realized_gain'], 2),
+        'not_realized_gain': np.round(not_realized_gain, 2),
+        'capital_gain': np.round(capital_gain, 2),
+        'rentability': np.round(100 * rentability, 2),
+        'anualized_rentability': np.round(100 * anualized_rentability, 2),
+        'age': age_days,
+    })
 
-    return [fig1]
+    if len(history) >= 2:
+        history['slope'] = -np.gradient(history['rentability']).round(2)
+        history['position_slope'] = -np.gradient(history['position_total']).round(2)
+    else:
+        history['slope'] = 0
+        history['position_slope'] = 0
 
+    return history
 
-def process_history(asset=None, source=None):
-    # Late import so tests patching `app.processing.get_online_info` take effect.
-    from app import processing
 
-    app.logger.info('process_history')
+def _process_asset_request(source, asset):
+    if source == 'b3':
+        return process_b3_asset_request(asset)
+    if source == 'avenue':
+        return process_avenue_asset_request(asset)
+    if source == 'generic':
+        return process_generic_asset_request(asset)
+    return {}
 
-    ret = {}
-    ret['valid'] = False
 
-    asset_info = {}
+# Assets priced in USD and converted to BRL with the daily FX series.
+_USD_PRICED = ('BTC', 'ETH')
 
-    if source == 'b3':
-        asset_info = process_b3_asset_request(asset)
-    elif source == 'avenue':
-        asset_info = process_avenue_asset_request(asset)
-    elif source == 'generic':
-        asset_info = process_generic_asset_request(asset)
-
-    # Ensure required fields
-    if 'first_buy' not in asset_info or not asset_info['first_buy']:
-        ret['history'] = pd.DataFrame()
-        ret['consolidate'] = pd.DataFrame()
-        ret['plots'] = []
-        ret['valid'] = True
-        return ret
 
-    if 'yfinance_ticker' not in asset_info:
-        try:
-            processing.get_online_info(asset_info.get('ticker', asset), asset_info)
-        except Exception as e:
-            app.logger.warning('Could not enrich ticker for history: %s', e)
-
-    ticker = asset_info.get('yfinance_ticker', asset_info.get('ticker', asset))
+@ttl_memoize('history')
+def _history_series(source, asset, ticker, step, ledger_version, price_version, fx_version=None):
+    """Compute the history frame of an asset. `ledger_version`,
+    `price_version` and `fx_version` are only part of the cache key: a new
+    trade, or a new or rewritten last price/FX bar, misses the cache."""
+    app.logger.info('Computing history for %s/%s (%s, last bar %s)', source, asset, ticker, price_version)
+    asset_info = load_asset_detail(_process_asset_request(source, asset))
     start_date = datetime.fromisoformat(asset_info['first_buy'])
-    history = pd.DataFrame()
 
     try:
-        stock = yf.Ticker(ticker)
-        data = stock.history(start=start_date, auto_adjust=False)
+        data = load_price_history(ticker, start_date, sync=False)
     except Exception as e:
-        app.logger.error('Error fetching history for %s: %s', ticker, e)
+        app.logger.error('Error reading history for %s: %s', ticker, e)
         data = pd.DataFrame()
 
     if not data.empty and 'Stock Splits' in data.columns:
         data = adjust_for_splits(data)
 
-    if not data.empty and asset_info['name'] in ['BTC', 'ETH']:
-        usdbrl = usd_exchange_rate()
-        if usdbrl:
-            data['Close'] *= usdbrl
+    if not data.empty and asset_info['name'] in _USD_PRICED:
+        data['Close'] *= fx_at(data.index, sync=False)
 
-    step = 5
-    for index in range(len(data) - 1, 0, -step):
-        row = data.iloc[index]
+    return position_history(asset_info['dataframes'], data.get('Close'), step)
 
-        last_date = row.name.to_pydatetime()
-        last_date = datetime(last_date.year, last_date.month, last_date.day)
 
-        last_close_price = round(row['Close'], 2)
+def load_history_series(asset=None, source=None, step=1):
+    """Return `(asset_info, history)` of an asset, memoized under `history`.
 
-        asset_info['date'] = last_date
-        asset_info['last_close_price'] = last_close_price
-        consolidate_asset_info(asset_info['dataframes'], asset_info, last_date, last_close_price)
+    The price (and FX) tails are synced first, so the cache key (ledger
+    version + last stored bars, see `last_bar`) reflects the latest trades
+    and prices, intraday rewrites of today's bar included. The figure is not
+    cached; `history_figure` rebuilds it at any resolution."""
+    # Late import so tests patching `app.processing.get_online_info` take effect.
+    from app import processing
 
-        new_row = pd.DataFrame([asset_info])
-        history = pd.concat([history, new_row], ignore_index=True)
+    asset_info = _process_asset_request(source, asset)
+    if not asset_info.get('first_buy'):
+        return asset_info, pd.DataFrame(columns=HISTORY_COLUMNS)
 
-    if len(history) >= 2:
-        history['slope'] = -np.gradient(history.rentability).round(2)
-        history['position_slope'] = -np.gradient(history.position_total).round(2)
-    else:
-        history['slope'] = 0
-        history['position_slope'] = 0
+    if 'yfinance_ticker' not in asset_info:
+        try:
+            processing.get_online_info(asset_info.get('ticker', asset), asset_info)
+        except Exception as e:
+            app.logger.warning('Could not enrich ticker for history: %s', e)
 
-    cols = ['date', 'last_close_price', 'avg_price', 'position', 'position_total', 'cost',
-            'wages_sum', 'liquid_cost', 'capital_gain', 'rentability', 'slope',
-            'anualized_rentability', 'age', 'position_slope']
-    existing_cols = [c for c in cols if c in history.columns]
-    consolidate = history[existing_cols]
+    name = asset_info.get('name', asset)
+    ticker = asset_info.get('yfinance_ticker', asset_info.get('ticker', asset))
+    first_buy = datetime.fromisoformat(asset_info['first_buy'])
+    try:
+        sync_price_history(ticker, first_buy)
+        price_version = last_bar(ticker)
+    except Exception as e:
+        app.logger.error('Error fetching history for %s: %s', ticker, e)
+        price_version = None
 
-    plots = plot_history(asset_info, history)
+    fx_version = None
+    if name in _USD_PRICED:
+        fx_symbol = FX_SYMBOLS['BRL']
+        try:
+            # A week earlier, as `fx_at` reads it.
+            sync_price_history(fx_symbol, first_buy - pd.Timedelta(days=7))
+            fx_version = last_bar(fx_symbol)
+        except Exception as e:
+            app.logger.error('Error fetching %s: %s', fx_symbol, e)
 
-    ret['history'] = history
-    ret['consolidate'] = consolidate
-    ret['plots'] = plots
+    ledger_version = ledger_versions(source, name).get((source, name))
+    history = _history_series(source, name, ticker, step, ledger_version, price_version, fx_version)
+    return asset_info, history
+
+
+def process_history(asset=None, source=None, step=1, max_points=HISTORY_CHART_POINTS, start=None, end=None):
+    """History table of an asset plus its chart (see `history_figure` for
+    `max_points`, `start` and `end`, which only affect the chart)."""
+    app.logger.info('process_history')
 
+    asset_info, history = load_history_series(asset, source, step)
+
+    ret = {}
+    ret['history'] = history
+    ret['consolidate'] = history[HISTORY_COLUMNS] if not history.empty else pd.DataFrame()
+    ret['figure'] = history_figure(asset_info, history, max_points=max_points, start=start, end=end)
     ret['valid'] = True
 
     return ret
@@ -0,0 +1,299 @@
+"""Portfolio-wide NAV history.
+
+Every asset's position state is evaluated on one shared business-day grid
+(`AsOfIndex.states_at`), stacked into assets x dates matrices and combined
+with a close-price matrix of the same shape, so the whole portfolio is
+valued in one NumPy pass instead of one `process_history` per asset. USD
+amounts are converted with the USD/BRL close of each date (`fx_at`).
+
+`update_portfolio_snapshots()` stores the per-asset valuation of each day
+in `PortfolioSnapshot`, appending only the days since the last run. It runs
+on the import worker (`app.import_jobs.enqueue_portfolio_refresh`), so
+`/history/portfolio` only reads the history back with one grouped range
+query.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert
+
+from app import app, db
+from app.models import PortfolioSnapshot
+from app.utils.price_store import load_price_history
+from app.utils.fx import fx_at
+
+from .asof import AsOfIndex
+from .assets import ASSET_CLASSIFIERS, load_source_transactions
+from .history import HISTORY_CHART_POINTS, adjust_for_splits, history_figure
+from .prices import yfinance_symbol
+
+PORTFOLIO_SOURCES = ('b3', 'avenue', 'generic')
+
+PORTFOLIO_COLUMNS = ['date', 'nav', 'cost', 'invested', 'wages', 'taxes', 'realized_gain',
+                     'not_realized_gain', 'capital_gain', 'rentability']
+
+# Valued fields stored per PortfolioSnapshot row.
+_SNAPSHOT_FIELDS = ('position', 'price', 'value', 'cost', 'invested', 'wages', 'taxes',
+                    'realized_gain', 'not_realized_gain', 'capital_gain')
+# Fields summed across assets; `value` is the NAV.
+_TOTAL_FIELDS = ('value', *PORTFOLIO_COLUMNS[2:-1])
+
+# (column, name, color, yaxis, extra) of each portfolio chart trace.
+PORTFOLIO_TRACES = [
+    ('rentability', 'Rentability', 'darkblue', 'y1', {}),
+    ('nav', 'NAV', 'darkgreen', 'y2', {}),
+    ('invested', 'Invested', 'green', 'y2', {}),
+    ('wages', 'Wages', 'lightgreen', 'y2', {}),
+    ('capital_gain', 'Capital Gain', 'lime', 'y2', {}),
+]
+
+
+def load_portfolio_positions(sources=PORTFOLIO_SOURCES):
+    """Return one record per bought asset: source, asset, currencies and
+    the `AsOfIndex` of its classified frames (one scan per source)."""
+    positions = []
+    for source in sources:
+        for asset, transactions_df in load_source_transactions(source).items():
+            _, dataframes = ASSET_CLASSIFIERS[source](asset, transactions_df)
+            index = AsOfIndex(dataframes)
+            if len(index.buys.dates) == 0:
+                continue
+            symbol = yfinance_symbol(asset)
+            ledger_currency = 'USD' if source == 'avenue' else 'BRL'
+            price_currency = ledger_currency
+            if symbol is not None and symbol.endswith('-USD'):
+                price_currency = 'USD'
+            positions.append({
+                'source': source,
+                'asset': asset,
+                'symbol': symbol,
+                'ledger_currency': ledger_currency,
+                'price_currency': price_currency,
+                'index': index,
+            })
+    return positions
+
+
+def _close_on_grid(symbol, start, grid):
+    """Split-adjusted closes of `symbol` on `grid`, carried forward over
+    non-trading days (NaN before the first close or when unavailable).
+
+    Prices are read from a week before `start`, so a `start` that falls on a
+    market holiday still carries the previous close forward."""
+    if symbol is None:
+        return np.full(len(grid), np.nan)
+    try:
+        data = load_price_history(symbol, pd.Timestamp(start) - pd.Timedelta(days=7))
+    except Exception as e:
+        app.logger.error('Error fetching history for %s: %s', symbol, e)
+        return np.full(len(grid), np.nan)
+    if data.empty:
+        return np.full(len(grid), np.nan)
+    data = adjust_for_splits(data)
+    close = data['Close'].dropna()
+    close = close[~close.index.duplicated(keep='last')]
+    return close.reindex(close.index.union(grid)).ffill().reindex(grid).to_numpy(dtype=float)
+
+
+def value_positions(positions, grid):
+    """Value `positions` (see `load_portfolio_positions`) on `grid`, in BRL.
+
+    Returns {field: assets x dates array} with `position`, `price`, `value`,
+    `cost`, `invested`, `wages`, `taxes`, `realized_gain`,
+    `not_realized_gain` and `capital_gain`, plus the boolean `bought` mask of
+    the dates on or after each asset's first buy. Held assets without a
+    price are valued at their average cost.
+    """
+    fields = ('buy_quantity', 'sell_quantity', 'buy_cost', 'wages_sum', 'rent_wages_sum',
+              'taxes_sum', 'realized_gain')
+    states = [p['index'].states_at(grid) for p in positions]
+    matrix = {field: np.vstack([state[field] for state in states]) for field in fields}
+
+    close = np.vstack([
+        _close_on_grid(p['symbol'], max(pd.Timestamp(p['index'].buys.dates[0]), grid[0]), grid)
+        for p in positions
+    ])
+
+    ledger_usd = np.array([p['ledger_currency'] == 'USD' for p in positions])
+    price_usd = np.array([p['price_currency'] == 'USD' for p in positions])
+    usdbrl = fx_at(grid) if (ledger_usd | price_usd).any() else np.ones(len(grid))
+
+    # Prices in each asset's ledger currency, then ledger amounts to BRL.
+    price_fx = np.where((price_usd & ~ledger_usd)[:, None], usdbrl, 1.0)
+    ledger_fx = np.where(ledger_usd[:, None], usdbrl, 1.0)
+
+    buy_quantity = matrix['buy_quantity']
+    shares = np.round(buy_quantity - np.abs(matrix['sell_quantity']), 8)
+    held = shares > 0
+    cost = matrix['buy_cost']
+    avg_price = np.divide(cost, buy_quantity, out=np.zeros_like(cost), where=buy_quantity > 0)
+    price = np.where(np.isnan(close), avg_price, close * price_fx)
+    price = np.where(held, price, 0.0)
+
+    wages = matrix['wages_sum'] + matrix['rent_wages_sum']
+    not_realized_gain = (price - avg_price) * shares
+
+    return {
+        'bought': buy_quantity > 0,
+        'position': np.where(held, shares, 0.0),
+        'price': price * ledger_fx,
+        'value': np.where(held, shares * price, 0.0) * ledger_fx,
+        'cost': cost * ledger_fx,
+        'invested': (cost - wages + matrix['taxes_sum']) * ledger_fx,
+        'wages': wages * ledger_fx,
+        'taxes': matrix['taxes_sum'] * ledger_fx,
+        'realized_gain': matrix['realized_gain'] * ledger_fx,
+        'not_realized_gain': not_realized_gain * ledger_fx,
+        'capital_gain': (matrix['realized_gain'] + not_realized_gain + wages) * ledger_fx,
+    }
+
+
+def _business_days(start, end):
+    return pd.bdate_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize())
+
+
+def _history_frame(dates, totals):
+    """`PORTFOLIO_COLUMNS` frame from per-date BRL totals."""
+    invested = np.asarray(totals['invested'], dtype=float)
+    gain = np.asarray(totals['capital_gain'], dtype=float)
+    rentability = np.divide(gain, invested, out=np.zeros_like(gain), where=invested > 0)
+    history = pd.DataFrame({'date': pd.DatetimeIndex(dates)})
+    history['nav'] = np.round(np.asarray(totals['value'], dtype=float), 2)
+    for column in _TOTAL_FIELDS[1:]:
+        history[column] = np.round(np.asarray(totals[column], dtype=float), 2)
+    history['rentability'] = np.round(100 * rentability, 2)
+    return history
+
+
+def portfolio_history(positions, start=None, end=None):
+    """Value `positions` on every business day in [start, end], in BRL.
+
+    Returns a frame of `PORTFOLIO_COLUMNS`, oldest first, computed in memory
+    (`load_portfolio_history` reads the same from the snapshots).
+    """
+    if not positions:
+        return pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+    if start is None:
+        start = min(p['index'].buys.dates[0] for p in positions)
+    grid = _business_days(start, end if end is not None else datetime.now())
+    if len(grid) == 0:
+        return pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+
+    values = value_positions(positions, grid)
+    return _history_frame(grid, {name: values[name].sum(axis=0) for name in _TOTAL_FIELDS})
+
+
+def discard_portfolio_snapshots(records):
+    """Drop the snapshots from the earliest date of `records` onwards.
+
+    `records` are the Transaction kwargs dicts that were just committed; the
+    next `update_portfolio_snapshots()` recomputes the dropped days."""
+    dates = [record.get('date') for record in records if record.get('date')]
+    if not dates:
+        return 0
+    deleted = PortfolioSnapshot.query.filter(
+        PortfolioSnapshot.date >= min(dates)).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def portfolio_snapshots_current(today=None):
+    """True when the newest snapshot is the last business day up to `today`."""
+    last = db.session.query(func.max(PortfolioSnapshot.date)).scalar()
+    if last is None:
+        return False
+    today = pd.Timestamp(today if today is not None else datetime.now()).normalize()
+    return pd.Timestamp(last) >= pd.offsets.BDay().rollback(today)
+
+
+def update_portfolio_snapshots(end=None):
+    """Append the snapshots of the business days since the last stored one.
+
+    The last stored day is recomputed too (its close may have been an
+    intraday quote). Returns the number of rows stored.
+    """
+    last = db.session.query(func.max(PortfolioSnapshot.date)).scalar()
+    positions = load_portfolio_positions()
+    if not positions:
+        return 0
+
+    start = pd.Timestamp(last) if last else min(pd.Timestamp(p['index'].buys.dates[0]) for p in positions)
+    grid = _business_days(start, end if end is not None else datetime.now())
+    if len(grid) == 0:
+        return 0
+
+    values = value_positions(positions, grid)
+    rows = []
+    dates = grid.strftime('%Y-%m-%d')
+    for i, position in enumerate(positions):
+        for j in np.flatnonzero(values['bought'][i]):
+            row = {name: round(float(values[name][i, j]), 8 if name == 'position' else 2)
+                   for name in _SNAPSHOT_FIELDS}
+            row.update(date=dates[j], source=position['source'], asset=position['asset'])
+            rows.append(row)
+
+    PortfolioSnapshot.query.filter(PortfolioSnapshot.date >= dates[0]).delete(synchronize_session=False)
+    if rows:
+        db.session.execute(insert(PortfolioSnapshot), rows)
+    db.session.commit()
+    app.logger.info('Portfolio snapshots stored: %d rows since %s', len(rows), dates[0])
+    return len(rows)
+
+
+def load_portfolio_snapshots(start=None, end=None, source=None, asset=None):
+    """Range read of the stored snapshots as a frame, ordered by date."""
+    query = PortfolioSnapshot.query
+    if start is not None:
+        query = query.filter(PortfolioSnapshot.date >= pd.Timestamp(start).strftime('%Y-%m-%d'))
+    if end is not None:
+        query = query.filter(PortfolioSnapshot.date <= pd.Timestamp(end).strftime('%Y-%m-%d'))
+    if source is not None:
+        query = query.filter(PortfolioSnapshot.source == source)
+    if asset is not None:
+        query = query.filter(PortfolioSnapshot.asset == asset)
+    rows = query.order_by(PortfolioSnapshot.date.asc(), PortfolioSnapshot.source.asc(),
+                          PortfolioSnapshot.asset.asc()).all()
+    columns = ['date', 'source', 'asset', *_SNAPSHOT_FIELDS]
+    frame = pd.DataFrame([[getattr(row, column) for column in columns] for row in rows],
+                         columns=columns)
+    frame['date'] = pd.to_datetime(frame['date'])
+    return frame
+
+
+def load_portfolio_history(start=None, end=None):
+    """Portfolio totals per stored day in [start, end], summed in SQL.
+
+    Same `PORTFOLIO_COLUMNS` frame as `portfolio_history`, oldest first."""
+    query = db.session.query(
+        PortfolioSnapshot.date,
+        *(func.sum(getattr(PortfolioSnapshot, name)) for name in _TOTAL_FIELDS),
+    )
+    if start is not None:
+        query = query.filter(PortfolioSnapshot.date >= pd.Timestamp(start).strftime('%Y-%m-%d'))
+    if end is not None:
+        query = query.filter(PortfolioSnapshot.date <= pd.Timestamp(end).strftime('%Y-%m-%d'))
+    rows = query.group_by(PortfolioSnapshot.date).order_by(PortfolioSnapshot.date.asc()).all()
+    if not rows:
+        return pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+    data = list(zip(*rows))
+    return _history_frame(pd.to_datetime(list(data[0])),
+                          {name: data[i + 1] for i, name in enumerate(_TOTAL_FIELDS)})
+
+
+def process_portfolio_history(max_points=HISTORY_CHART_POINTS, start=None, end=None):
+    """Portfolio NAV table (newest first) and chart, like `process_history`.
+
+    Only reads the stored snapshots; they are brought up to date off the
+    request by `enqueue_portfolio_refresh`. `start`/`end` only narrow the
+    chart window."""
+    app.logger.info('process_portfolio_history')
+
+    history = load_portfolio_history()
+
+    ret = {}
+    ret['history'] = history.iloc[::-1].reset_index(drop=True)
+    ret['figure'] = history_figure({'currency': 'BRL'}, history, max_points=max_points,
+                                   start=start, end=end, traces=PORTFOLIO_TRACES)
+    ret['valid'] = not history.empty
+    return ret
@@ -0,0 +1,189 @@
+"""Maintenance of the materialized `PositionSnapshot` ledger.
+
+Imports and manual entries call `update_position_snapshots()` with the rows
+they inserted: when every new row is dated after the stored snapshot only
+those rows are replayed on top of it, otherwise the asset is replayed from
+scratch. `refresh_position_snapshots()` is the safety net used on startup
+and before consolidation: it compares each snapshot's ledger version with
+`transaction` and rebuilds only the stale ones.
+"""
+from collections import defaultdict
+
+import pandas as pd
+from sqlalchemy import func
+
+from app import app, db
+from app.models import PositionSnapshot, Transaction, transactions_sql_to_df
+
+from .assets import (
+    ASSET_CLASSIFIERS,
+    apply_position_state,
+    load_source_transactions,
+    position_state,
+)
+
+# Above this many stale assets a full source scan beats an IN (...) filter.
+_MAX_IN_ASSETS = 500
+
+
+def ledger_versions(source=None, asset=None):
+    """Return {(source, asset): (txn_count, last_txn_id)} straight from SQL."""
+    query = db.session.query(
+        Transaction.source, Transaction.asset,
+        func.count(Transaction.id), func.max(Transaction.id),
+    ).filter(Transaction.asset.isnot(None), Transaction.asset != '')
+    if source is not None:
+        query = query.filter(Transaction.source == source)
+    if asset is not None:
+        query = query.filter(Transaction.asset == asset)
+    rows = query.group_by(Transaction.source, Transaction.asset).all()
+    return {(src, asset): (count, last_id) for src, asset, count, last_id in rows}
+
+
+def _replay(source, asset, transactions_df, initial=None):
+    _, dataframes = ASSET_CLASSIFIERS[source](asset, transactions_df)
+    # Replay every stored row, whatever its date.
+    state, _ = position_state(dataframes, until_date=pd.Timestamp.max, initial=initial)
+    return state
+
+
+def _as_of(transactions_df, default=None):
+    if len(transactions_df) == 0:
+        return default
+    return transactions_df['Date'].max().strftime('%Y-%m-%d')
+
+
+def _store_snapshot(snapshot, source, asset, state, as_of, version):
+    if snapshot is None:
+        snapshot = PositionSnapshot(source=source, asset=asset)
+        db.session.add(snapshot)
+    snapshot.set_state(state, as_of)
+    snapshot.txn_count, snapshot.last_txn_id = version
+    return snapshot
+
+
+def rebuild_position_snapshot(source, asset, snapshot=None):
+    """Replay all rows of one asset into its snapshot. Does not commit."""
+    rows = Transaction.query.filter_by(source=source, asset=asset).order_by(
+        Transaction.date.asc()).all()
+    if snapshot is None:
+        snapshot = PositionSnapshot.query.filter_by(source=source, asset=asset).first()
+    if not rows:
+        if snapshot is not None:
+            db.session.delete(snapshot)
+        return None
+    transactions_df = transactions_sql_to_df(rows)
+    version = (len(rows), max(r.id for r in rows))
+    state = _replay(source, asset, transactions_df)
+    return _store_snapshot(snapshot, source, asset, state, _as_of(transactions_df), version)
+
+
+def update_position_snapshots(records):
+    """Fold newly inserted transactions into their assets' snapshots.
+
+    `records` are the Transaction kwargs dicts that were just committed.
+    Only rows dated from the earliest new date onwards are replayed when that
+    date is after the snapshot's `as_of`; a back-dated row rebuilds the asset.
+    """
+    earliest = {}
+    for record in records:
+        source, asset, date = record.get('source'), record.get('asset'), record.get('date')
+        if not source or not asset or not date:
+            continue
+        key = (source, asset)
+        if key not in earliest or date < earliest[key]:
+            earliest[key] = date
+
+    for (source, asset), since in earliest.items():
+        snapshot = PositionSnapshot.query.filter_by(source=source, asset=asset).first()
+        if snapshot is None or snapshot.as_of is None or since <= snapshot.as_of:
+            rebuild_position_snapshot(source, asset, snapshot)
+            continue
+
+        rows = Transaction.query.filter(
+            Transaction.source == source,
+            Transaction.asset == asset,
+            Transaction.date >= since,
+        ).order_by(Transaction.date.asc()).all()
+        if not rows:
+            continue
+        transactions_df = transactions_sql_to_df(rows)
+        state = _replay(source, asset, transactions_df, initial=snapshot.to_state())
+        version = (snapshot.txn_count + len(rows), max(snapshot.last_txn_id, *(r.id for r in rows)))
+        _store_snapshot(snapshot, source, asset, state,
+                        _as_of(transactions_df, snapshot.as_of), version)
+
+    if earliest:
+        db.session.commit()
+    return len(earliest)
+
+
+def refresh_position_snapshots(source=None):
+    """Rebuild missing/stale snapshots and drop orphaned ones.
+
+    Stale assets are replayed from one grouped scan per source. Returns the
+    number of snapshots rebuilt.
+    """
+    versions = ledger_versions(source)
+    query = PositionSnapshot.query
+    if source is not None:
+        query = query.filter_by(source=source)
+    snapshots = {(s.source, s.asset): s for s in query.all()}
+
+    changed = False
+    for key, snapshot in snapshots.items():
+        if key not in versions:
+            db.session.delete(snapshot)
+            changed = True
+
+    stale = defaultdict(list)
+    for key, version in versions.items():
+        snapshot = snapshots.get(key)
+        if snapshot is None or (snapshot.txn_count, snapshot.last_txn_id) != tuple(version):
+            stale[key[0]].append(key[1])
+
+    rebuilt = 0
+    for src, assets in stale.items():
+        if src not in ASSET_CLASSIFIERS:
+            continue
+        groups = load_source_transactions(
+            src, assets if len(assets) <= _MAX_IN_ASSETS else None)
+        for asset in assets:
+            transactions_df = groups.get(asset)
+            if transactions_df is None:
+                continue
+            state = _replay(src, asset, transactions_df)
+            _store_snapshot(snapshots.get((src, asset)), src, asset, state,
+                            _as_of(transactions_df), versions[(src, asset)])
+            rebuilt += 1
+
+    if rebuilt or changed:
+        db.session.commit()
+        app.logger.info('Position snapshots rebuilt: %d', rebuilt)
+    return rebuilt
+
+
+def load_position_snapshots(source):
+    """Return the up-to-date snapshots of a source, ordered by asset."""
+    refresh_position_snapshots(source)
+    return PositionSnapshot.query.filter_by(source=source).order_by(
+        PositionSnapshot.asset.asc()).all()
+
+
+def position_asset_info(source, asset, state):
+    """Build the consolidation record of an asset from a position state."""
+    asset_info = {
+        'valid': False,
+        'name': asset,
+        'source': source,
+        'ticker': asset,
+    }
+    apply_position_state(asset_info, state)
+    if source == 'avenue':
+        asset_info['currency'] = 'USD'
+    return asset_info
+
+
+def snapshot_asset_info(snapshot):
+    """Build the consolidation record of an asset from its snapshot."""
+    return position_asset_info(snapshot.source, snapshot.asset, snapshot.to_state())
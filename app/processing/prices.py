@@ -3,12 +3,18 @@ import json
 import re
 
 import requests
-from flask import flash
+from flask import flash, has_request_context
 
 from app import app
 from app.models import get_api_key
 from app.utils.parsing import is_b3_fii_ticker, is_b3_stock_ticker, brl_to_float
-from app.utils.scraping import cached_json_post, scrape_data, usd_exchange_rate, get_yfinance_data
+from app.utils.scraping import (
+    cached_json_post,
+    get_yfinance_data,
+    quote_service,
+    scrape_data,
+    usd_exchange_rate,
+)
 
 
 scrape_dict = {
@@ -26,6 +32,8 @@ scrape_dict = {
     }
 }
 
+ticker_blacklist = ['VVAR3']
+
 GEMINI_MODEL_CANDIDATES = ['gemini-2.5-flash', 'gemini-1.5-flash', 'gemini-2.0-flash']
 
 
@@ -115,6 +123,47 @@ def guess_yfinance_ticker_with_gemini(asset_name):
         return None
 
 
+def yfinance_symbol(ticker):
+    """Return the yfinance symbol `get_online_info` prices `ticker` with,
+    or None when it is not priced through yfinance."""
+    if ticker in ticker_blacklist or ticker in scrape_dict:
+        return None
+    if is_b3_stock_ticker(ticker) or is_b3_fii_ticker(ticker):
+        return ticker + '.SA'
+    if re.match(r'^(BTC|ETH)$', ticker):
+        return ticker + '-USD'
+    return ticker
+
+
+def prefetch_quotes(tickers):
+    """Price all `tickers` with one batched download (see `QuoteService`)."""
+    symbols = {yfinance_symbol(ticker) for ticker in tickers}
+    symbols.discard(None)
+    return quote_service.prefetch(symbols)
+
+
+def load_fundamentals(asset_info):
+    """Fill the yfinance `.info` fundamentals of an asset, on demand.
+
+    Consolidation prices B3 and crypto assets without them; the asset page
+    calls this before rendering. `info` is always set, empty when there are
+    no fundamentals (no yfinance ticker, scraped or blacklisted assets, or a
+    failed fetch)."""
+    asset_info.setdefault('info', {})
+    yfinance_ticker = asset_info.get('yfinance_ticker')
+    if asset_info.get('info') or not yfinance_ticker:
+        return asset_info
+    try:
+        info = quote_service.info(yfinance_ticker)
+    except Exception as e:
+        app.logger.warning('Could not load fundamentals for %s: %s', yfinance_ticker, e)
+        return asset_info
+    asset_info['info'] = info
+    if not asset_info.get('long_name'):
+        asset_info['long_name'] = info.get('longName', '')
+    return asset_info
+
+
 def get_online_info(ticker, asset_info=None):
     """Scrape online data for the specified asset"""
     app.logger.info('Scraping data for %s', ticker)
@@ -122,28 +171,29 @@ def get_online_info(ticker, asset_info=None):
     if asset_info is None:
         asset_info = {}
 
-    ticker_blacklist = ['VVAR3']
     if ticker in ticker_blacklist:
         return asset_info
 
     try:
         if is_b3_stock_ticker(ticker):
             yfinance_ticker = ticker + ".SA"
-            online_data = get_yfinance_data(yfinance_ticker)
+            online_data = get_yfinance_data(yfinance_ticker, with_info=False)
             asset_info.update(online_data)
+            asset_info['currency'] = 'BRL'
             asset_info['asset_class'] = 'Equity'
             asset_info['yfinance_ticker'] = yfinance_ticker
 
         elif is_b3_fii_ticker(ticker):
             yfinance_ticker = ticker + ".SA"
-            online_data = get_yfinance_data(yfinance_ticker)
+            online_data = get_yfinance_data(yfinance_ticker, with_info=False)
             asset_info.update(online_data)
+            asset_info['currency'] = 'BRL'
             asset_info['asset_class'] = 'FII'
             asset_info['yfinance_ticker'] = yfinance_ticker
 
         elif re.match(r'^(BTC|ETH)$', ticker):
             yfinance_ticker = ticker + "-USD"
-            online_data = get_yfinance_data(yfinance_ticker)
+            online_data = get_yfinance_data(yfinance_ticker, with_info=False)
             asset_info.update(online_data)
             rate = usd_exchange_rate('BRL')
             if rate:
@@ -177,7 +227,11 @@ def get_online_info(ticker, asset_info=None):
                     raise
 
     except Exception as e:
-        flash(f'Failed to get online data for {ticker}.')
+        message = f'Failed to get online data for {ticker}.'
+        asset_info['quote_error'] = message
+        # Quote workers run outside the request; the caller reports for them.
+        if has_request_context():
+            flash(message)
         app.logger.error('Exception: %s', e)
 
     return asset_info
@@ -20,6 +20,16 @@ def format_money(value):
 app.jinja_env.filters['format_money'] = format_money
 
 
+def figure_json(figure):
+    """Serialize a Plotly figure (or None) to JSON, safe to inline in <script>."""
+    if figure is None:
+        return 'null'
+    return figure.to_json().replace('</', '<\\/')
+
+
+app.jinja_env.filters['figure_json'] = figure_json
+
+
 def flash_form_errors(form):
     for field, errors in form.errors.items():
         for error in errors:
@@ -87,7 +97,8 @@ def process_manual_transaction(form, translator, dedup_keys=None):
     `translator` receives a dict {form_attr: value} from the form and must
     return a kwargs dict suitable for `Transaction(**kwargs)`.
     """
-    from app.models import Transaction
+    from app.models import Transaction, register_asset_aliases
+    from app.processing import discard_portfolio_snapshots, update_position_snapshots
 
     if not form.validate_on_submit():
         if form.errors:
@@ -115,7 +126,10 @@ def process_manual_transaction(form, translator, dedup_keys=None):
         kwargs['origin_id'] = 'FORM:' + hashlib.sha256(token.encode()).hexdigest()[:16]
 
     db.session.add(Transaction(**kwargs))
+    register_asset_aliases([kwargs])
     db.session.commit()
+    update_position_snapshots([kwargs])
+    discard_portfolio_snapshots([kwargs])
     invalidate_processing_cache()
     app.logger.info('Added new manual Transaction.')
     return {
@@ -15,7 +15,9 @@ _CACHE_FIELD_TO_CATEGORY = {
     'cache_serper_ttl': 'serper',
     'cache_gemini_ttl': 'gemini',
     'cache_asset_ttl': 'asset',
+    'cache_asset_detail_ttl': 'asset_detail',
     'cache_consolidate_ttl': 'consolidate',
+    'cache_history_ttl': 'history',
 }
 
 _HTTP_CACHE_CATEGORIES = {'default', 'yfinance', 'exchange_rate', 'scraping', 'serper', 'gemini'}
@@ -1,10 +1,11 @@
 """Asset detail view + price history view."""
 import pandas as pd
-from flask import abort, jsonify, render_template, request
+from flask import abort, jsonify, render_template, request, url_for
 
 from app import app
 from app.processing import (
-    plot_price_history,
+    load_asset_detail,
+    load_fundamentals,
     process_avenue_asset_request,
     process_b3_asset_request,
     process_generic_asset_request,
@@ -69,6 +70,7 @@ def _build_news_payload(asset_info, fetch_news=False, analyze_sentiment=False, n
     asset = asset_info['name']
 
     if fetch_news:
+        load_fundamentals(asset_info)
         news_query = asset_info.get('long_name') or asset_info.get('ticker') or asset
         news = search_news(f'{news_query} stock', num=8)
         news = _sort_news(news, news_sort)
@@ -110,8 +112,9 @@ def _build_news_payload(asset_info, fetch_news=False, analyze_sentiment=False, n
 
 
 def _view_asset_helper(asset_info, fetch_news=False, analyze_sentiment=False, news_sort='date_desc'):
-    dataframes = asset_info['dataframes']
-    extended_info = asset_info['info']
+    dataframes = load_asset_detail(asset_info)['dataframes']
+    load_fundamentals(asset_info)
+    extended_info = asset_info.get('info') or {}
 
     buys = dataframes['buys']
     sells = dataframes['sells']
@@ -123,8 +126,6 @@ def _view_asset_helper(asset_info, fetch_news=False, analyze_sentiment=False, ne
     wages = wages[['Date', 'Total', 'Movimentation']]
     taxes = taxes[['Date', 'Total', 'Movimentation']]
 
-    graph_html = plot_price_history(asset_info)
-
     movimentation = pd.DataFrame()
     if 'movimentation' in dataframes:
         movimentation = dataframes['movimentation']
@@ -154,7 +155,6 @@ def _view_asset_helper(asset_info, fetch_news=False, analyze_sentiment=False, ne
         wages=wages,
         taxes=taxes,
         movimentation=movimentation,
-        graph_html=graph_html,
         rent=rent,
         negotiation=negotiation,
         news=news_payload['news'],
@@ -215,7 +215,7 @@ def api_asset_news(source=None, asset=None):
 
 @app.route('/api/view/<source>/<asset>/analysis', methods=['GET'])
 def api_asset_analysis(source=None, asset=None):
-    asset_info = _load_asset_info_or_404(source, asset)
+    asset_info = load_fundamentals(load_asset_detail(_load_asset_info_or_404(source, asset)))
     preview_only = request.args.get('preview') == '1'
 
     if preview_only:
@@ -240,8 +240,9 @@ def api_asset_analysis(source=None, asset=None):
 
 @app.route('/history/<source>/<asset>', methods=['GET', 'POST'])
 def view_history(asset=None, source=None):
-    ret = process_history(asset, source)
+    step = max(request.args.get('step', 1, type=int), 1)
+    ret = process_history(asset, source, step=step)
     consolidate = ret['consolidate']
-    plots = ret['plots']
     return render_template('view_history.html', html_title=f'{asset} history', title=f'{asset}',
-                           df=consolidate, plots=plots)
+                           df=consolidate, figure=ret.get('figure'),
+                           zoom_url=url_for('api_chart_history', source=source, asset=asset, step=step))
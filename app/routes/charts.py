@@ -0,0 +1,89 @@
+"""Chart endpoints: Plotly figures as JSON + the shared plotly.js bundle.
+
+Pages no longer inline plotly.js with every figure: they load the bundle
+once from `/vendor/plotly.min.js` (cached by the browser, versioned URL) and
+`static/js/charts.js` draws the figures fetched from `/api/chart/...`.
+"""
+from datetime import date
+from functools import lru_cache
+
+import plotly
+from flask import Response, request
+from plotly.offline import get_plotlyjs
+
+from app import app
+from app.processing import (
+    HISTORY_CHART_POINTS,
+    load_fundamentals,
+    price_history_figure,
+    process_history,
+    process_portfolio_history,
+)
+
+from ._helpers import figure_json
+from .asset import _load_asset_info_or_404
+
+PLOTLY_VERSION = plotly.__version__
+
+# Bounds of the `points` budget a client may ask for, per trace.
+MIN_CHART_POINTS = 50
+MAX_CHART_POINTS = 10000
+
+
+@lru_cache(maxsize=1)
+def _plotly_js():
+    return get_plotlyjs()
+
+
+def _iso_date(value):
+    return date.fromisoformat(value[:10])
+
+
+def _chart_window_args():
+    """`(points, start, end)` of a chart request: the per-trace point budget
+    and the zoom window (`YYYY-MM-DD`, invalid values are ignored)."""
+    points = request.args.get('points', HISTORY_CHART_POINTS, type=int)
+    points = min(max(points, MIN_CHART_POINTS), MAX_CHART_POINTS)
+    start = request.args.get('start', type=_iso_date)
+    end = request.args.get('end', type=_iso_date)
+    return points, start, end
+
+
+def _figure_response(figure):
+    return Response(f'{{"figure": {figure_json(figure)}}}', mimetype='application/json')
+
+
+@app.route('/vendor/plotly.min.js', methods=['GET'])
+def plotly_js():
+    response = Response(_plotly_js(), mimetype='application/javascript')
+    response.set_etag(PLOTLY_VERSION)
+    # The URL carries the version (?v=...), so the bundle never goes stale.
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    return response.make_conditional(request)
+
+
+@app.route('/api/chart/<source>/<asset>/price', methods=['GET'])
+def api_chart_price(source=None, asset=None):
+    asset_info = load_fundamentals(_load_asset_info_or_404(source, asset))
+    return _figure_response(price_history_figure(asset_info))
+
+
+@app.route('/api/chart/<source>/<asset>/history', methods=['GET'])
+def api_chart_history(source=None, asset=None):
+    step = max(request.args.get('step', 1, type=int), 1)
+    points, start, end = _chart_window_args()
+    ret = process_history(asset, source, step=step, max_points=points, start=start, end=end)
+    return _figure_response(ret.get('figure'))
+
+
+@app.route('/api/chart/portfolio/history', methods=['GET'])
+def api_chart_portfolio_history():
+    points, start, end = _chart_window_args()
+    ret = process_portfolio_history(max_points=points, start=start, end=end)
+    return _figure_response(ret.get('figure'))
+
+
+@app.context_processor
+def _inject_plotly_version():
+    return {'plotly_version': PLOTLY_VERSION}
@@ -2,7 +2,8 @@
 from flask import flash, jsonify, redirect, render_template, request, url_for
 
 from app import app
-from app.processing import process_consolidate_request
+from app.import_jobs import enqueue_portfolio_refresh
+from app.processing import process_consolidate_request, process_portfolio_history
 from app.utils.serper import analyze_consolidate_performance_with_gemini
 
 _BY_GROUP_COLUMNS = ['asset_class', 'currency', 'position', 'rentability',
@@ -82,6 +83,8 @@ def view_consolidate():
     info = process_consolidate_request()
 
     if not info['valid']:
+        for error in info.get('errors', []):
+            flash(error)
         flash('Data not found! Please upload something.')
         return redirect(url_for('home'))
 
@@ -106,6 +109,8 @@ def view_sold():
     info = process_consolidate_request()
 
     if not info['valid']:
+        for error in info.get('errors', []):
+            flash(error)
         flash('Data not found! Please upload something.')
         return redirect(url_for('home'))
 
@@ -126,6 +131,22 @@ def view_sold():
                            group_df=group_df)
 
 
+@app.route('/history/portfolio', methods=['GET'])
+def view_portfolio_history():
+    # Snapshots are valued on the import worker; this view only reads them.
+    queued = enqueue_portfolio_refresh() and app.config.get('WALLET_IMPORT_ASYNC', True)
+    ret = process_portfolio_history()
+
+    if not ret['valid']:
+        flash('Portfolio history is being computed, reload in a moment.' if queued
+              else 'Data not found! Please upload something.')
+        return redirect(url_for('home'))
+
+    return render_template('view_history.html', html_title='Portfolio history', title='Portfolio',
+                           df=ret['history'], figure=ret.get('figure'),
+                           zoom_url=url_for('api_chart_portfolio_history'))
+
+
 @app.route('/api/consolidate/analysis', methods=['GET'])
 def api_consolidate_analysis():
     info = process_consolidate_request()
@@ -1,22 +1,40 @@
-"""File upload + dispatch to source-specific importers."""
+"""File uploads (single or batch), queued as `ImportJob`s, and the job status API."""
 import os
+import uuid
 
-import pandas as pd
 from flask import flash, jsonify, redirect, render_template, request, url_for
 
-from app import app, UPLOADS_FOLDER
-from app.importing import (
-    import_avenue_extract,
-    import_b3_movimentation,
-    import_b3_negotiation,
-    import_generic_extract,
-)
+from app import app, db, UPLOADS_FOLDER
+from app.import_jobs import enqueue_batch_import, enqueue_import
+from app.importing import IMPORTERS
+from app.models import ImportJob
+
+_REDIRECT_ENDPOINTS = {
+    'B3 Movimentation': 'view_movimentation',
+    'B3 Negotiation': 'view_negotiation',
+    'Avenue Extract': 'view_extract',
+    'Generic Extract': 'view_generic_extract',
+}
 
 
 def _is_ajax_request(req):
     return req.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
 
+def _save_upload(file):
+    """Save `file` under its own `uploads/<uuid>/` directory.
+
+    The import runs later on the worker, so a shared `uploads/<name>` path
+    would let a second upload with the same name overwrite a queued file.
+    """
+    folder = os.path.join(UPLOADS_FOLDER, uuid.uuid4().hex)
+    os.makedirs(folder)
+    filepath = os.path.join(folder, os.path.basename(file.filename))
+    file.save(filepath)
+    app.logger.debug('File %s saved at %s.', file.filename, filepath)
+    return filepath
+
+
 def _process_upload(req):
     file = req.files.get('file')
     filetype = req.form.get('filetype', '')
@@ -30,15 +48,7 @@ def _process_upload(req):
             'render_home': True,
         }
 
-    filepath = os.path.join(UPLOADS_FOLDER, file.filename)
-    file.save(filepath)
-    app.logger.debug('File %s saved at %s.', file.filename, filepath)
-
-    if filepath.endswith('.csv'):
-        df = pd.read_csv(filepath)
-    elif filepath.endswith('.xlsx'):
-        df = pd.read_excel(filepath)
-    else:
+    if not file.filename.endswith(('.csv', '.xlsx')):
         return {
             'success': False,
             'messages': [],
@@ -47,27 +57,7 @@ def _process_upload(req):
             'render_home': True,
         }
 
-    app.logger.debug('File %s loaded to dataframe!', file.filename)
-
-    redirect_endpoint = 'home'
-    success = False
-    if filetype == 'B3 Movimentation':
-        import_b3_movimentation(df, filepath)
-        redirect_endpoint = 'view_movimentation'
-        success = True
-    elif filetype == 'B3 Negotiation':
-        import_b3_negotiation(df, filepath)
-        redirect_endpoint = 'view_negotiation'
-        success = True
-    elif filetype == 'Avenue Extract':
-        import_avenue_extract(df, filepath)
-        redirect_endpoint = 'view_extract'
-        success = True
-    elif filetype == 'Generic Extract':
-        import_generic_extract(df, filepath)
-        redirect_endpoint = 'view_generic_extract'
-        success = True
-    else:
+    if filetype not in IMPORTERS:
         return {
             'success': False,
             'messages': [],
@@ -76,11 +66,24 @@ def _process_upload(req):
             'render_home': True,
         }
 
+    filepath = _save_upload(file)
+    job = enqueue_import(filepath, file.filename, filetype)
+    if job.error:
+        return {
+            'success': False,
+            'messages': [],
+            'errors': [f'Error! Failed to import {file.filename}: {job.error}'],
+            'redirect_endpoint': 'home',
+            'render_home': True,
+        }
+
     return {
-        'success': success,
-        'messages': [f'Successfully imported {file.filename}!'] if success else [],
+        'success': True,
+        'messages': [f'Successfully imported {file.filename}!' if job.finished
+                     else f'Importing {file.filename}...'],
         'errors': [],
-        'redirect_endpoint': redirect_endpoint,
+        'redirect_endpoint': _REDIRECT_ENDPOINTS[filetype],
+        'job': job.to_dict(),
     }
 
 
@@ -97,6 +100,9 @@ def home():
             'messages': result.get('messages', []),
             'errors': result.get('errors', []),
             'redirect_url': url_for(result.get('redirect_endpoint', 'home')),
+            'job': result.get('job'),
+            'status_url': (url_for('api_import_status', job_id=result['job']['id'])
+                           if result.get('job') else None),
         })
 
     for message in result.get('messages', []):
@@ -108,3 +114,49 @@ def home():
         return render_template('index.html')
 
     return redirect(url_for(result.get('redirect_endpoint', 'home')))
+
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """Queue several files as one import batch.
+
+    `files` holds the uploads and `filetype` either one value for all of
+    them or one per file, in the same order.
+    """
+    files = [file for file in request.files.getlist('files') if file and file.filename]
+    filetypes = request.form.getlist('filetype')
+    if len(filetypes) == 1:
+        filetypes = filetypes * len(files)
+
+    errors = []
+    if not files:
+        errors.append('Error! No file provided for upload.')
+    elif len(filetypes) != len(files):
+        errors.append('Error! Provide one filetype, or one per file.')
+    for file, filetype in zip(files, filetypes):
+        if not file.filename.endswith(('.csv', '.xlsx')):
+            errors.append(f'Error! Filetype not supported: {file.filename}.')
+        elif filetype not in IMPORTERS:
+            errors.append(f'Error! Failed to parse {file.filename}.')
+    if errors:
+        return jsonify({'success': False, 'messages': [], 'errors': errors}), 400
+
+    queued = [(_save_upload(file), file.filename, filetype) for file, filetype in zip(files, filetypes)]
+    app.logger.debug('Batch of %d files saved.', len(queued))
+
+    jobs = enqueue_batch_import(queued)
+    return jsonify({
+        'success': True,
+        'messages': [f'Importing {len(jobs)} files...'],
+        'errors': [],
+        'jobs': [job.to_dict() for job in jobs],
+        'status_urls': [url_for('api_import_status', job_id=job.id) for job in jobs],
+    })
+
+
+@app.route('/api/import/<int:job_id>')
+def api_import_status(job_id):
+    job = db.session.get(ImportJob, job_id)
+    if job is None:
+        return jsonify({'error': 'Import job not found'}), 404
+    return jsonify(job.to_dict())
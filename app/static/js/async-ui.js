@@ -53,8 +53,33 @@
     });
   }
 
+  // Poll a JSON status URL until its payload has `finished: true`.
+  // `onUpdate` gets every payload; resolves with the last one.
+  function pollJob(url, onUpdate, intervalMs) {
+    const delay = intervalMs || 1000;
+    return new Promise(function (resolve, reject) {
+      async function tick() {
+        try {
+          const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+          if (!response.ok) throw new Error('HTTP ' + response.status);
+          const payload = await response.json();
+          if (onUpdate) onUpdate(payload);
+          if (payload.finished) {
+            resolve(payload);
+          } else {
+            setTimeout(tick, delay);
+          }
+        } catch (error) {
+          reject(error);
+        }
+      }
+      tick();
+    });
+  }
+
   window.asyncUI = {
     escapeHtml: escapeHtml,
     showToast: showToast,
+    pollJob: pollJob,
   };
 })();
@@ -0,0 +1,99 @@
+(function () {
+  // Draws Plotly figures sent as JSON against the shared plotly.js bundle.
+  //  - <div data-chart-url="/api/chart/...">: figure fetched on load.
+  //  - <div data-chart-json="elementId">: figure inlined in a
+  //    <script type="application/json" id="elementId"> block.
+  // A card wrapping the chart (data-chart-card) is hidden when there is no figure.
+  // Charts with data-chart-zoom-url are downsampled server-side: zooming
+  // refetches the figure for the visible window (?start=...&end=...).
+
+  function hideCard(el) {
+    const card = el.closest('[data-chart-card]');
+    if (card) card.style.display = 'none';
+  }
+
+  function draw(el, figure) {
+    if (!figure || !window.Plotly) {
+      hideCard(el);
+      return;
+    }
+    el.innerHTML = '';
+    window.Plotly.newPlot(el, figure.data || [], figure.layout || {}, { responsive: true });
+    if (el.getAttribute('data-chart-zoom-url')) watchZoom(el);
+  }
+
+  function fetchFigure(url) {
+    return fetch(url, { headers: { Accept: 'application/json' } })
+      .then(function (response) {
+        if (!response.ok) throw new Error('HTTP ' + response.status);
+        return response.json();
+      })
+      .then(function (payload) {
+        return payload.figure;
+      });
+  }
+
+  function watchZoom(el) {
+    if (el.dataset.zoomWatched) return;
+    el.dataset.zoomWatched = '1';
+    let pending = null;
+
+    el.on('plotly_relayout', function (event) {
+      let range = null;
+      if (event['xaxis.range[0]'] !== undefined) {
+        range = [event['xaxis.range[0]'], event['xaxis.range[1]']];
+      } else if (Array.isArray(event['xaxis.range'])) {
+        range = event['xaxis.range'];
+      } else if (!event['xaxis.autorange']) {
+        return;  // not an x-axis change (e.g. a redraw from a zoom reply)
+      }
+
+      const url = new URL(el.getAttribute('data-chart-zoom-url'), window.location.href);
+      if (range) {
+        url.searchParams.set('start', String(range[0]).slice(0, 10));
+        url.searchParams.set('end', String(range[1]).slice(0, 10));
+      }
+      const request = pending = fetchFigure(url.toString());
+      request
+        .then(function (figure) {
+          if (request !== pending || !figure) return;
+          const layout = el.layout;
+          if (range) {
+            layout.xaxis.range = range;
+            layout.xaxis.autorange = false;
+          }
+          window.Plotly.react(el, figure.data || [], layout);
+        })
+        .catch(function () { /* keep the current points */ });
+    });
+  }
+
+  function loadChart(el) {
+    const inlineId = el.getAttribute('data-chart-json');
+    if (inlineId) {
+      const script = document.getElementById(inlineId);
+      draw(el, script ? JSON.parse(script.textContent) : null);
+      return;
+    }
+
+    fetchFigure(el.getAttribute('data-chart-url'))
+      .then(function (figure) {
+        draw(el, figure);
+      })
+      .catch(function () {
+        hideCard(el);
+      });
+  }
+
+  function init() {
+    document.querySelectorAll('[data-chart-url], [data-chart-json]').forEach(loadChart);
+  }
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', init);
+  } else {
+    init();
+  }
+
+  window.walletCharts = { load: loadChart };
+})();
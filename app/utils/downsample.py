@@ -0,0 +1,67 @@
+"""Largest-Triangle-Three-Buckets (LTTB) downsampling for chart series.
+
+Keeps the visual shape of a line with a bounded number of points: the first
+and last points are kept and every bucket in between contributes the point
+forming the largest triangle with the previously kept point and the mean of
+the next bucket.
+"""
+import numpy as np
+import pandas as pd
+
+
+def lttb_indices(x, y, threshold):
+    """Return the sorted indices of the points LTTB keeps out of `x`, `y`.
+
+    `x` must be ascending; datetimes are accepted. Non-finite `y` values are
+    never selected. All indices are returned when there are at most
+    `threshold` points (or `threshold` < 3).
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64)
+    x = x.astype(float)
+    y = np.asarray(y, dtype=float)
+
+    valid = np.flatnonzero(np.isfinite(y) & np.isfinite(x))
+    n = len(valid)
+    if threshold is None or threshold < 3 or n <= threshold:
+        return valid
+
+    xs, ys = x[valid], y[valid]
+    # Bucket edges over the interior points [1, n - 1).
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = xs[next_start:next_end].mean()
+        avg_y = ys[next_start:next_end].mean()
+
+        bucket_x, bucket_y = xs[start:end], ys[start:end]
+        area = np.abs((xs[a] - avg_x) * (bucket_y - ys[a])
+                      - (xs[a] - bucket_x) * (avg_y - ys[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return valid[selected]
+
+
+def lttb(x, y, threshold):
+    """Downsample one series; returns the kept `(x, y)` as arrays."""
+    index = lttb_indices(x, y, threshold)
+    return np.asarray(x)[index], np.asarray(y)[index]
+
+
+def window(df, column, start=None, end=None):
+    """Rows of `df` whose `column` falls within [start, end] (either optional)."""
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df[column] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df[column] <= pd.Timestamp(end)
+    return df.loc[mask]
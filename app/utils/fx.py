@@ -0,0 +1,55 @@
+"""Historical USD exchange rates.
+
+The daily USD/BRL closes are kept in the local price store (`price_bar`,
+ticker `BRL=X`) and filled incrementally like any other series, so history
+and portfolio computations convert each date at its own rate without extra
+network calls.
+"""
+import numpy as np
+import pandas as pd
+
+from app import app
+from app.utils.price_store import load_price_history
+from app.utils.scraping import usd_exchange_rate
+
+# yfinance symbols of USD -> currency rates.
+FX_SYMBOLS = {
+    'BRL': 'BRL=X',
+}
+
+
+def fx_series(currency='BRL', start=None, sync=True):
+    """Daily USD -> `currency` closes since `start` as a Series on a naive
+    DatetimeIndex (empty when unavailable)."""
+    symbol = FX_SYMBOLS[currency]
+    try:
+        data = load_price_history(symbol, start if start is not None else '2000-01-01', sync=sync)
+    except Exception as e:
+        app.logger.error('fx: could not load %s: %s', symbol, e)
+        return pd.Series(dtype=float)
+    if data.empty:
+        return pd.Series(dtype=float)
+    close = data['Close'].dropna()
+    return close[~close.index.duplicated(keep='last')]
+
+
+def fx_at(dates, currency='BRL', sync=True):
+    """USD -> `currency` rate on each of `dates`, as a float array.
+
+    Each date takes the last close on or before it (the first close for
+    earlier dates). Falls back to the current spot rate when no history is
+    stored, and to 1.0 when that is unavailable too.
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    if len(dates) == 0:
+        return np.zeros(0)
+
+    # A week earlier, so a first date on a weekend/holiday has a prior close.
+    series = fx_series(currency, dates.min() - pd.Timedelta(days=7), sync=sync)
+    if series.empty:
+        return np.full(len(dates), usd_exchange_rate(currency) or 1.0)
+
+    position = np.searchsorted(series.index.to_numpy(), dates.to_numpy(), side='right') - 1
+    return series.to_numpy(dtype=float)[np.clip(position, 0, len(series) - 1)]
@@ -12,7 +12,7 @@ from threading import Lock
 from app import app, db
 
 # Bumping this invalidates all previously cached payloads automatically.
-SCHEMA_VERSION = 'v1'
+SCHEMA_VERSION = 'v2'
 
 _write_lock = Lock()
 
@@ -1,29 +1,55 @@
 import re
+from functools import lru_cache
+
+import pandas as pd
+
+_B3_STOCK_TICKER = re.compile(r'[A-Z0-9]{4}(3|4)$')
+_B3_FII_TICKER = re.compile(r'[A-Z0-9]{4}11$')
+# Leading ticker of a B3 `Produto` / `Código de Negociação` string
+# ("PETR4 - PETROLEO BRASILEIRO" -> "PETR4"); free-form names pass through.
+_B3_PRODUCT = re.compile(r'^([A-Z0-9]{4}|[a-zA-Z0-9 .]+)')
+_B3_TICKER = re.compile(r'^([A-Z0-9]{4}[0-9]{1,2}|[a-zA-Z0-9 .]+)')
+
+# B3 exports repeat the same product text on thousands of rows.
+_TICKER_CACHE_SIZE = 4096
+
 
 def is_valid_b3_ticker(ticker):
     return is_b3_stock_ticker(ticker) or is_b3_fii_ticker(ticker)
 
 def is_b3_stock_ticker(ticker):
-    pattern = r'[A-Z0-9]{4}(3|4)$'
-    if re.match(pattern, ticker):
-        return True
-    return False
+    return _B3_STOCK_TICKER.match(ticker) is not None
 
 def is_b3_fii_ticker(ticker):
-    pattern = r'[A-Z0-9]{4}11$'
-    if re.match(pattern, ticker):
-        return True
-    return False
+    return _B3_FII_TICKER.match(ticker) is not None
+
+def _leading_match(pattern, text):
+    if not isinstance(text, str):
+        return ''
+    match = pattern.match(text)
+    return match.group(1) if match else ''
+
+@lru_cache(maxsize=_TICKER_CACHE_SIZE)
+def b3_product(text):
+    """Scalar `parse_b3_product`: '' when nothing matches."""
+    return _leading_match(_B3_PRODUCT, text)
+
+@lru_cache(maxsize=_TICKER_CACHE_SIZE)
+def b3_ticker(text):
+    """Scalar `parse_b3_ticker`: '' when nothing matches."""
+    return _leading_match(_B3_TICKER, text)
+
+def _parse_column(column, parse):
+    """Apply a cached scalar parser once per distinct value of `column`."""
+    values = column.astype(object).where(column.notna(), '')
+    mapping = {value: parse(value) for value in pd.unique(values)}
+    return values.map(mapping).astype(object)
 
 def parse_b3_product(column):
-    result = column.str.extract(r'^([A-Z0-9]{4}|[a-zA-Z0-9 .]+)', expand=False)
-    result.fillna('', inplace=True)
-    return result
+    return _parse_column(column, b3_product)
 
 def parse_b3_ticker(column):
-    result = column.str.extract(r'^([A-Z0-9]{4}[0-9]{1,2}|[a-zA-Z0-9 .]+)', expand=False)
-    result.fillna('', inplace=True)
-    return result
+    return _parse_column(column, b3_ticker)
 
 def brl_to_float(preco_str):
     if preco_str is None:
@@ -0,0 +1,196 @@
+"""Local OHLCV price-history store backed by the `price_bar` table.
+
+`load_price_history()` serves daily bars from the database and only asks
+yfinance for the date ranges not stored yet: the days before the first
+stored bar when an earlier start is requested, and the days since the last
+stored bar (refetched, as it may have been an intraday snapshot). The tail
+is checked at most once per `yfinance` cache TTL per ticker.
+
+yfinance restates past bars when a corporate action happens (`Close` is
+split-adjusted, `Adj Close` dividend-adjusted, as of the download). So when
+a tail download brings a split or dividend not stored yet, the whole stored
+range is refetched and every bar stays on one scale.
+"""
+import time
+from threading import Lock
+
+import pandas as pd
+import yfinance as yf
+from sqlalchemy import func, insert
+
+from app import app, db
+from app.models import PriceBar, get_processing_ttl
+
+# yfinance history columns -> PriceBar columns
+_COLUMNS = {
+    'Open': 'open',
+    'High': 'high',
+    'Low': 'low',
+    'Close': 'close',
+    'Adj Close': 'adj_close',
+    'Volume': 'volume',
+    'Dividends': 'dividends',
+    'Stock Splits': 'stock_splits',
+}
+
+# ticker -> monotonic time of the last tail sync
+_last_sync = {}
+# ticker -> earliest date already requested (the listing may start later
+# than the stored head, so an empty head download must not be retried)
+_head_checked = {}
+_sync_lock = Lock()
+
+
+def _as_date(value):
+    return pd.Timestamp(value).date()
+
+
+def _download(ticker, start, end=None):
+    """Download daily bars in [start, end) as PriceBar row dicts."""
+    try:
+        data = yf.Ticker(ticker).history(
+            start=start, end=end, auto_adjust=False, actions=True)
+    except Exception as e:
+        app.logger.error('price_store: download failed for %s: %s', ticker, e)
+        return None
+    if data is None or data.empty:
+        return []
+
+    index = pd.DatetimeIndex(data.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    frame = data.reindex(columns=list(_COLUMNS)).rename(columns=_COLUMNS)
+    frame['dividends'] = frame['dividends'].fillna(0.0)
+    frame['stock_splits'] = frame['stock_splits'].fillna(0.0)
+    frame = frame.astype(object).where(frame.notna(), None)
+    frame['date'] = index.strftime('%Y-%m-%d')
+    frame['ticker'] = ticker
+    # Keep one bar per day (the latest, if the feed repeats a date).
+    frame = frame.drop_duplicates(subset='date', keep='last')
+    return frame.to_dict('records')
+
+
+def _store(ticker, rows):
+    """Replace the stored bars on the dates covered by `rows`. Does not commit."""
+    if not rows:
+        return 0
+    dates = [row['date'] for row in rows]
+    PriceBar.query.filter(
+        PriceBar.ticker == ticker,
+        PriceBar.date >= min(dates),
+        PriceBar.date <= max(dates),
+    ).delete(synchronize_session=False)
+    db.session.execute(insert(PriceBar), rows)
+    return len(rows)
+
+
+def stored_range(ticker):
+    """Return the (first, last) stored bar dates of `ticker`, or (None, None)."""
+    first, last = db.session.query(
+        func.min(PriceBar.date), func.max(PriceBar.date),
+    ).filter(PriceBar.ticker == ticker).one()
+    return first, last
+
+
+def _new_actions(ticker, rows, last):
+    """Whether `rows` (a tail download) hold a split or dividend on a day
+    after `last`, or one that differs from the stored `last` bar."""
+    stored = PriceBar.query.filter_by(ticker=ticker, date=last).first()
+    for row in rows:
+        actions = (row.get('stock_splits') or 0.0, row.get('dividends') or 0.0)
+        if actions == (0.0, 0.0):
+            continue
+        if row['date'] > last:
+            return True
+        if row['date'] == last and (stored is None or
+                                    actions != (stored.stock_splits or 0.0, stored.dividends or 0.0)):
+            return True
+    return False
+
+
+def last_bar(ticker):
+    """`(date, close, fetched_at)` of the last stored bar of `ticker`, or None.
+
+    Changes whenever that bar is rewritten (an intraday re-sync or a full
+    refetch after a corporate action), so it keys caches on the series."""
+    row = PriceBar.query.filter_by(ticker=ticker).order_by(PriceBar.date.desc()).first()
+    if row is None:
+        return None
+    return row.date, row.close, row.fetched_at.isoformat() if row.fetched_at else None
+
+
+def sync_price_history(ticker, start, force=False):
+    """Download the bars of `ticker` missing since `start`. Returns the number stored."""
+    start = _as_date(start)
+    first, last = stored_range(ticker)
+
+    ranges = []
+    if first is None:
+        ranges.append((start, None))
+    else:
+        with _sync_lock:
+            head = min(_as_date(first), _head_checked.get(ticker, _as_date(first)))
+            synced_at = _last_sync.get(ticker)
+        if start < head:
+            ranges.append((start, _as_date(first)))
+        fresh = synced_at is not None and time.monotonic() - synced_at < get_processing_ttl('yfinance')
+        if force or not fresh:
+            ranges.append((_as_date(last), None))
+
+    stored = 0
+    for range_start, range_end in ranges:
+        rows = _download(ticker, range_start, range_end)
+        if rows is None:
+            continue
+        if range_end is None and last is not None and _new_actions(ticker, rows, last):
+            # Restate everything stored on the post-action scale.
+            full_start = min(start, _as_date(first))
+            app.logger.info('price_store: corporate action for %s, refetching since %s',
+                            ticker, full_start)
+            full = _download(ticker, full_start)
+            if full:
+                rows = full
+        stored += _store(ticker, rows)
+        with _sync_lock:
+            _head_checked[ticker] = min(start, _head_checked.get(ticker, start))
+            if range_end is None:
+                _last_sync[ticker] = time.monotonic()
+
+    if stored:
+        db.session.commit()
+        app.logger.info('price_store: stored %d bars for %s', stored, ticker)
+    return stored
+
+
+def load_price_history(ticker, start, end=None, sync=True):
+    """Return the daily bars of `ticker` in [start, end] as a yfinance-like frame.
+
+    Columns are `Open, High, Low, Close, Adj Close, Volume, Dividends,
+    Stock Splits` on a naive `DatetimeIndex`. Missing ranges are fetched
+    first unless `sync` is False.
+    """
+    if sync:
+        sync_price_history(ticker, start)
+
+    query = PriceBar.query.filter(
+        PriceBar.ticker == ticker,
+        PriceBar.date >= _as_date(start).isoformat(),
+    )
+    if end is not None:
+        query = query.filter(PriceBar.date <= _as_date(end).isoformat())
+    rows = query.order_by(PriceBar.date.asc()).all()
+
+    frame = pd.DataFrame(
+        [[getattr(row, column) for column in _COLUMNS.values()] for row in rows],
+        columns=list(_COLUMNS),
+        index=pd.DatetimeIndex([row.date for row in rows], name='Date'),
+        dtype=float,
+    )
+    return frame
+
+
+def clear_sync_state():
+    """Forget the tail sync times, so the next reads refetch the tails."""
+    with _sync_lock:
+        _last_sync.clear()
+        _head_checked.clear()
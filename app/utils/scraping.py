@@ -1,3 +1,7 @@
+import threading
+import time
+
+import pandas as pd
 import requests_cache
 # import yfinance_cache as yf
 import yfinance as yf
@@ -51,7 +55,10 @@ def rebuild_request_cache():
 def clear_request_cache():
     """Drop all cached responses without changing TTL configuration."""
     try:
+        from app.utils.price_store import clear_sync_state
         _get_session().cache.clear()
+        quote_service.clear()
+        clear_sync_state()
         app.logger.info('request_cache cleared')
         return True
     except Exception as e:
@@ -82,40 +89,147 @@ def usd_exchange_rate(currency = 'BRL'):
     except Exception as e:
         app.logger.error("usd_exchange_rate Exception: %s", e)
 
-def get_yfinance_data(ticker):
-    """Scrape yfinance online data for the specified asset.
-
-    Note: yfinance now requires curl_cffi internally and is incompatible with
-    custom requests/requests_cache sessions, so we let yfinance manage its own
-    transport.
-    """
-    stock = yf.Ticker(ticker)
-    info = stock.info or {}
-
-    data = stock.history(period='5d', auto_adjust=False)
-    if data is None or data.empty or 'Close' not in data.columns:
-        raise RuntimeError(f'yfinance returned no history for {ticker}')
-
-    close = data['Close']
+def _summarize_closes(close):
+    """Quote fields derived from the last few daily closes of a ticker."""
     last_close_price = float(close.iloc[-1])
     previous_close = float(close.iloc[-2]) if len(close) >= 2 else last_close_price
     close_5d = float(close.mean())
     last_close_variation = (
         100 * (last_close_price / previous_close - 1) if previous_close else 0.0
     )
-
     return {
         'last_close_price': round(last_close_price, 2),
-        'currency': info.get('currency', ''),
-        'long_name': info.get('longName', ''),
-        'asset_class': info.get('quoteType', ''),
-        'info': info,
         'previous_close': round(previous_close, 2),
         'close_5d': round(close_5d, 2),
         'last_close_variation': round(last_close_variation, 2),
     }
 
 
+class QuoteService:
+    """In-memory quote table filled by batched yfinance downloads.
+
+    `prefetch()` prices many tickers with one multi-ticker `yf.download`;
+    `quote()` reads the table and only falls back to a single-ticker history
+    call on a miss. `.info` fundamentals are fetched lazily by `info()`, as
+    they cost one extra request per ticker. Entries expire after `ttl`
+    seconds. Safe to use from the consolidation worker threads.
+    """
+
+    def __init__(self, ttl=15 * 60):
+        self.ttl = ttl
+        self._quotes = {}
+        self._info = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, table, ticker):
+        entry = table.get(ticker)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def _store(self, table, ticker, value):
+        with self._lock:
+            table[ticker] = (time.monotonic(), value)
+
+    def clear(self):
+        with self._lock:
+            self._quotes.clear()
+            self._info.clear()
+
+    def prefetch(self, tickers):
+        """Price every ticker not already in the table with one download.
+
+        Returns the number of tickers priced."""
+        with self._lock:
+            missing = sorted({t for t in tickers if t and self._fresh(self._quotes, t) is None})
+        if not missing:
+            return 0
+
+        try:
+            data = yf.download(
+                missing, period='5d', auto_adjust=False, group_by='ticker',
+                progress=False, threads=True,
+            )
+        except Exception as e:
+            app.logger.error('QuoteService.prefetch Exception: %s', e)
+            return 0
+        if data is None or data.empty:
+            return 0
+
+        priced = 0
+        for ticker in missing:
+            try:
+                if isinstance(data.columns, pd.MultiIndex):
+                    close = data[ticker]['Close']
+                else:
+                    close = data['Close']
+            except KeyError:
+                continue
+            # Calendars differ across exchanges: drop the other markets' days.
+            close = close.dropna()
+            if close.empty:
+                continue
+            self._store(self._quotes, ticker, _summarize_closes(close))
+            priced += 1
+
+        app.logger.info('QuoteService prefetched %d/%d tickers', priced, len(missing))
+        return priced
+
+    def quote(self, ticker):
+        """Return the quote fields of `ticker`, fetching it alone on a miss."""
+        with self._lock:
+            quote = self._fresh(self._quotes, ticker)
+        if quote is not None:
+            return dict(quote)
+
+        data = yf.Ticker(ticker).history(period='5d', auto_adjust=False)
+        if data is None or data.empty or 'Close' not in data.columns:
+            raise RuntimeError(f'yfinance returned no history for {ticker}')
+        close = data['Close'].dropna()
+        if close.empty:
+            raise RuntimeError(f'yfinance returned no history for {ticker}')
+        quote = _summarize_closes(close)
+        self._store(self._quotes, ticker, quote)
+        return dict(quote)
+
+    def info(self, ticker):
+        """Return the yfinance `.info` fundamentals of `ticker` (lazy)."""
+        with self._lock:
+            info = self._fresh(self._info, ticker)
+        if info is not None:
+            return info
+
+        info = yf.Ticker(ticker).info or {}
+        self._store(self._info, ticker, info)
+        return info
+
+
+quote_service = QuoteService()
+
+
+def get_yfinance_data(ticker, with_info=True):
+    """Scrape yfinance online data for the specified asset.
+
+    Prices come from `quote_service`, so tickers batched by
+    `QuoteService.prefetch()` cost no request. `with_info=False` skips the
+    `.info` fundamentals (currency, name, quote type).
+
+    Note: yfinance now requires curl_cffi internally and is incompatible with
+    custom requests/requests_cache sessions, so we let yfinance manage its own
+    transport.
+    """
+    data = quote_service.quote(ticker)
+    info = quote_service.info(ticker) if with_info else {}
+
+    data.update({
+        'currency': info.get('currency', ''),
+        'long_name': info.get('longName', ''),
+        'asset_class': info.get('quoteType', ''),
+        'info': info,
+    })
+    return data
+
+
 def cached_json_post(url, headers=None, json_payload=None, timeout=12):
     """POST JSON through the shared cached session and return parsed JSON."""
     response = _get_session().post(
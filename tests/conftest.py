@@ -12,6 +12,8 @@ def app():
     flask_app.config.update(
         TESTING=True,
         WTF_CSRF_ENABLED=False,
+        # Uploads import inside the request; see test_upload_import_job_runs_in_background.
+        WALLET_IMPORT_ASYNC=False,
     )
     with flask_app.app_context():
         db.create_all()
@@ -1,4 +1,6 @@
 """Tests for the canonical category mapping."""
+import pandas as pd
+
 from app.models import category_mapping as cat
 from app.models.category_mapping import classify
 
@@ -51,3 +53,31 @@ def test_unknown_label_falls_back_to_other():
     assert classify('b3', 'movimentation', 'NovoLabelDesconhecido', 'Credito') == cat.OTHER
     assert classify('avenue', 'extract', 'Algo Inesperado', 'Debito') == cat.OTHER
     assert classify('mystery', 'extract', 'foo') == cat.OTHER
+
+
+def test_classify_batch_matches_classify():
+    labels = ['Compra', 'Venda', ' Empréstimo ', 'Dividendos', 'Câmbio', 'Wages',
+              'Impostos', 'Desdobro', '', None, 'NovoLabel']
+    directions = ['Credito', 'Debito', None, 'Outro']
+    cases = [(l, d) for l in labels for d in directions]
+    label_col = pd.Series([l for l, _ in cases], index=range(10, 10 + len(cases)))
+    direction_col = pd.Series([d for _, d in cases], index=label_col.index)
+    total_col = pd.Series([(-1.0) ** i for i in range(len(cases))], index=label_col.index)
+    for source, record_type in [('b3', 'movimentation'), ('b3', 'negotiation'),
+                                ('avenue', 'extract'), ('generic', 'extract'), ('mystery', 'extract')]:
+        batch = cat.classify_batch(source, record_type, label_col, direction_col, totals=total_col)
+        expected = [classify(source, record_type, l, d, total=t)
+                    for (l, d), t in zip(cases, total_col)]
+        assert batch.index.equals(label_col.index)
+        assert batch.tolist() == expected, (source, record_type)
+
+
+def test_classify_batch_logs_each_unknown_label_once(caplog):
+    labels = pd.Series(['Compra'] * 3 + ['NovoLabel'] * 500 + ['Outro'] * 2)
+    directions = pd.Series(['Credito'] * len(labels))
+    with caplog.at_level('WARNING', logger=cat.__name__):
+        result = cat.classify_batch('b3', 'movimentation', labels, directions)
+    assert result.value_counts().to_dict() == {cat.OTHER: 502, cat.BUY: 3}
+    warnings = [r.getMessage() for r in caplog.records]
+    assert len(warnings) == 2
+    assert any("'NovoLabel'" in w and '(500 rows)' in w for w in warnings)
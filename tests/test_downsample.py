@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from app.utils.downsample import lttb, lttb_indices, window
+
+
+def test_lttb_keeps_short_series():
+    x = np.arange(10)
+    y = x * 2.0
+    np.testing.assert_array_equal(lttb_indices(x, y, 50), x)
+    np.testing.assert_array_equal(lttb_indices(x, y, None), x)
+
+
+def test_lttb_bounds_points_and_keeps_endpoints():
+    x = pd.date_range('2000-01-01', periods=20000, freq='D').to_numpy()
+    y = np.sin(np.arange(20000) / 300.0)
+
+    index = lttb_indices(x, y, 500)
+    assert len(index) == 500
+    assert index[0] == 0 and index[-1] == 19999
+    assert np.all(np.diff(index) > 0)
+
+    kept_x, kept_y = lttb(x, y, 500)
+    assert kept_x.dtype == x.dtype
+    # The extremes of the waveform survive the reduction.
+    assert kept_y.max() > 0.999 and kept_y.min() < -0.999
+
+
+def test_lttb_keeps_spikes_and_skips_nan():
+    y = np.zeros(1000)
+    y[437] = 100.0
+    y[10:20] = np.nan
+    index = lttb_indices(np.arange(1000), y, 30)
+    assert 437 in index
+    assert not np.isnan(y[index]).any()
+
+
+def test_window():
+    df = pd.DataFrame({'date': pd.date_range('2024-01-01', periods=10), 'v': range(10)})
+    assert list(window(df, 'date', '2024-01-03', '2024-01-05')['v']) == [2, 3, 4]
+    assert list(window(df, 'date', end='2024-01-02')['v']) == [0, 1]
+    assert len(window(df, 'date')) == 10
@@ -0,0 +1,36 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from app.utils import fx
+
+
+def _bars():
+    index = pd.DatetimeIndex(['2024-01-02', '2024-01-03', '2024-01-05'], name='Date')
+    return pd.DataFrame({'Close': [4.9, 5.0, 5.1]}, index=index)
+
+
+def test_fx_at_uses_last_close_on_or_before_each_date():
+    with patch.object(fx, 'load_price_history', return_value=_bars()) as mock_load:
+        rates = fx.fx_at(['2024-01-01', '2024-01-03', '2024-01-04', '2024-01-07'])
+    np.testing.assert_allclose(rates, [4.9, 5.0, 5.0, 5.1])
+    mock_load.assert_called_once()
+    assert mock_load.call_args.args[0] == 'BRL=X'
+
+
+def test_fx_at_accepts_tz_aware_dates():
+    dates = pd.date_range('2024-01-03', periods=2, tz='America/Sao_Paulo')
+    with patch.object(fx, 'load_price_history', return_value=_bars()):
+        np.testing.assert_allclose(fx.fx_at(dates), [5.0, 5.0])
+
+
+def test_fx_at_falls_back_to_spot_rate():
+    empty = pd.DataFrame(columns=['Close'])
+    with patch.object(fx, 'load_price_history', return_value=empty), \
+            patch.object(fx, 'usd_exchange_rate', return_value=5.5):
+        np.testing.assert_allclose(fx.fx_at(['2024-01-03', '2024-01-04']), [5.5, 5.5])
+    with patch.object(fx, 'load_price_history', side_effect=Exception('boom')), \
+            patch.object(fx, 'usd_exchange_rate', return_value=None):
+        np.testing.assert_allclose(fx.fx_at(['2024-01-03']), [1.0])
+    assert len(fx.fx_at([])) == 0
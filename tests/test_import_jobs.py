@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+import pytest
+
+from app.import_jobs import enqueue_import, fail_interrupted_import_jobs
+from app.models import ImportJob
+
+
+@pytest.fixture
+def tmp_csv():
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    yield path
+    os.remove(path)
+
+
+def test_failed_import_is_recorded_on_the_job(db_session, tmp_csv):
+    with open(tmp_csv, 'w') as f:
+        f.write('Data,Produto\nnot-a-date,PETR4\n')
+    job = enqueue_import(tmp_csv, 'broken.csv', 'B3 Movimentation')
+    assert job.status == 'failed'
+    assert job.finished and job.error
+    assert job.added == 0
+
+
+def test_fail_interrupted_import_jobs(db_session):
+    db_session.add_all([
+        ImportJob(filename='a.csv', filepath='a.csv', filetype='B3 Negotiation', status='running'),
+        ImportJob(filename='b.csv', filepath='b.csv', filetype='B3 Negotiation', status='done'),
+    ])
+    db_session.commit()
+    assert fail_interrupted_import_jobs() == 1
+    assert {job.filename: job.status for job in ImportJob.query} == {'a.csv': 'failed', 'b.csv': 'done'}
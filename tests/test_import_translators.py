@@ -0,0 +1,101 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.import_translators import (
+    avenue_extract_frame,
+    avenue_extract_row,
+    b3_movimentation_frame,
+    b3_movimentation_row,
+    b3_negotiation_frame,
+    b3_negotiation_row,
+    generic_extract_frame,
+    generic_extract_row,
+)
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _same(a, b):
+    if _missing(a) or _missing(b):
+        return _missing(a) and _missing(b)
+    return a == b
+
+
+def _assert_parity(df, frame_fn, row_fn):
+    records = frame_fn(df)
+    expected = [row_fn(row) for _, row in df.iterrows()]
+    assert len(records) == len(expected)
+    for record, row in zip(records, expected):
+        assert record.keys() == row.keys()
+        for key in row:
+            assert _same(record[key], row[key]), (key, record[key], row[key])
+
+
+B3_MOVIMENTATION = pd.DataFrame({
+    'Entrada/Saída': ['Credito', 'Debito', 'Credito', None],
+    'Data': ['2024-01-15', '2024-01-16', '2024-01-17', '2024-01-18'],
+    'Movimentação': ['Compra', 'Transferência - Liquidação', 'Rendimento', None],
+    'Produto': ['PETR4 - PETROBRAS', 'HGLG11 - CSHG LOG', 'Tesouro Selic 2029', None],
+    'Instituição': ['X', 'X', None, 'Y'],
+    'Quantidade': [100.0, 10.0, 0.0, 0.0],
+    'Preço unitário': [10.0, 150.0, 0.0, 0.0],
+    'Valor da Operação': [1000.0, 1500.0, 12.5, 0.0],
+}, index=[3, 5, 8, 9])
+
+
+def test_b3_movimentation_frame_matches_row():
+    _assert_parity(B3_MOVIMENTATION, b3_movimentation_frame, b3_movimentation_row)
+
+
+def test_b3_negotiation_frame_matches_row():
+    df = pd.DataFrame({
+        'Data do Negócio': ['2024-02-20', '2024-02-21'],
+        'Tipo de Movimentação': ['Compra', 'Venda'],
+        'Mercado': ['Mercado à Vista', np.nan],
+        'Prazo/Vencimento': ['-', '-'],
+        'Instituição': ['X', 'X'],
+        'Código de Negociação': ['HGLG11', 'PETR4F'],
+        'Quantidade': [10, 3],
+        'Preço': [150.0, 11.0],
+        'Valor': [1500.0, 33.0],
+    })
+    _assert_parity(df, b3_negotiation_frame, b3_negotiation_row)
+
+
+def test_avenue_extract_frame_matches_row():
+    df = pd.DataFrame({
+        'Data': ['2024-03-01', '2024-03-02'],
+        'Liquidação': ['2024-03-03', '2024-03-04'],
+        'Hora': ['10:00:00', ''],
+        'Descrição': ['Compra de 5 NVDA a $ 200,00 cada', 'Dividendos de MSFT'],
+        'Valor (U$)': [-1000.0, 3.2],
+        'Saldo da conta (U$)': [0.0, 3.2],
+        'Entrada/Saída': ['Credito', 'Credito'],
+        'Produto': ['NVDA', 'MSFT'],
+        'Movimentação': ['Compra', 'Dividendos'],
+        'Quantidade': [5.0, None],
+        'Preço unitário': [200.0, None],
+    })
+    _assert_parity(df, avenue_extract_frame, avenue_extract_row)
+
+
+@pytest.mark.parametrize('label', ['Buy', '', 'Mystery'])
+def test_generic_extract_frame_matches_row(label):
+    df = pd.DataFrame({
+        'Date': ['2024-01-01', '2024-01-02'],
+        'Asset': ['AAA', None],
+        'Movimentation': [label, label],
+        'Quantity': [10.0, 2.0],
+        'Price': [5.0, 6.0],
+        'Total': [50.0, -12.0],
+    })
+    _assert_parity(df, generic_extract_frame, generic_extract_row)
+
+
+def test_frame_translators_handle_empty_frames():
+    assert b3_movimentation_frame(B3_MOVIMENTATION.iloc[0:0]) == []
@@ -10,8 +10,12 @@ from app.importing import (
     import_b3_negotiation,
     import_avenue_extract,
     import_generic_extract,
+    import_file,
+    import_files,
+    IMPORTERS,
 )
-from app.models import Transaction
+from app.import_translators import b3_movimentation_frame
+from app.models import ImportedFile, Transaction
 
 
 pytestmark = pytest.mark.usefixtures("request_ctx")
@@ -152,3 +156,270 @@ def test_import_generic_extract(db_session, tmp_csv):
     assert len(rows) == 1
     assert rows[0].asset == 'AAA'
     assert rows[0].category == 'BUY'
+
+
+def test_import_registers_asset_aliases(db_session, tmp_csv):
+    from app.models import AssetAlias, resolve_asset
+    from app.processing.assets import load_asset_transactions
+
+    df = pd.DataFrame([{
+        'Data do Negócio': '20/02/2024', 'Tipo de Movimentação': 'Compra',
+        'Mercado': 'Fracionário', 'Prazo/Vencimento': '-', 'Instituição': 'X',
+        'Código de Negociação': 'ITSA4F', 'Quantidade': 7,
+        'Preço': 10.0, 'Valor': 70.0,
+    }])
+    _write_csv(tmp_csv, df)
+    import_b3_negotiation(pd.read_csv(tmp_csv), tmp_csv)
+
+    assert AssetAlias.query.filter_by(source='b3', alias='ITSA4F').one().asset == 'ITSA4'
+    assert resolve_asset('b3', 'ITSA4F') == 'ITSA4'
+    assert resolve_asset('b3', 'ITSA4') == 'ITSA4'
+    assert resolve_asset('b3', 'UNKNOWN') == 'UNKNOWN'
+
+    asset, rows = load_asset_transactions('b3', 'ITSA4F')
+    assert asset == 'ITSA4'
+    assert rows['Quantity'].sum() == 7
+
+
+def test_import_b3_movimentation_bulk(db_session, tmp_csv):
+    n = 20_000
+    df = pd.DataFrame({
+        'Entrada/Saída': ['Credito', 'Debito'] * (n // 2),
+        'Data': ['15/01/2024'] * n,
+        'Movimentação': ['Compra', 'Venda'] * (n // 2),
+        'Produto': ['PETR4 - PETROBRAS', 'VALE3 - VALE'] * (n // 2),
+        'Instituição': ['X'] * n,
+        'Quantidade': [1.0] * n,
+        'Preço unitário': [10.0] * n,
+        'Valor da Operação': [10.0] * n,
+    })
+    _write_csv(tmp_csv, df)
+    import_b3_movimentation(pd.read_csv(tmp_csv), tmp_csv)
+    assert Transaction.query.filter_by(source='b3', record_type='movimentation').count() == n
+    assert Transaction.query.filter_by(asset='VALE3').count() == n // 2
+
+
+def _movimentation_csv(path, n):
+    df = pd.DataFrame({
+        'Entrada/Saída': ['Credito'] * n,
+        'Data': [f'{day + 1:02d}/01/2024' for day in range(n)],
+        'Movimentação': ['Compra'] * n,
+        'Produto': ['PETR4 - PETROBRAS'] * n,
+        'Instituição': ['X'] * n,
+        'Quantidade': [1.0] * n,
+        'Preço unitário': [10.0] * n,
+        'Valor da Operação': [10.0] * n,
+    })
+    _write_csv(path, df)
+
+
+def test_import_file_streams_chunks_with_progress(db_session, tmp_csv):
+    _movimentation_csv(tmp_csv, 10)
+    calls = []
+    result = import_file(tmp_csv, 'B3 Movimentation', chunksize=4,
+                         progress=lambda *counts: calls.append(counts))
+    assert result == dict(rows=10, added=10, duplicates=0, error=None)
+    assert calls == [(4, 4, 0), (8, 8, 0), (10, 10, 0)]
+    assert Transaction.query.filter_by(source='b3', asset='PETR4').count() == 10
+
+    # Chunk row indexes continue across chunks: same origin_ids as a
+    # whole-file import, so it dedups against it.
+    import_b3_movimentation(pd.read_csv(tmp_csv), tmp_csv)
+    assert Transaction.query.count() == 10
+
+
+def test_import_file_failure_rolls_back_only_current_chunk(db_session, tmp_csv, monkeypatch):
+    _movimentation_csv(tmp_csv, 10)
+    prepare, frame, suffix = IMPORTERS['B3 Movimentation']
+    calls = []
+
+    def flaky(df):
+        calls.append(len(df))
+        if len(calls) == 2:
+            raise RuntimeError('boom')
+        return frame(df)
+
+    monkeypatch.setitem(IMPORTERS, 'B3 Movimentation', (prepare, flaky, suffix))
+    result = import_file(tmp_csv, 'B3 Movimentation', chunksize=4, progress=None)
+    assert result['rows'] == 4 and result['added'] == 4
+    assert 'boom' in result['error']
+    assert Transaction.query.count() == 4
+
+    monkeypatch.setitem(IMPORTERS, 'B3 Movimentation', (prepare, b3_movimentation_frame, suffix))
+    result = import_file(tmp_csv, 'B3 Movimentation', chunksize=4, progress=None)
+    assert result == dict(rows=10, added=6, duplicates=4, error=None)
+    assert Transaction.query.count() == 10
+
+
+def test_import_file_dedups_overlapping_exports_by_fingerprint(db_session, tmp_csv):
+    _movimentation_csv(tmp_csv, 6)
+    # Two identical trades on one day are kept as two rows.
+    df = pd.read_csv(tmp_csv)
+    df.loc[5] = df.loc[4]
+    _write_csv(tmp_csv, df)
+    assert import_file(tmp_csv, 'B3 Movimentation', progress=None)['added'] == 6
+
+    # A later export, under another name, overlapping the first one.
+    fd, other = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        _movimentation_csv(other, 8)
+        df = pd.read_csv(other)
+        df.loc[8] = df.loc[4]
+        _write_csv(other, df.sort_index())
+        result = import_file(other, 'B3 Movimentation', chunksize=3, progress=None)
+    finally:
+        os.remove(other)
+    assert result == dict(rows=9, added=3, duplicates=6, error=None)
+    assert Transaction.query.count() == 9
+    assert Transaction.query.filter(Transaction.fingerprint.is_(None)).count() == 0
+
+
+def test_import_file_skips_already_imported_content(db_session, tmp_csv, monkeypatch):
+    _movimentation_csv(tmp_csv, 5)
+    import_file(tmp_csv, 'B3 Movimentation', progress=None)
+    assert ImportedFile.query.one().rows == 5
+
+    fd, renamed = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        with open(tmp_csv, 'rb') as src, open(renamed, 'wb') as dst:
+            dst.write(src.read())
+        monkeypatch.setattr('app.importing.pd.read_csv', None)  # must not be parsed
+        result = import_file(renamed, 'B3 Movimentation', progress=None)
+    finally:
+        os.remove(renamed)
+    assert result == dict(rows=5, added=0, duplicates=5, error=None)
+    assert Transaction.query.count() == 5
+
+
+@pytest.fixture
+def batch_csvs(tmp_path):
+    paths = []
+    for month in (1, 2):
+        path = tmp_path / f'mov{month}.csv'
+        pd.DataFrame({
+            'Entrada/Saída': ['Credito'] * 3,
+            'Data': [f'{day:02d}/{month:02d}/2024' for day in (1, 2, 3)],
+            'Movimentação': ['Compra'] * 3,
+            'Produto': ['PETR4 - PETROBRAS', 'VALE3 - VALE', 'ITSA4 - ITAUSA'],
+            'Instituição': ['X'] * 3,
+            'Quantidade': [1.0] * 3,
+            'Preço unitário': [10.0] * 3,
+            'Valor da Operação': [10.0] * 3,
+        }).to_csv(path, index=False)
+        paths.append(str(path))
+    broken = tmp_path / 'broken.csv'
+    broken.write_text('Data,Produto\nnot-a-date,PETR4\n')
+    return paths + [str(broken)]
+
+
+def test_import_files_batch_invalidates_cache_once(db_session, batch_csvs, monkeypatch):
+    calls = []
+    monkeypatch.setattr('app.importing.invalidate_processing_cache', lambda: calls.append(1))
+    first, second, broken = batch_csvs
+    progress = []
+    results = import_files(
+        [(first, 'B3 Movimentation'), (second, 'B3 Movimentation'),
+         (broken, 'B3 Movimentation'), (first, 'B3 Movimentation')],
+        processes=0, progress=lambda *args: progress.append(args))
+
+    assert [r['added'] for r in results] == [3, 3, 0, 0]
+    assert results[3] == dict(rows=3, added=0, duplicates=3, error=None)
+    assert results[2]['error'] and results[0]['error'] is None
+    assert Transaction.query.count() == 6
+    assert len(calls) == 1
+    assert (0, 3, 3, 0) in progress and (3, 3, 0, 3) in progress
+
+
+def test_import_files_parses_in_worker_processes(db_session, batch_csvs):
+    first, second, _ = batch_csvs
+    results = import_files([(first, 'B3 Movimentation'), (second, 'B3 Movimentation')], processes=2)
+    assert results == [dict(rows=3, added=3, duplicates=0, error=None)] * 2
+    assert Transaction.query.filter_by(asset='ITSA4').count() == 2
+
+
+def _extract_fill_apply(df):
+    """Reference: the former per-row `.apply` parser."""
+    import re
+
+    def safe_str(x):
+        if x is None or (isinstance(x, float) and pd.isna(x)):
+            return ''
+        return str(x)
+    df['Descrição'] = df['Descrição'].apply(safe_str)
+
+    def parse_entrada_saida(x):
+        if re.match(r'Câmbio|Compra|Dividendos|Estorno', x):
+            return 'Credito'
+        return 'Debito'
+    df['Entrada/Saída'] = df['Descrição'].apply(parse_entrada_saida)
+
+    def parse_produto(x):
+        match = re.search(r'(Compra|Venda) de [0-9.,]+ ([A-Z]{1,5})', x)
+        if match:
+            return match.group(2)
+        match = re.search(r'(sobre dividendo de|de) ([A-Z]{1,5})', x)
+        if match:
+            return match.group(2)
+        match = re.search(r'(Dividendos|Corretagem) ([A-Z]{1,4})', x)
+        if match:
+            return match.group(2)
+        return ''
+    df['Produto'] = df['Descrição'].apply(parse_produto)
+
+    def parse_movimentacao(x):
+        if re.search(r'Imposto sobre dividendo', x):
+            return 'Impostos'
+        if re.search(r'corretagem', x, re.IGNORECASE):
+            return 'Corretagem'
+        match = re.search(r'Câmbio|Compra|Venda|Impostos|Dividendos|Corretagem|Desdobramento', x)
+        if match:
+            return match.group(0)
+        return '???'
+    df['Movimentação'] = df['Descrição'].apply(parse_movimentacao)
+
+    def parse_quantidade(x):
+        match = re.search(r'(Compra de|Venda de) ([0-9.,]+)', x)
+        if match:
+            return float(match.group(2).replace(',', '.'))
+        return None
+    df['Quantidade'] = df['Descrição'].apply(parse_quantidade)
+
+    def parse_preco_unitario(x):
+        match = re.search(r'\$[\s\xa0]?([0-9.,]+)', x)
+        if match:
+            return float(match.group(1).replace(',', '.'))
+        return None
+    df['Preço unitário'] = df['Descrição'].apply(parse_preco_unitario)
+    return df
+
+
+def test_extract_fill_matches_per_row_parser():
+    descriptions = [
+        'Compra de 5 NVDA a $\xa0209,00 cada',
+        'Venda de 0,77 ASML a $ 600,00 cada',
+        'Compra de 12 BRKB a $ 310.5 cada',
+        'Dividendos de MSFT',
+        'Dividendos MSFT. *** Valor bruto $ 1,20',
+        'Imposto sobre dividendo de MSFT',
+        'Cobrança de taxa de corretagem',
+        'Corretagem AAPL',
+        'Câmbio de R$ 5000,00 para $ 1000,00',
+        'Estorno de taxa',
+        'Desdobramento de ações TSLA',
+        'Impostos retidos',
+        'Transferência recebida',
+        '',
+        None,
+        float('nan'),
+        123,
+    ]
+    df = pd.DataFrame({'Descrição': descriptions * 3}, index=range(100, 100 + 3 * len(descriptions)))
+    expected = _extract_fill_apply(df.copy())
+    out = extract_fill(df.copy())
+    for column in ['Descrição', 'Entrada/Saída', 'Produto', 'Movimentação']:
+        assert list(out[column]) == list(expected[column]), column
+    for column in ['Quantidade', 'Preço unitário']:
+        pd.testing.assert_series_equal(out[column].astype(float), expected[column].astype(float),
+                                       check_names=False)
@@ -2,7 +2,11 @@
 import pytest
 
 from app import db
-from app.migrate_to_transaction import migrate_legacy_to_transaction
+from app.migrate_to_transaction import (
+    add_transaction_fingerprint_column,
+    backfill_transaction_fingerprints,
+    migrate_legacy_to_transaction,
+)
 from app.models import (
     AvenueExtract, B3Movimentation, B3Negotiation, GenericExtract, Transaction,
 )
@@ -93,3 +97,44 @@ def test_migration_is_idempotent(db_session):
     assert s1['generic_extract'] == (1, 0)
     assert s2['generic_extract'] == (0, 1)  # second pass: already migrated
     assert Transaction.query.count() == 1
+
+
+def test_backfill_transaction_fingerprints_matches_import(db_session, tmp_path):
+    import pandas as pd
+    from app.importing import import_file
+
+    path = tmp_path / 'mov.csv'
+    pd.DataFrame({
+        'Entrada/Saída': ['Credito'] * 3,
+        'Data': ['15/01/2024'] * 3,
+        'Movimentação': ['Compra'] * 3,
+        'Produto': ['PETR4 - PETROBRAS', 'PETR4 - PETROBRAS', 'VALE3 - VALE'],
+        'Instituição': ['X'] * 3,
+        'Quantidade': [1.0] * 3,
+        'Preço unitário': [10.0] * 3,
+        'Valor da Operação': [10.0] * 3,
+    }).to_csv(path, index=False)
+    import_file(str(path), 'B3 Movimentation', progress=None)
+    expected = {t.id: t.fingerprint for t in Transaction.query}
+
+    db.session.add(Transaction(origin_id='FORM:abc', source='b3', record_type='negotiation',
+                               date='2024-01-16', category='BUY'))
+    Transaction.query.update({'fingerprint': None})
+    db.session.commit()
+
+    assert backfill_transaction_fingerprints() == 3
+    assert {t.id: t.fingerprint for t in Transaction.query if t.origin_id != 'FORM:abc'} == expected
+    assert Transaction.query.filter_by(origin_id='FORM:abc').one().fingerprint is None
+    assert backfill_transaction_fingerprints() == 0
+
+
+def test_add_transaction_fingerprint_column(db_session):
+    assert add_transaction_fingerprint_column() is False
+    db.session.execute(db.text('DROP INDEX ix_transaction_fingerprint'))
+    db.session.execute(db.text('ALTER TABLE "transaction" DROP COLUMN fingerprint'))
+    db.session.commit()
+
+    assert add_transaction_fingerprint_column() is True
+    columns = {c['name'] for c in db.inspect(db.engine).get_columns('transaction')}
+    assert 'fingerprint' in columns
+    assert add_transaction_fingerprint_column() is False
@@ -83,3 +83,18 @@ def test_api_config_get_set(db_session):
     db.session.add(ApiConfig(provider='gemini', api_key='sk-test'))
     db.session.commit()
     assert get_api_key('gemini') == 'sk-test'
+
+
+def test_backfill_asset_aliases(db_session):
+    from app import db
+    from app.models import AssetAlias, Transaction, backfill_asset_aliases
+    db.session.add(Transaction(
+        origin_id='t1', source='b3', record_type='movimentation',
+        date='2024-01-15', asset='PETR4', product='PETR4 - PETROBRAS',
+        raw_label='Compra', category='BUY', currency='BRL',
+    ))
+    db.session.commit()
+    assert backfill_asset_aliases() == 3
+    assert backfill_asset_aliases() == 0
+    aliases = {a.alias: a.asset for a in AssetAlias.query.all()}
+    assert aliases == {'PETR4': 'PETR4', 'PETR4 - PETROBRAS': 'PETR4', 'PETR4F': 'PETR4'}
@@ -6,6 +6,8 @@ from app.utils.parsing import (
     is_b3_fii_ticker,
     parse_b3_product,
     parse_b3_ticker,
+    b3_product,
+    b3_ticker,
     brl_to_float,
 )
 
@@ -58,6 +60,31 @@ def test_parse_b3_product_and_ticker():
     assert "Tesouro" in tickers[2]
 
 
+def test_b3_ticker_scalar_matches_column_parse():
+    products = [
+        "PETR4 - PETROLEO BRASILEIRO",
+        "HGLG11 - CSHG LOGISTICA",
+        "Tesouro Selic 2029",
+        "",
+        "- sem ticker",
+        None,
+    ]
+    s = pd.Series(products * 3)
+    legacy_ticker = s.str.extract(r'^([A-Z0-9]{4}[0-9]{1,2}|[a-zA-Z0-9 .]+)', expand=False).fillna('')
+    legacy_product = s.str.extract(r'^([A-Z0-9]{4}|[a-zA-Z0-9 .]+)', expand=False).fillna('')
+    assert parse_b3_ticker(s).tolist() == legacy_ticker.tolist()
+    assert parse_b3_product(s).tolist() == legacy_product.tolist()
+    assert [b3_ticker(p) for p in s] == legacy_ticker.tolist()
+    assert [b3_product(p) for p in s] == legacy_product.tolist()
+
+
+def test_parse_b3_ticker_parses_each_distinct_product_once():
+    b3_ticker.cache_clear()
+    s = pd.Series(["PETR4 - PETROLEO BRASILEIRO", "VALE3 - VALE"] * 1000)
+    assert parse_b3_ticker(s).value_counts().to_dict() == {"PETR4": 1000, "VALE3": 1000}
+    assert b3_ticker.cache_info().misses == 2
+
+
 @pytest.mark.parametrize("raw,expected", [
     ("R$ 10,50", 10.50),
     ("R$ 1.234,56", 1234.56),
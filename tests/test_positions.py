@@ -0,0 +1,96 @@
+"""Tests for the materialized PositionSnapshot ledger."""
+from unittest.mock import patch
+
+import pytest
+
+from app import db
+from app.models import PositionSnapshot, Transaction
+from app.processing import (
+    build_b3_asset_info,
+    load_asset_transactions,
+    refresh_position_snapshots,
+    snapshot_asset_info,
+    update_position_snapshots,
+)
+
+
+pytestmark = pytest.mark.usefixtures("request_ctx")
+
+
+def _b3(oid, date, label, category, quantity, price, total, record_type='negotiation'):
+    return dict(
+        origin_id=oid, source='b3', record_type=record_type, date=date,
+        asset='PETR4', product='PETR4', raw_label=label, category=category,
+        direction='Credito' if category != 'SELL' else 'Debito',
+        quantity=quantity, price=price, total=total, currency='BRL',
+    )
+
+
+def _insert(*records):
+    for record in records:
+        db.session.add(Transaction(**record))
+    db.session.commit()
+    update_position_snapshots(list(records))
+
+
+def _fresh_info():
+    _, df = load_asset_transactions('b3', 'PETR4')
+    return build_b3_asset_info('PETR4', df)
+
+
+_FIELDS = ('position', 'cost', 'avg_price', 'realized_gain', 'wages_sum', 'taxes_sum',
+           'liquid_cost', 'capital_gain', 'first_buy', 'sells_value_sum')
+
+
+@pytest.fixture
+def online():
+    with patch('app.processing.get_online_info') as mock_online:
+        mock_online.side_effect = lambda t, info: info.update({'last_close_price': 30.0}) or info
+        yield mock_online
+
+
+def test_incremental_update_matches_full_replay(db_session, online):
+    _insert(_b3('n1', '2024-01-10', 'Compra', 'BUY', 10, 10.0, 100.0))
+    snapshot = PositionSnapshot.query.filter_by(source='b3', asset='PETR4').one()
+    assert snapshot.position == 10
+    assert snapshot.as_of == '2024-01-10'
+
+    _insert(
+        _b3('n2', '2024-02-10', 'Compra', 'BUY', 10, 20.0, 200.0),
+        _b3('n3', '2024-03-10', 'Venda', 'SELL', 5, 25.0, 125.0),
+        _b3('m1', '2024-03-15', 'Dividendo', 'DIVIDEND', 0, 0, 12.0,
+            record_type='movimentation'),
+    )
+    snapshot = PositionSnapshot.query.filter_by(source='b3', asset='PETR4').one()
+    assert snapshot.txn_count == 4
+    assert snapshot.realized_gain == pytest.approx((25.0 - 15.0) * 5)
+
+    from_snapshot = snapshot_asset_info(snapshot)
+    expected = _fresh_info()
+    for field in _FIELDS:
+        assert from_snapshot[field] == expected[field], field
+
+
+def test_backdated_insert_rebuilds_asset(db_session, online):
+    _insert(
+        _b3('n1', '2024-02-10', 'Compra', 'BUY', 10, 20.0, 200.0),
+        _b3('n2', '2024-03-10', 'Venda', 'SELL', 5, 25.0, 125.0),
+    )
+    # A buy dated before the sell changes the sell's average price.
+    _insert(_b3('n3', '2024-01-10', 'Compra', 'BUY', 10, 10.0, 100.0))
+    snapshot = PositionSnapshot.query.filter_by(source='b3', asset='PETR4').one()
+    assert snapshot.realized_gain == pytest.approx((25.0 - 15.0) * 5)
+    assert snapshot.first_buy == '2024-01-10'
+    assert snapshot_asset_info(snapshot)['position'] == _fresh_info()['position']
+
+
+def test_refresh_rebuilds_stale_and_drops_orphans(db_session):
+    db.session.add(Transaction(**_b3('n1', '2024-01-10', 'Compra', 'BUY', 10, 10.0, 100.0)))
+    db.session.add(PositionSnapshot(source='b3', asset='GONE3', txn_count=1, last_txn_id=99))
+    db.session.commit()
+
+    assert refresh_position_snapshots() == 1
+    assert PositionSnapshot.query.filter_by(asset='GONE3').first() is None
+    assert PositionSnapshot.query.filter_by(asset='PETR4').one().position == 10
+    # Nothing changed since: no rebuild.
+    assert refresh_position_snapshots() == 0
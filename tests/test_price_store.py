@@ -0,0 +1,126 @@
+"""Tests for the local PriceBar price-history store."""
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from app.models import PriceBar
+from app.utils import price_store
+
+
+def _bars(start, periods, close=10.0):
+    index = pd.date_range(start, periods=periods, freq='B', tz='America/Sao_Paulo')
+    return pd.DataFrame({
+        'Open': close, 'High': close + 1, 'Low': close - 1, 'Close': close,
+        'Adj Close': close - 0.5, 'Volume': 1000.0,
+        'Dividends': 0.0, 'Stock Splits': 0.0,
+    }, index=index)
+
+
+@pytest.fixture(autouse=True)
+def _reset_sync_state():
+    price_store.clear_sync_state()
+    yield
+    price_store.clear_sync_state()
+
+
+def test_first_load_downloads_and_stores(db_session):
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        mock_ticker.return_value.history.return_value = _bars('2024-01-01', 5)
+        df = price_store.load_price_history('PETR4.SA', '2024-01-01')
+    assert PriceBar.query.filter_by(ticker='PETR4.SA').count() == 5
+    assert list(df.columns) == list(price_store._COLUMNS)
+    assert df.index[0] == pd.Timestamp('2024-01-01')
+    assert df['Adj Close'].iloc[0] == 9.5
+
+    # Within the TTL a second read is served locally.
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        again = price_store.load_price_history('PETR4.SA', '2024-01-02')
+    mock_ticker.assert_not_called()
+    assert len(again) == 4
+
+
+def test_incremental_sync_fetches_only_missing_ranges(db_session):
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        mock_ticker.return_value.history.return_value = _bars('2024-02-01', 5)
+        price_store.load_price_history('AAPL', '2024-02-01')
+    price_store.clear_sync_state()
+
+    calls = []
+
+    def history(start, end, **kwargs):
+        calls.append((str(start), str(end)))
+        if end is None:
+            # Last stored bar refreshed plus two new days.
+            return _bars('2024-02-07', 3, close=20.0)
+        return _bars('2024-01-29', 3, close=5.0)
+
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        mock_ticker.return_value.history.side_effect = history
+        df = price_store.load_price_history('AAPL', '2024-01-29')
+
+    assert calls == [('2024-01-29', '2024-02-01'), ('2024-02-07', 'None')]
+    assert len(df) == 3 + 5 + 2
+    assert df.loc['2024-02-07', 'Close'] == 20.0
+    assert df.index.is_unique
+
+
+def test_empty_head_download_is_not_retried(db_session):
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        mock_ticker.return_value.history.side_effect = [
+            _bars('2024-03-01', 3), pd.DataFrame()]
+        price_store.load_price_history('NEW3.SA', '2024-03-01')
+        # Asking for an earlier start than the listing: one empty download.
+        price_store.load_price_history('NEW3.SA', '2020-01-01')
+        price_store.load_price_history('NEW3.SA', '2020-01-01')
+    assert mock_ticker.return_value.history.call_count == 2
+
+
+def test_last_bar_changes_when_the_bar_is_rewritten(db_session):
+    assert price_store.last_bar('AAPL') is None
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        mock_ticker.return_value.history.return_value = _bars('2024-02-01', 5)
+        price_store.sync_price_history('AAPL', '2024-02-01')
+    first = price_store.last_bar('AAPL')
+    assert first[:2] == ('2024-02-07', 10.0)
+
+    # An intraday re-sync rewrites the same date with a new close.
+    price_store.clear_sync_state()
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        mock_ticker.return_value.history.return_value = _bars('2024-02-07', 1, close=10.5)
+        price_store.sync_price_history('AAPL', '2024-02-01')
+    again = price_store.last_bar('AAPL')
+    assert again[:2] == ('2024-02-07', 10.5)
+    assert again != first
+
+
+def test_split_in_tail_refetches_stored_range(db_session):
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        mock_ticker.return_value.history.return_value = _bars('2024-02-01', 5, close=20.0)
+        price_store.load_price_history('PETR4.SA', '2024-02-01')
+    price_store.clear_sync_state()
+
+    calls = []
+
+    def history(start, end, **kwargs):
+        calls.append(str(start))
+        # After a 2:1 split on 2024-02-08 yfinance restates earlier closes.
+        bars = _bars(start, 6 if str(start) == '2024-02-01' else 2, close=10.0)
+        bars.loc[bars.index.strftime('%Y-%m-%d') == '2024-02-08', 'Stock Splits'] = 2.0
+        return bars
+
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        mock_ticker.return_value.history.side_effect = history
+        df = price_store.load_price_history('PETR4.SA', '2024-02-01')
+
+    assert calls == ['2024-02-07', '2024-02-01']
+    assert df['Close'].tolist() == [10.0] * 6
+    assert df.loc['2024-02-08', 'Stock Splits'] == 2.0
+
+    # The stored split is not an event on the next tail sync.
+    price_store.clear_sync_state()
+    calls.clear()
+    with patch.object(price_store.yf, 'Ticker') as mock_ticker:
+        mock_ticker.return_value.history.side_effect = history
+        price_store.load_price_history('PETR4.SA', '2024-02-01')
+    assert calls == ['2024-02-08']
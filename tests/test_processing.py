@@ -7,6 +7,7 @@ from app import db
 from app.models import Transaction
 from app.processing import (
     calc_avg_price,
+    calc_realized_gains,
     consolidate_asset_info,
     process_b3_asset_request,
     process_avenue_asset_request,
@@ -22,8 +23,29 @@ from app.processing import (
     consolidate_group,
     load_products,
     load_consolidate,
+    load_source_transactions,
+    load_source_consolidate,
     _extract_json_object,
+    yfinance_symbol,
+    load_asset_detail,
+    position_state,
+    AsOfIndex,
+    apply_position_state,
+    position_history,
+    history_figure,
+    process_history,
+    load_portfolio_positions,
+    portfolio_history,
+    value_positions,
+    portfolio_snapshots_current,
+    update_portfolio_snapshots,
+    discard_portfolio_snapshots,
+    load_portfolio_snapshots,
+    load_portfolio_history,
+    PORTFOLIO_COLUMNS,
+    HISTORY_COLUMNS,
 )
+from app.utils.memocache import invalidate_processing_cache
 
 
 pytestmark = pytest.mark.usefixtures("request_ctx")
@@ -102,6 +124,69 @@ def test_consolidate_asset_info_sold_out():
     assert out['asset_class'] == 'Sold'
 
 
+def test_calc_realized_gains_matches_per_sell_average():
+    rng = np.random.default_rng(7)
+    dates = pd.date_range('2020-01-01', periods=60, freq='7D')
+    buys = pd.DataFrame({
+        'Date': rng.choice(dates, size=25),
+        'Quantity': rng.integers(1, 50, size=25).astype(float),
+        'Price': rng.uniform(5, 50, size=25),
+    })
+    sells = pd.DataFrame({
+        'Date': np.sort(rng.choice(dates, size=10)),
+        'Quantity': -rng.integers(1, 20, size=10).astype(float),
+        'Price': rng.uniform(5, 50, size=10),
+    })
+    expected = [
+        (row['Price'] - calc_avg_price(buys.loc[buys['Date'] <= row['Date']])) * abs(row['Quantity'])
+        for _, row in sells.iterrows()
+    ]
+    assert calc_realized_gains(buys, sells) == pytest.approx(expected)
+
+
+def test_calc_realized_gains_without_buys():
+    sells = pd.DataFrame({
+        'Date': pd.to_datetime(['2024-01-01']),
+        'Quantity': [-2.0], 'Price': [10.0],
+    })
+    empty = pd.DataFrame({'Date': pd.to_datetime([]), 'Quantity': [], 'Price': []})
+    assert calc_realized_gains(empty, sells).tolist() == [20.0]
+    assert len(calc_realized_gains(empty, sells.iloc[0:0])) == 0
+
+
+def _random_events(rng, dates, size, sign=1.0):
+    return pd.DataFrame({
+        'Date': rng.choice(dates, size=size),
+        'Quantity': sign * rng.integers(1, 20, size=size).astype(float),
+        'Price': rng.uniform(5, 50, size=size),
+        'Total': rng.uniform(1, 500, size=size),
+    }).sort_values('Date', kind='mergesort').reset_index(drop=True)
+
+
+def test_asof_index_matches_position_state():
+    rng = np.random.default_rng(11)
+    dates = pd.date_range('2020-01-01', periods=80, freq='5D')
+    dataframes = {
+        'buys': _random_events(rng, dates, 30),
+        'sells': _random_events(rng, dates[20:], 8, sign=-1.0),
+        'wages': _random_events(rng, dates, 12),
+        'taxes': _random_events(rng, dates, 5),
+        'rent_wages': _random_events(rng, dates, 4),
+    }
+    index = AsOfIndex(dataframes)
+    probes = list(pd.date_range('2019-12-01', '2021-03-01', freq='9D'))
+    arrays = index.states_at(probes)
+    for i, probe in enumerate(probes):
+        expected, _ = position_state(dataframes, probe)
+        got = index.state_at(probe)
+        for field, value in expected.items():
+            if field in ('first_buy', 'last_sell'):
+                assert got[field] == value, (probe, field)
+            else:
+                assert got[field] == pytest.approx(value), (probe, field)
+                assert arrays[field][i] == pytest.approx(value), (probe, field)
+
+
 def test_adjust_for_splits():
     # Three days; on day 2 a 2:1 split occurs. Pre-split close should be /2.
     df = pd.DataFrame({
@@ -116,6 +201,49 @@ def test_adjust_for_splits():
     assert out.iloc[2]['Close'] == pytest.approx(50.0)
 
 
+def _adjust_for_splits_loop(df):
+    # The former row-by-row implementation, kept as the reference.
+    adjustment_factor = 1.0
+    for index in reversed(df.index):
+        if adjustment_factor != 1.0:
+            df.at[index, 'Close'] = df.at[index, 'Close'] / adjustment_factor
+        split = df.at[index, 'Stock Splits']
+        if split and split != 0:
+            adjustment_factor *= split
+    return df
+
+
+def test_adjust_for_splits_matches_loop():
+    rng = np.random.default_rng(5)
+    splits = np.zeros(300)
+    splits[[40, 41, 120, 299]] = [2.0, 3.0, 0.5, 4.0]
+    df = pd.DataFrame({
+        'Open': rng.uniform(10, 20, 300),
+        'High': rng.uniform(20, 30, 300),
+        'Low': rng.uniform(5, 10, 300),
+        'Close': rng.uniform(10, 20, 300),
+        'Stock Splits': splits,
+    }, index=pd.date_range('2020-01-01', periods=300))
+    expected = _adjust_for_splits_loop(df.copy())
+
+    out = adjust_for_splits(df.copy())
+    pd.testing.assert_series_equal(out['Close'], expected['Close'])
+    pd.testing.assert_series_equal(out['Open'], df['Open'])
+
+    ohlc = adjust_for_splits(df.copy(), adjust_ohlc=True)
+    pd.testing.assert_series_equal(ohlc['Close'], expected['Close'])
+    factor = df['Close'] / expected['Close']
+    pd.testing.assert_series_equal(ohlc['High'], df['High'] / factor, check_names=False)
+
+
+def test_adjust_for_splits_ignores_missing_factors():
+    df = pd.DataFrame({
+        'Close': [100.0, 50.0, 50.0],
+        'Stock Splits': [np.nan, 2.0, np.nan],
+    })
+    assert adjust_for_splits(df)['Close'].tolist() == [50.0, 50.0, 50.0]
+
+
 def test_merge_movimentation_negotiation():
     mov = pd.DataFrame({
         'Date': pd.to_datetime(['2024-01-01']),
@@ -244,3 +372,372 @@ def test_load_products_and_consolidate(db_session):
 ])
 def test_extract_json_object(raw, expected):
     assert _extract_json_object(raw) == expected
+
+
+def test_load_source_transactions_single_scan(db_session):
+    for oid, asset, qty in (('g1', 'AAA', 10), ('g2', 'BBB', 3), ('g3', 'AAA', 5)):
+        db.session.add(Transaction(
+            origin_id=oid, source='generic', record_type='extract',
+            date='2024-01-01', asset=asset, product=asset,
+            raw_label='Buy', category='BUY', direction='Credito',
+            quantity=qty, price=5.0, total=5.0 * qty, currency='BRL',
+        ))
+    db.session.commit()
+    groups = load_source_transactions('generic')
+    assert sorted(groups) == ['AAA', 'BBB']
+    assert groups['AAA']['Quantity'].sum() == 15
+
+    with patch('app.processing.get_online_info') as mock_online, \
+            patch('app.processing.consolidate.prefetch_quotes') as mock_prefetch:
+        mock_online.side_effect = lambda t, info: info.update({'last_close_price': 6.0}) or info
+        df = load_source_consolidate('generic')
+        expected = process_generic_asset_request('AAA')
+    row = df.set_index('name').loc['AAA']
+    assert row['position'] == expected['position'] == 15.0
+    assert row['cost'] == expected['cost']
+    assert 'url' in df.columns
+    mock_prefetch.assert_called_once_with(['AAA', 'BBB'])
+
+
+@patch('app.processing.consolidate.prefetch_quotes')
+@patch('app.processing.consolidate.usd_exchange_rate', return_value=5.0)
+@patch('app.processing.get_online_info')
+def test_process_consolidate_request_with_data(mock_online, _mock_rate, mock_prefetch, db_session):
+    mock_online.side_effect = lambda t, info: info.update({
+        'last_close_price': 12.0, 'currency': 'BRL', 'asset_class': 'Equity',
+    }) or info
+    db.session.add(Transaction(
+        origin_id='n1', source='b3', record_type='negotiation',
+        date='2024-01-15', asset='PETR4', product='PETR4F',
+        raw_label='Compra', category='BUY', direction='Credito',
+        quantity=100, price=10.0, total=1000.0, currency='BRL',
+    ))
+    db.session.add(Transaction(
+        origin_id='g1', source='generic', record_type='extract',
+        date='2024-01-01', asset='AAA', product='AAA',
+        raw_label='Buy', category='BUY', direction='Credito',
+        quantity=10, price=5.0, total=50.0, currency='BRL',
+    ))
+    db.session.commit()
+    out = process_consolidate_request()
+    assert out['valid'] is True
+    by_group = out['consolidate_by_group'].set_index('asset_class')
+    assert by_group.loc['Total', 'position'] == 100 * 12.0 + 10 * 12.0
+    # Every held asset of every source is priced by a single prefetch.
+    mock_prefetch.assert_called_once()
+    assert sorted(mock_prefetch.call_args[0][0]) == ['AAA', 'PETR4']
+
+
+@patch('app.processing.get_online_info')
+def test_asset_request_matches_asset_exactly(mock_online, db_session):
+    mock_online.side_effect = lambda t, info: info.update({'last_close_price': 7.0}) or info
+    for oid, asset in (('g1', 'AAA'), ('g2', 'AAAB')):
+        db.session.add(Transaction(
+            origin_id=oid, source='generic', record_type='extract',
+            date='2024-01-01', asset=asset, product=asset,
+            raw_label='Buy', category='BUY', direction='Credito',
+            quantity=10, price=5.0, total=50.0, currency='BRL',
+        ))
+    db.session.commit()
+    info = process_generic_asset_request('AAA')
+    assert info['position'] == 10.0
+
+
+def test_load_consolidate_parallel_keeps_order_and_reports_errors():
+    def process(asset):
+        if asset == 'BAD':
+            raise ValueError('boom')
+        info = {'valid': True, 'name': asset, 'position': 1.0}
+        if asset == 'NOQUOTE':
+            info['quote_error'] = 'Failed to get online data for NOQUOTE.'
+        return info
+
+    assets = ['DDD', 'BAD', 'AAA', 'NOQUOTE', 'CCC', '']
+    errors = []
+    df = load_consolidate(assets, process, 'generic', workers=4, errors=errors)
+    assert list(df['name']) == ['DDD', 'AAA', 'NOQUOTE', 'CCC']
+    assert 'quote_error' not in df.columns
+    assert errors == ['Failed to consolidate BAD: boom',
+                      'Failed to get online data for NOQUOTE.']
+
+    sequential = load_consolidate(assets, process, 'generic', workers=1)
+    pd.testing.assert_frame_equal(df, sequential)
+
+
+@pytest.mark.parametrize("ticker,expected", [
+    ('PETR4', 'PETR4.SA'),
+    ('HGLG11', 'HGLG11.SA'),
+    ('BTC', 'BTC-USD'),
+    ('AAPL', 'AAPL'),
+    ('VVAR3', None),
+    ('Tesouro Selic 2029', None),
+])
+def test_yfinance_symbol(ticker, expected):
+    assert yfinance_symbol(ticker) == expected
+
+
+@patch('app.processing.get_online_info')
+def test_asset_summary_excludes_detail_frames(mock_online, db_session):
+    mock_online.side_effect = lambda t, info: info.update({
+        'last_close_price': 30.0, 'info': {'longName': 'Big'}}) or info
+    for oid, label, category, qty, price in (('n1', 'Compra', 'BUY', 10, 10.0),
+                                             ('n2', 'Venda', 'SELL', 4, 25.0)):
+        db.session.add(Transaction(
+            origin_id=oid, source='b3', record_type='negotiation',
+            date='2024-01-1' + oid[-1], asset='PETR4', product='PETR4',
+            raw_label=label, category=category, direction='Credito',
+            quantity=qty, price=price, total=qty * price, currency='BRL',
+        ))
+    db.session.commit()
+
+    info = process_b3_asset_request('PETR4')
+    assert 'dataframes' not in info
+    assert 'info' not in info
+    assert info['position'] == 6.0
+
+    load_asset_detail(info)
+    sells = info['dataframes']['sells']
+    assert list(sells['Realized Gain']) == [(25.0 - 10.0) * 4]
+    assert len(info['dataframes']['buys']) == 1
+
+
+@pytest.mark.parametrize("step", [1, 5])
+def test_position_history_matches_per_point_consolidation(step):
+    rng = np.random.default_rng(3)
+    dates = pd.date_range('2021-01-04', periods=500, freq='B')
+    dataframes = {
+        'buys': _random_events(rng, dates[:300], 15),
+        'sells': _random_events(rng, dates[100:], 10, sign=-1.0),
+        'wages': _random_events(rng, dates, 12),
+        'taxes': _random_events(rng, dates, 4),
+        'rent_wages': _random_events(rng, dates, 3),
+    }
+    close = pd.Series(rng.uniform(10, 60, size=len(dates)),
+                      index=dates.tz_localize('America/Sao_Paulo'))
+
+    history = position_history(dataframes, close, step=step)
+
+    # Reference: the former loop, one apply_position_state per sampled day.
+    rows = []
+    for i in range(len(close) - 1, 0, -step):
+        day = close.index[i].tz_localize(None).normalize().to_pydatetime()
+        price = round(close.iloc[i], 2)
+        state, _ = position_state(dataframes, day)
+        info = {'ticker': 'X', 'date': day, 'last_close_price': price}
+        rows.append(apply_position_state(info, state, day, price))
+    expected = pd.DataFrame(rows)
+
+    assert len(history) == len(expected)
+    assert list(history['date']) == list(pd.to_datetime(expected['date']))
+    for column in HISTORY_COLUMNS:
+        if column in ('date', 'slope', 'position_slope'):
+            continue
+        np.testing.assert_allclose(history[column], expected[column].astype(float),
+                                   atol=0.011, err_msg=column)
+
+
+def test_position_history_short_series():
+    empty = pd.DataFrame(columns=['Date', 'Quantity', 'Price', 'Total'])
+    dataframes = {'buys': empty, 'sells': empty, 'wages': empty, 'taxes': empty}
+    close = pd.Series([10.0], index=pd.date_range('2024-01-01', periods=1))
+    assert list(position_history(dataframes, close).columns) == HISTORY_COLUMNS
+    assert position_history(dataframes, None).empty
+
+
+def test_history_figure_downsamples_each_trace():
+    dates = pd.date_range('2000-01-03', periods=6000, freq='D')
+    history = pd.DataFrame({column: np.random.default_rng(1).normal(size=len(dates))
+                            for column in HISTORY_COLUMNS if column != 'date'})
+    history['date'] = dates
+    history = history.iloc[::-1]  # position_history is newest first
+
+    fig = history_figure({'currency': 'BRL'}, history, max_points=200)
+    assert len(fig.data) == 10
+    for trace in fig.data:
+        assert len(trace.x) == 200
+        assert pd.Timestamp(trace.x[0]) == dates[0]
+        assert pd.Timestamp(trace.x[-1]) == dates[-1]
+
+    zoomed = history_figure({}, history, max_points=None, start='2005-01-01', end='2005-01-31')
+    assert len(zoomed.data[0].x) == 31
+    assert history_figure({}, history, start='2030-01-01') is None
+
+
+def _fake_price_history(closes):
+    def load(symbol, start, end=None, sync=True):
+        if symbol not in closes:
+            return pd.DataFrame(columns=['Close', 'Stock Splits'])
+        index = pd.bdate_range('2024-01-01', '2024-03-08', name='Date')
+        return pd.DataFrame({'Close': closes[symbol], 'Stock Splits': 0.0}, index=index)
+    return load
+
+
+def _add_portfolio_transactions():
+    db.session.add(Transaction(
+        origin_id='m1', source='b3', record_type='movimentation',
+        date='2024-01-15', asset='PETR4', product='PETR4 - PETROBRAS',
+        institution='X', raw_label='Compra', category='BUY',
+        direction='Credito', quantity=100, price=10.0, total=1000.0,
+        currency='BRL',
+    ))
+    db.session.add(Transaction(
+        origin_id='m2', source='b3', record_type='movimentation',
+        date='2024-02-15', asset='PETR4', product='PETR4 - PETROBRAS',
+        institution='X', raw_label='Dividendo', category='DIVIDEND',
+        direction='Credito', quantity=0, price=0, total=25.0,
+        currency='BRL',
+    ))
+    db.session.add(Transaction(
+        origin_id='a1', source='avenue', record_type='extract',
+        date='2024-03-01', settlement_date='2024-03-03', time='',
+        asset='NVDA', product='NVDA',
+        description='Compra de 5 NVDA a $ 200,00 cada',
+        raw_label='Compra', category='BUY', direction='Credito',
+        quantity=5, price=200.0, total=-1000.0, balance=0.0,
+        currency='USD',
+    ))
+    db.session.add(Transaction(
+        origin_id='g1', source='generic', record_type='extract',
+        date='2024-01-02', asset='AAA', product='AAA',
+        raw_label='Buy', category='BUY', direction='Credito',
+        quantity=10, price=5.0, total=50.0, currency='BRL',
+    ))
+    db.session.commit()
+
+
+_PORTFOLIO_CLOSES = {'PETR4.SA': 12.0, 'NVDA': 220.0, 'BRL=X': 5.0}
+
+
+@patch('app.utils.fx.load_price_history', side_effect=_fake_price_history(_PORTFOLIO_CLOSES))
+def test_portfolio_history_values_all_sources(mock_fx, db_session):
+    _add_portfolio_transactions()
+
+    closes = _PORTFOLIO_CLOSES
+    with patch('app.processing.portfolio.load_price_history', side_effect=_fake_price_history(closes)):
+        positions = load_portfolio_positions()
+        history = portfolio_history(positions, end='2024-03-08')
+
+    assert {(p['source'], p['asset']) for p in positions} == {
+        ('b3', 'PETR4'), ('avenue', 'NVDA'), ('generic', 'AAA')}
+    assert list(history.columns) == PORTFOLIO_COLUMNS
+    by_date = history.set_index('date')
+
+    # AAA has no quotes: valued at its average cost.
+    assert by_date.loc['2024-01-02', 'nav'] == 50.0
+    assert by_date.loc['2024-02-01', 'nav'] == 1250.0
+
+    day = by_date.loc['2024-03-04']
+    assert day['nav'] == 100 * 12.0 + 5 * 220.0 * 5.0 + 50.0
+    assert day['invested'] == (1000.0 - 25.0) + 5 * 200.0 * 5.0 + 50.0
+    assert day['wages'] == 25.0
+    assert day['capital_gain'] == 2 * 100 + 25.0 + 20 * 5 * 5.0
+    assert day['rentability'] == round(100 * day['capital_gain'] / day['invested'], 2)
+
+
+def test_portfolio_history_empty():
+    assert list(portfolio_history([]).columns) == PORTFOLIO_COLUMNS
+
+
+@patch('app.utils.fx.load_price_history', side_effect=_fake_price_history(_PORTFOLIO_CLOSES))
+@patch('app.processing.portfolio.load_price_history', side_effect=_fake_price_history(_PORTFOLIO_CLOSES))
+def test_portfolio_snapshots_append_and_discard(mock_prices, mock_fx, db_session):
+    _add_portfolio_transactions()
+    expected = portfolio_history(load_portfolio_positions(), end='2024-03-08')
+
+    with patch('app.processing.portfolio.value_positions', wraps=value_positions) as spy:
+        stored = update_portfolio_snapshots(end='2024-03-06')
+        assert spy.call_args.args[1][0] == pd.Timestamp('2024-01-02')
+        # Only the days since the last snapshot (recomputed) are valued again.
+        update_portfolio_snapshots(end='2024-03-08')
+        assert list(spy.call_args.args[1].strftime('%Y-%m-%d')) == ['2024-03-06', '2024-03-07', '2024-03-08']
+
+    assert stored > 0
+    # Friday's snapshot is current through the weekend.
+    assert portfolio_snapshots_current(today='2024-03-10')
+    assert not portfolio_snapshots_current(today='2024-03-11')
+    history = load_portfolio_history()
+    pd.testing.assert_frame_equal(history, expected, check_dtype=False)
+
+    petr4 = load_portfolio_snapshots(start='2024-03-04', end='2024-03-04', source='b3', asset='PETR4')
+    assert list(petr4['value']) == [1200.0]
+    assert list(petr4['position']) == [100.0]
+
+    # A back-dated import drops the snapshots from its date onwards.
+    discard_portfolio_snapshots([{'source': 'b3', 'asset': 'PETR4', 'date': '2024-02-01'}])
+    assert load_portfolio_history()['date'].max() == pd.Timestamp('2024-01-31')
+    with patch('app.processing.portfolio.value_positions', wraps=value_positions) as spy:
+        update_portfolio_snapshots(end='2024-03-08')
+        assert spy.call_args.args[1][0] == pd.Timestamp('2024-01-31')
+    pd.testing.assert_frame_equal(load_portfolio_history(), expected, check_dtype=False)
+
+
+@patch('app.utils.fx.load_price_history', side_effect=_fake_price_history(_PORTFOLIO_CLOSES))
+def test_portfolio_snapshots_update_starting_on_a_holiday(mock_fx, db_session):
+    db.session.add(Transaction(
+        origin_id='m1', source='b3', record_type='movimentation',
+        date='2024-01-15', asset='PETR4', product='PETR4 - PETROBRAS',
+        institution='X', raw_label='Compra', category='BUY',
+        direction='Credito', quantity=100, price=10.0, total=1000.0,
+        currency='BRL',
+    ))
+    db.session.commit()
+
+    # No B3 session on Carnival (2024-02-12/13); reads honour `start`.
+    carnival = pd.DatetimeIndex(['2024-02-12', '2024-02-13'])
+    index = pd.bdate_range('2024-01-01', '2024-03-08', name='Date').difference(carnival)
+
+    def load(symbol, start, end=None, sync=True):
+        bars = pd.DataFrame({'Close': 20.0, 'Stock Splits': 0.0}, index=index)
+        return bars[bars.index >= pd.Timestamp(start)]
+
+    with patch('app.processing.portfolio.load_price_history', side_effect=load):
+        update_portfolio_snapshots(end='2024-02-12')
+        # The incremental run starts on the holiday, recomputing it.
+        update_portfolio_snapshots(end='2024-02-14')
+
+    petr4 = load_portfolio_snapshots(start='2024-02-09', end='2024-02-14', source='b3', asset='PETR4')
+    assert list(petr4['price']) == [20.0] * 4
+    assert list(petr4['value']) == [2000.0] * 4
+
+
+@patch('app.processing.history.sync_price_history')
+@patch('app.processing.get_online_info')
+def test_process_history_is_memoized_on_ledger_and_last_bar(mock_online, mock_sync, db_session):
+    mock_online.side_effect = lambda t, info: info.update(
+        {'last_close_price': 12.0, 'yfinance_ticker': 'PETR4.SA'}) or info
+    _add_portfolio_transactions()
+    last_bar = [('2024-03-08', 12.0, '2024-03-08T18:00:00')]
+    prices = _fake_price_history(_PORTFOLIO_CLOSES)
+
+    with patch('app.processing.history.last_bar', side_effect=lambda t: last_bar[0]), \
+            patch('app.processing.history.load_price_history', side_effect=prices) as mock_prices:
+        first = process_history('PETR4', 'b3')
+        again = process_history('PETR4', 'b3', max_points=100, start='2024-02-01')
+        assert mock_prices.call_count == 1
+        assert len(again['history']) == len(first['history'])
+        assert len(again['figure'].data[0].x) < len(first['figure'].data[0].x)
+
+        # A new price bar changes the key.
+        last_bar[0] = ('2024-03-11', 12.0, '2024-03-11T13:00:00')
+        process_history('PETR4', 'b3')
+        assert mock_prices.call_count == 2
+
+        # So does an intraday re-sync rewriting the same bar.
+        last_bar[0] = ('2024-03-11', 12.4, '2024-03-11T15:00:00')
+        process_history('PETR4', 'b3')
+        assert mock_prices.call_count == 3
+
+        # So does a new trade (the import path also drops the whole cache).
+        db.session.add(Transaction(
+            origin_id='m3', source='b3', record_type='movimentation',
+            date='2024-03-05', asset='PETR4', product='PETR4 - PETROBRAS',
+            institution='X', raw_label='Compra', category='BUY',
+            direction='Credito', quantity=10, price=11.0, total=110.0,
+            currency='BRL',
+        ))
+        db.session.commit()
+        invalidate_processing_cache('asset')
+        invalidate_processing_cache('asset_detail')
+        latest = process_history('PETR4', 'b3')
+        assert mock_prices.call_count == 4
+        assert latest['history']['position'].iloc[0] == 110.0
@@ -1,10 +1,13 @@
-from unittest.mock import patch
+from datetime import date
+from unittest.mock import MagicMock, patch
 import io
+import os
 import pandas as pd
 import pytest
 
 from app import db
 from app.models import B3Negotiation, GenericExtract, AvenueExtract, ApiConfig
+from app.processing import HISTORY_CHART_POINTS
 
 
 def test_home_get(client):
@@ -59,6 +62,36 @@ def test_view_consolidate_no_data_redirects(client, db_session):
     assert resp.status_code in (200, 302)
 
 
+@patch('app.processing.consolidate.prefetch_quotes')
+@patch('app.processing.consolidate.usd_exchange_rate', return_value=5.0)
+@patch('app.processing.get_online_info')
+def test_view_consolidate_lists_asset_errors(mock_online, _mock_rate, _mock_prefetch, client, db_session):
+    from app.models import Transaction
+
+    def online(ticker, info):
+        if ticker == 'BBB':
+            raise RuntimeError('quote offline')
+        info.update({'last_close_price': 6.0, 'currency': 'BRL', 'asset_class': 'Equity'})
+        return info
+
+    mock_online.side_effect = online
+    for oid, asset in (('g1', 'AAA'), ('g2', 'BBB')):
+        db_session.add(Transaction(
+            origin_id=oid, source='generic', record_type='extract',
+            date='2024-01-01', asset=asset, product=asset,
+            raw_label='Buy', category='BUY', direction='Credito',
+            quantity=10, price=5.0, total=50.0, currency='BRL',
+        ))
+    db_session.commit()
+
+    # The second view is a cache hit and still lists the failure.
+    for _ in range(2):
+        resp = client.get('/consolidate')
+        assert resp.status_code == 200
+        assert 'Failed to consolidate BBB: quote offline' in resp.get_data(as_text=True)
+    assert mock_online.call_count == 2
+
+
 @patch('app.routes.consolidate.analyze_consolidate_performance_with_gemini')
 @patch('app.routes.consolidate.process_consolidate_request')
 def test_api_consolidate_analysis_success(mock_process, mock_analysis, client):
@@ -234,3 +267,272 @@ def test_format_money_filter():
     assert format_money(1_500_000) == '1.50 M'
     assert format_money(2_500_000_000) == '2.50 B'
     assert format_money(3_500_000_000_000) == '3.50 T'
+
+
+def test_plotly_bundle_is_served_once_and_cached(client):
+    resp = client.get('/vendor/plotly.min.js?v=1')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/javascript'
+    assert resp.cache_control.max_age == 365 * 24 * 3600
+    again = client.get('/vendor/plotly.min.js?v=1',
+                       headers={'If-None-Match': resp.headers['ETag']})
+    assert again.status_code == 304
+
+
+@patch('app.routes.charts.price_history_figure')
+@patch('app.routes.charts._load_asset_info_or_404')
+def test_api_chart_price_returns_figure_json(mock_loader, mock_figure, client):
+    import plotly.graph_objects as go
+    mock_loader.return_value = {'name': 'PETR4', 'source': 'b3', 'valid': True, 'info': {'symbol': 'X'}}
+    mock_figure.return_value = go.Figure(go.Scatter(x=[1, 2], y=[3, 4]))
+    resp = client.get('/api/chart/b3/PETR4/price')
+    assert resp.status_code == 200
+    figure = resp.get_json()['figure']
+    assert figure['data'][0]['y'] == [3, 4]
+
+
+@patch('app.routes.charts.process_history')
+def test_api_chart_history_without_data(mock_history, client):
+    mock_history.return_value = {'valid': True, 'figure': None}
+    resp = client.get('/api/chart/b3/PETR4/history?step=5')
+    assert resp.get_json() == {'figure': None}
+    mock_history.assert_called_once_with('PETR4', 'b3', step=5, max_points=HISTORY_CHART_POINTS,
+                                         start=None, end=None)
+
+
+@patch('app.routes.charts.process_history')
+def test_api_chart_history_zoom_window(mock_history, client):
+    mock_history.return_value = {'valid': True, 'figure': None}
+    client.get('/api/chart/b3/PETR4/history?points=300&start=2022-01-01T00:00:00&end=2023-06-30')
+    mock_history.assert_called_with('PETR4', 'b3', step=1, max_points=300,
+                                     start=date(2022, 1, 1), end=date(2023, 6, 30))
+
+    # Out of range budgets are clamped and invalid dates ignored.
+    client.get('/api/chart/b3/PETR4/history?points=1&start=bogus')
+    mock_history.assert_called_with('PETR4', 'b3', step=1, max_points=50, start=None, end=None)
+    client.get('/api/chart/b3/PETR4/history?points=10000000')
+    assert mock_history.call_args.kwargs['max_points'] == 10000
+
+
+@patch('app.routes.asset.process_history')
+def test_view_history_inlines_figure_json_not_plotly_js(mock_history, client):
+    import plotly.graph_objects as go
+    mock_history.return_value = {
+        'history': pd.DataFrame(),
+        'consolidate': pd.DataFrame(),
+        'figure': go.Figure(go.Scatter(x=[1], y=[2], name='</script>')),
+        'valid': True,
+    }
+    resp = client.get('/history/b3/PETR4')
+    html = resp.get_data(as_text=True)
+    assert resp.status_code == 200
+    assert 'id="historyFigure"' in html
+    assert 'data-chart-zoom-url="/api/chart/b3/PETR4/history?step=1"' in html
+    assert '/vendor/plotly.min.js' in html
+    # The trace name cannot close the inline JSON block.
+    assert html.count('</script>') == html.count('<script')
+    assert len(html) < 200_000
+
+
+@patch('app.routes.consolidate.process_portfolio_history')
+def test_view_portfolio_history(mock_history, client):
+    import plotly.graph_objects as go
+    mock_history.return_value = {
+        'history': pd.DataFrame({'date': pd.to_datetime(['2024-01-02']), 'nav': [50.0]}),
+        'figure': go.Figure(go.Scatter(x=[1], y=[2])),
+        'valid': True,
+    }
+    resp = client.get('/history/portfolio')
+    html = resp.get_data(as_text=True)
+    assert resp.status_code == 200
+    assert 'data-chart-zoom-url="/api/chart/portfolio/history"' in html
+
+
+@patch('app.routes.consolidate.process_portfolio_history')
+def test_view_portfolio_history_without_data(mock_history, client):
+    mock_history.return_value = {'history': pd.DataFrame(), 'figure': None, 'valid': False}
+    resp = client.get('/history/portfolio')
+    assert resp.status_code == 302
+
+
+@patch('app.routes.charts.process_portfolio_history')
+def test_api_chart_portfolio_history(mock_history, client):
+    mock_history.return_value = {'valid': True, 'figure': None}
+    resp = client.get('/api/chart/portfolio/history?start=2024-01-01')
+    assert resp.get_json() == {'figure': None}
+    mock_history.assert_called_once_with(max_points=HISTORY_CHART_POINTS,
+                                         start=date(2024, 1, 1), end=None)
+
+
+_UPLOAD_CSV = (
+    'Entrada/Saída,Data,Movimentação,Produto,Instituição,Quantidade,Preço unitário,Valor da Operação\n'
+    'Credito,15/01/2024,Compra,PETR4 - PETROBRAS,X,1,10,10\n'
+)
+
+
+def _remove_uploads():
+    """Delete the files saved for the ImportJobs of a test."""
+    from app import UPLOADS_FOLDER
+    from app.models import ImportJob
+    for job in ImportJob.query:
+        if os.path.exists(job.filepath):
+            os.remove(job.filepath)
+        folder = os.path.dirname(job.filepath)
+        if os.path.normpath(folder) != os.path.normpath(UPLOADS_FOLDER) and os.path.isdir(folder):
+            os.rmdir(folder)
+
+
+def _post_upload(client, filename, ajax=False, csv=_UPLOAD_CSV):
+    data = {
+        'filetype': 'B3 Movimentation',
+        'file': (io.BytesIO(csv.encode()), filename),
+    }
+    headers = {'X-Requested-With': 'XMLHttpRequest'} if ajax else {}
+    return client.post('/', data=data, headers=headers, content_type='multipart/form-data')
+
+
+def test_home_upload_imports_csv(client, db_session):
+    from app.models import ImportJob, Transaction
+    resp = _post_upload(client, 'route_upload_test.csv')
+    assert resp.status_code == 302
+    assert resp.headers['Location'].endswith('/b3_movimentation')
+    assert Transaction.query.filter_by(asset='PETR4').count() == 1
+    job = ImportJob.query.one()
+    assert (job.status, job.rows, job.added, job.duplicates) == ('done', 1, 1, 0)
+    _remove_uploads()
+
+
+def test_upload_import_job_runs_in_background(app, client, db_session, monkeypatch):
+    import time
+    from app.import_jobs import _get_executor
+    from app.models import Transaction
+    monkeypatch.setitem(app.config, 'WALLET_IMPORT_ASYNC', True)
+    refresh = MagicMock(return_value=0)
+    monkeypatch.setattr('app.import_jobs.update_portfolio_snapshots', refresh)
+    resp = _post_upload(client, 'route_upload_async_test.csv', ajax=True)
+    payload = resp.get_json()
+    assert payload['success'] and payload['job']['filename'] == 'route_upload_async_test.csv'
+
+    deadline = time.monotonic() + 10
+    while True:
+        status = client.get(payload['status_url']).get_json()
+        if status['finished'] or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert status['status'] == 'done'
+    assert (status['rows'], status['added'], status['duplicates']) == (1, 1, 0)
+    db_session.expire_all()
+    assert Transaction.query.filter_by(asset='PETR4').count() == 1
+    # The portfolio snapshots are refreshed on the worker after the import.
+    _get_executor().submit(lambda: None).result()
+    refresh.assert_called_once_with()
+    _remove_uploads()
+
+
+def test_portfolio_refresh_is_queued_once(app, client, db_session, monkeypatch):
+    import threading
+    from app.import_jobs import _get_executor, enqueue_portfolio_refresh
+    monkeypatch.setitem(app.config, 'WALLET_IMPORT_ASYNC', True)
+    refresh = MagicMock(return_value=0)
+    monkeypatch.setattr('app.import_jobs.update_portfolio_snapshots', refresh)
+
+    release = threading.Event()
+    busy = _get_executor().submit(release.wait, 10)
+    try:
+        with patch('app.routes.consolidate.process_portfolio_history') as mock_history:
+            mock_history.return_value = {'history': pd.DataFrame(), 'figure': None, 'valid': False}
+            client.get('/history/portfolio')
+            client.get('/history/portfolio')
+        # Views only read; the refresh waits on the worker.
+        refresh.assert_not_called()
+        assert enqueue_portfolio_refresh() is False
+    finally:
+        release.set()
+    busy.result()
+    _get_executor().submit(lambda: None).result()
+    refresh.assert_called_once_with()
+
+
+def test_api_import_status_unknown_job(client, db_session):
+    assert client.get('/api/import/999').status_code == 404
+
+
+def test_upload_batch_imports_every_file(app, client, db_session, monkeypatch):
+    from app.models import ImportJob, Transaction
+    monkeypatch.setitem(app.config, 'WALLET_IMPORT_PROCESSES', 0)
+    other = _UPLOAD_CSV.replace('PETR4 - PETROBRAS', 'VALE3 - VALE')
+    data = {
+        'filetype': 'B3 Movimentation',
+        'files': [(io.BytesIO(_UPLOAD_CSV.encode()), 'batch_upload_test.csv'),
+                  (io.BytesIO(other.encode()), 'batch_upload_test.csv')],
+    }
+    resp = client.post('/upload/batch', data=data, content_type='multipart/form-data')
+    payload = resp.get_json()
+    assert resp.status_code == 200 and payload['success']
+    assert len(payload['status_urls']) == 2
+    for url in payload['status_urls']:
+        assert client.get(url).get_json()['status'] == 'done'
+    assert {t.asset for t in Transaction.query} == {'PETR4', 'VALE3'}
+    assert ImportJob.query.count() == 2
+    # Same file name twice in one batch: each job keeps its own copy.
+    assert len({job.filepath for job in ImportJob.query}) == 2
+    _remove_uploads()
+
+
+def test_upload_batch_rejects_unknown_filetype(client, db_session):
+    data = {
+        'filetype': 'Bogus',
+        'files': [(io.BytesIO(_UPLOAD_CSV.encode()), 'batch_bogus.csv')],
+    }
+    resp = client.post('/upload/batch', data=data, content_type='multipart/form-data')
+    assert resp.status_code == 400
+    assert resp.get_json()['errors'] == ['Error! Failed to parse batch_bogus.csv.']
+
+
+def test_view_asset_sold_out_without_fundamentals(client, db_session):
+    from app.models import Transaction
+    for date, category, direction in (('2024-01-15', 'BUY', 'Credito'), ('2024-02-15', 'SELL', 'Debito')):
+        db_session.add(Transaction(
+            source='b3', record_type='negotiation', date=date, asset='PETR4', product='PETR4',
+            raw_label='Compra' if category == 'BUY' else 'Venda', category=category,
+            direction=direction, quantity=100, price=10.0, total=1000.0, currency='BRL',
+        ))
+    db_session.commit()
+    with patch('app.processing.prices.quote_service.info', side_effect=RuntimeError('offline')), \
+            patch('app.processing.get_online_info', side_effect=RuntimeError('offline')):
+        resp = client.get('/view/b3/PETR4')
+    assert resp.status_code == 200
+
+
+def test_same_name_uploads_queued_behind_busy_worker(app, client, db_session, monkeypatch):
+    import threading
+    import time
+    from app.import_jobs import _get_executor
+    from app.models import ImportJob, Transaction
+    monkeypatch.setitem(app.config, 'WALLET_IMPORT_ASYNC', True)
+    monkeypatch.setattr('app.import_jobs.update_portfolio_snapshots', MagicMock(return_value=0))
+
+    release = threading.Event()
+    busy = _get_executor().submit(release.wait, 10)
+    try:
+        urls = [
+            _post_upload(client, 'extrato.csv', ajax=True, csv=csv).get_json()['status_url']
+            for csv in (_UPLOAD_CSV, _UPLOAD_CSV.replace('PETR4 - PETROBRAS', 'VALE3 - VALE'))
+        ]
+    finally:
+        release.set()
+    busy.result()
+
+    deadline = time.monotonic() + 10
+    statuses = []
+    while time.monotonic() < deadline:
+        statuses = [client.get(url).get_json() for url in urls]
+        if all(status['finished'] for status in statuses):
+            break
+        time.sleep(0.05)
+    assert [(s['status'], s['added']) for s in statuses] == [('done', 1), ('done', 1)]
+    db_session.expire_all()
+    assert {t.asset for t in Transaction.query} == {'PETR4', 'VALE3'}
+    assert len({job.filepath for job in ImportJob.query}) == 2
+    _get_executor().submit(lambda: None).result()
+    _remove_uploads()
@@ -46,3 +46,39 @@ def test_get_yfinance_data():
     assert out['previous_close'] == 13.0
     assert out['currency'] == 'USD'
     assert out['asset_class'] == 'EQUITY'
+
+
+def test_quote_service_prefetch_batches_download():
+    index = pd.date_range('2024-01-01', periods=3)
+    columns = pd.MultiIndex.from_product([['PETR4.SA', 'AAPL'], ['Open', 'Close']])
+    fake = pd.DataFrame([
+        [1.0, 10.0, 1.0, 100.0],
+        [1.0, 11.0, 1.0, float('nan')],   # US holiday
+        [1.0, 12.0, 1.0, 110.0],
+    ], index=index, columns=columns)
+    service = scraping.QuoteService()
+    with patch.object(scraping.yf, 'download', return_value=fake) as mock_download, \
+            patch.object(scraping.yf, 'Ticker') as mock_ticker:
+        assert service.prefetch(['PETR4.SA', 'AAPL', 'PETR4.SA']) == 2
+        # Already priced: no second download.
+        assert service.prefetch(['AAPL']) == 0
+        petr = service.quote('PETR4.SA')
+        aapl = service.quote('AAPL')
+    mock_download.assert_called_once()
+    assert sorted(mock_download.call_args[0][0]) == ['AAPL', 'PETR4.SA']
+    mock_ticker.assert_not_called()
+    assert petr['last_close_price'] == 12.0
+    assert petr['previous_close'] == 11.0
+    assert aapl['previous_close'] == 100.0
+    assert aapl['last_close_variation'] == 10.0
+
+
+def test_get_yfinance_data_without_info_skips_fundamentals():
+    service = scraping.QuoteService()
+    service._store(service._quotes, 'X.SA', {'last_close_price': 5.0})
+    with patch.object(scraping, 'quote_service', service), \
+            patch.object(scraping.yf, 'Ticker') as mock_ticker:
+        out = scraping.get_yfinance_data('X.SA', with_info=False)
+    mock_ticker.assert_not_called()
+    assert out['last_close_price'] == 5.0
+    assert out['info'] == {}
@@ -1,14 +1,25 @@
 #!/usr/bin/python3
 
 from app import app, db
-from app.models import seed_default_cache_config
-from app.migrate_to_transaction import migrate_legacy_to_transaction
+from app.models import backfill_asset_aliases, seed_default_cache_config
+from app.import_jobs import fail_interrupted_import_jobs
+from app.migrate_to_transaction import (
+    add_transaction_fingerprint_column,
+    backfill_transaction_fingerprints,
+    migrate_legacy_to_transaction,
+)
+from app.processing import refresh_position_snapshots
 from app.utils.scraping import rebuild_request_cache
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        add_transaction_fingerprint_column()
         migrate_legacy_to_transaction()
+        backfill_transaction_fingerprints()
+        backfill_asset_aliases()
+        refresh_position_snapshots()
         seed_default_cache_config()
+        fail_interrupted_import_jobs()
         rebuild_request_cache()
     app.run(debug=True, port=5100)